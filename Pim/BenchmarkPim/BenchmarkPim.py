@@ -0,0 +1,349 @@
+import socket
+import json
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import threading
+import subprocess
+
+SERVIDOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ServidorPim", "ServidorPim.py")
+sys.path.insert(0, os.path.dirname(os.path.abspath(SERVIDOR)))
+from ServidorPim import hash_senha
+
+HOST = "127.0.0.1"
+PORTA = 5060
+TAM_CABECALHO = 10
+SENHA = "benchmark"
+TEMPO_INICIO = 120
+INTERVALO_TRABALHO = 0.02
+
+# Peso de cada ação na mistura simulada de um professor usando o cliente.
+MISTURA = (
+    ("listar_alunos", 12),
+    ("listar_turmas", 8),
+    ("listar_atividades", 8),
+    ("ver_alunos_da_turma", 10),
+    ("ver_atividades_da_turma", 8),
+    ("ver_notas_atividade", 10),
+    ("adicionar_nota", 20),
+    ("buscar_aluno", 6),
+    ("mudancas_desde", 6),
+    ("estatisticas_turma", 5),
+    ("estatisticas_aluno", 3),
+    ("relatorio_medias", 2),
+    ("login_professor", 1),
+    ("gerar_relatorio_pdf", 1),
+)
+
+NOMES = ("Ana", "Bruno", "Carla", "Daniel", "Eduarda", "Felipe", "Gabriela", "Henrique", "Isabela", "João",
+         "Larissa", "Marcos", "Natália", "Otávio", "Paula", "Rafael", "Sofia", "Tiago", "Vitória", "Yuri")
+SOBRENOMES = ("Silva", "Santos", "Oliveira", "Souza", "Pereira", "Costa", "Rodrigues", "Almeida", "Nascimento",
+              "Lima", "Araújo", "Fernandes", "Carvalho", "Gomes", "Martins", "Rocha", "Ribeiro", "Conceição")
+DISCIPLINAS = ("Engenharia de Software", "Redes de Computadores", "Banco de Dados", "Estruturas de Dados",
+               "Sistemas Operacionais", "Cálculo", "Estatística", "Programação Web", "Inteligência Artificial")
+TIPOS_ATIVIDADE = ("Prova", "Trabalho", "Lista de Exercícios", "Seminário", "Projeto")
+
+def gerar_dados(pasta, n_professores, n_alunos, n_turmas, alunos_por_turma, atividades_por_turma, fracao_notas, semente):
+    rnd = random.Random(semente)
+    senha = hash_senha(SENHA)
+    professores = [{"id": i, "nome": f"{rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)}", "matricula": f"P{i:04d}", "senha": senha}
+                   for i in range(1, n_professores + 1)]
+    alunos = [{"id": i, "nome": f"{rnd.choice(NOMES)} {rnd.choice(SOBRENOMES)} {rnd.choice(SOBRENOMES)}", "matricula": f"A{i:06d}"}
+              for i in range(1, n_alunos + 1)]
+    turmas, atividades = [], []
+    for t in range(1, n_turmas + 1):
+        membros = sorted(rnd.sample(range(1, n_alunos + 1), min(alunos_por_turma, n_alunos)))
+        turma = {"id": t, "nome": f"{rnd.choice(DISCIPLINAS)} {t}", "alunos": membros, "atividades": []}
+        for _ in range(atividades_por_turma):
+            aid = len(atividades) + 1
+            notas = {str(a): round(rnd.uniform(0, 10), 1) for a in membros if rnd.random() < fracao_notas}
+            atividades.append({"id": aid, "nome": f"{rnd.choice(TIPOS_ATIVIDADE)} {aid}", "descricao": "Gerada pelo benchmark.",
+                               "turma_id": t, "notas": notas})
+            turma["atividades"].append(aid)
+        turmas.append(turma)
+    for arquivo, dados in (("professores.json", professores), ("alunos.json", alunos),
+                           ("turmas.json", turmas), ("atividades.json", atividades)):
+        with open(os.path.join(pasta, arquivo), "w", encoding="utf-8") as f:
+            json.dump(dados, f, ensure_ascii=False)
+    return {"professores": professores, "alunos": alunos, "turmas": turmas, "atividades": atividades}
+
+def enquadrar(comando):
+    comando_bytes = comando.encode("utf-8")
+    return f"{len(comando_bytes):<{TAM_CABECALHO}}".encode("utf-8") + comando_bytes
+
+def receber_exato(sock, tamanho):
+    dados = bytearray()
+    while len(dados) < tamanho:
+        parte = sock.recv(min(tamanho - len(dados), 65536))
+        if not parte:
+            raise ConnectionError("servidor desconectou")
+        dados += parte
+    return bytes(dados)
+
+def requisitar(sock, comando):
+    sock.sendall(enquadrar(comando))
+    tamanho = int(receber_exato(sock, TAM_CABECALHO).decode("utf-8").strip())
+    return receber_exato(sock, tamanho)
+
+def processos_da_arvore(pid):
+    pids = [pid]
+    for atual in pids:
+        try:
+            with open(f"/proc/{atual}/task/{atual}/children", encoding="utf-8") as f:
+                pids += [int(filho) for filho in f.read().split()]
+        except OSError:
+            pass
+    return pids
+
+def memoria_kb(pid):
+    rss = pico = 0
+    try:
+        for atual in processos_da_arvore(pid):
+            with open(f"/proc/{atual}/status", encoding="utf-8") as f:
+                campos = dict(linha.split(":", 1) for linha in f if ":" in linha)
+            rss += int(campos["VmRSS"].split()[0])
+            pico += int(campos["VmHWM"].split()[0])
+    except (OSError, KeyError, ValueError):
+        return None, None
+    return rss, pico
+
+def sockets_escutando(porta):
+    total = 0
+    for arquivo in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(arquivo, encoding="ascii") as f:
+                next(f)
+                for linha in f:
+                    local, estado = linha.split()[1], linha.split()[3]
+                    if estado == "0A" and int(local.rsplit(":", 1)[1], 16) == porta:
+                        total += 1
+        except (OSError, StopIteration, ValueError, IndexError):
+            return None
+    return total
+
+def iniciar_servidor(pasta, porta, modo, leitores, saida):
+    comando = [sys.executable, os.path.abspath(SERVIDOR), "--porta", str(porta), "--modo", modo, "--leitores", str(leitores)]
+    inicio = time.perf_counter()
+    processo = subprocess.Popen(comando, cwd=pasta, stdout=saida, stderr=subprocess.STDOUT)
+    while time.perf_counter() - inicio < TEMPO_INICIO:
+        if processo.poll() is not None:
+            raise RuntimeError(f"servidor terminou durante a inicialização (código {processo.returncode})")
+        try:
+            socket.create_connection((HOST, porta), timeout=0.5).close()
+            escutando = sockets_escutando(porta) if leitores > 0 else None
+            if escutando is None or escutando >= leitores:
+                return processo, time.perf_counter() - inicio
+        except OSError:
+            pass
+        time.sleep(0.05)
+    processo.kill()
+    raise RuntimeError("servidor não abriu a porta a tempo")
+
+def montar_comando(acao, rnd, dados, versoes):
+    turma = rnd.choice(dados["turmas"])
+    if acao == "login_professor":
+        return f"login_professor;{rnd.choice(dados['professores'])['matricula']};{SENHA}"
+    if acao in ("ver_alunos_da_turma", "ver_atividades_da_turma", "estatisticas_turma"):
+        return f"{acao};{turma['id']}"
+    if acao == "gerar_relatorio_pdf":
+        return f"gerar_relatorio_pdf;{turma['id']}"
+    if acao == "estatisticas_aluno":
+        return f"estatisticas_aluno;{rnd.choice(dados['alunos'])['id']}"
+    if acao == "buscar_aluno":
+        return f"buscar_aluno;{rnd.choice(dados['alunos'])['nome'].split()[rnd.randrange(2)][:4]}"
+    if acao == "mudancas_desde":
+        colecao = rnd.choice(("alunos", "turmas", "atividades"))
+        return f"mudancas_desde;{colecao};{versoes.get(colecao, 0)}"
+    if acao in ("ver_notas_atividade", "adicionar_nota"):
+        if not turma["atividades"] or not turma["alunos"]:
+            return "listar_turmas"
+        atividade = rnd.choice(turma["atividades"])
+        if acao == "ver_notas_atividade":
+            return f"ver_notas_atividade;{atividade}"
+        return f"adicionar_nota;{atividade};{rnd.choice(turma['alunos'])};{round(rnd.uniform(0, 10), 1)}"
+    return acao
+
+def aguardar_trabalho(sock, resposta):
+    trabalho = json.loads(resposta)
+    while trabalho.get("status") == "executando":
+        time.sleep(INTERVALO_TRABALHO)
+        resposta = requisitar(sock, f"status_trabalho;{trabalho['id']}")
+        trabalho = json.loads(resposta)
+    return resposta, trabalho.get("status") == "concluido"
+
+def cliente(indice, porta, dados, semente, fim_aquecimento, fim, resultados, falhas):
+    rnd = random.Random(semente * 1000 + indice)
+    acoes = [a for a, _ in MISTURA]
+    pesos = [p for _, p in MISTURA]
+    latencias, erros, recebidos, versoes = {}, {}, 0, {}
+    try:
+        with socket.create_connection((HOST, porta)) as sock:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            prof = dados["professores"][indice % len(dados["professores"])]
+            resposta = requisitar(sock, f"login_professor;{prof['matricula']};{SENHA}").decode("utf-8")
+            if not resposta.startswith("SUCESSO_LOGIN"):
+                raise RuntimeError(f"login recusado: {resposta}")
+            while True:
+                agora = time.perf_counter()
+                if agora >= fim:
+                    break
+                acao = rnd.choices(acoes, pesos)[0]
+                comando = montar_comando(acao, rnd, dados, versoes)
+                inicio = time.perf_counter()
+                resposta = requisitar(sock, comando)
+                concluido = True
+                if acao == "gerar_relatorio_pdf" and resposta.startswith(b"{"):
+                    resposta, concluido = aguardar_trabalho(sock, resposta)
+                duracao = time.perf_counter() - inicio
+                if acao == "mudancas_desde" and resposta.startswith(b"{"):
+                    delta = json.loads(resposta)
+                    versoes[delta["colecao"]] = delta["versao"]
+                if inicio < fim_aquecimento:
+                    continue
+                latencias.setdefault(acao, []).append(duracao)
+                recebidos += len(resposta)
+                if not concluido or resposta.startswith("❌".encode("utf-8")) or resposta.startswith(b"NECESSARIO_LOGIN"):
+                    erros[acao] = erros.get(acao, 0) + 1
+    except Exception as e:
+        falhas.append(f"cliente {indice}: {e}")
+    resultados.append((latencias, erros, recebidos))
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+def resumir(valores):
+    valores = sorted(valores)
+    return {"n": len(valores), "p50_ms": percentil(valores, 50) * 1000, "p99_ms": percentil(valores, 99) * 1000,
+            "max_ms": (valores[-1] if valores else 0.0) * 1000}
+
+def executar(args):
+    pasta = tempfile.mkdtemp(prefix="pim_bench_")
+    try:
+        print(f">> Gerando dados em '{pasta}'...")
+        dados = gerar_dados(pasta, args.professores, args.alunos, args.turmas, args.alunos_por_turma,
+                            args.atividades_por_turma, args.fracao_notas, args.semente)
+        print(f">> {len(dados['professores'])} professores, {len(dados['alunos'])} alunos, {len(dados['turmas'])} turmas, "
+              f"{len(dados['atividades'])} atividades, {sum(len(a['notas']) for a in dados['atividades'])} notas.")
+        with open(os.path.join(pasta, "servidor.log"), "wb") as log:
+            processo, inicializacao = iniciar_servidor(pasta, args.porta, args.modo, args.leitores, log)
+            try:
+                rss_inicial, _ = memoria_kb(processo.pid)
+                print(f">> Servidor pronto em {inicializacao:.2f}s. Rodando {args.clientes} cliente(s) por {args.duracao}s "
+                      f"(+{args.aquecimento}s de aquecimento)...")
+                resultados, falhas = [], []
+                fim_aquecimento = time.perf_counter() + args.aquecimento
+                fim = fim_aquecimento + args.duracao
+                threads = [threading.Thread(target=cliente, args=(i, args.porta, dados, args.semente, fim_aquecimento, fim, resultados, falhas))
+                           for i in range(args.clientes)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                rss_final, rss_pico = memoria_kb(processo.pid)
+            finally:
+                processo.terminate()
+                try:
+                    processo.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    processo.kill()
+        por_acao, erros, recebidos = {}, {}, 0
+        for latencias, errs, total in resultados:
+            for acao, valores in latencias.items():
+                por_acao.setdefault(acao, []).extend(valores)
+            for acao, n in errs.items():
+                erros[acao] = erros.get(acao, 0) + n
+            recebidos += total
+        todas = [v for valores in por_acao.values() for v in valores]
+        relatorio = {
+            "parametros": {k: v for k, v in vars(args).items() if k not in ("saida", "comparar")},
+            "inicializacao_s": inicializacao,
+            "operacoes": len(todas),
+            "vazao_ops": len(todas) / args.duracao,
+            "bytes_recebidos": recebidos,
+            "geral": resumir(todas),
+            "acoes": {acao: dict(resumir(valores), erros=erros.get(acao, 0)) for acao, valores in sorted(por_acao.items())},
+            "memoria_kb": {"inicial": rss_inicial, "final": rss_final, "pico": rss_pico},
+            "falhas": falhas,
+        }
+        return relatorio
+    finally:
+        if not args.manter:
+            shutil.rmtree(pasta, ignore_errors=True)
+        else:
+            print(f">> Dados e log do servidor mantidos em '{pasta}'.")
+
+def imprimir_relatorio(relatorio):
+    print("\n" + "-" * 78)
+    print(f"{'Ação':<26}{'ops':>8}{'erros':>7}{'p50 ms':>11}{'p99 ms':>11}{'máx ms':>11}")
+    print("-" * 78)
+    for acao, r in relatorio["acoes"].items():
+        print(f"{acao:<26}{r['n']:>8}{r['erros']:>7}{r['p50_ms']:>11.2f}{r['p99_ms']:>11.2f}{r['max_ms']:>11.2f}")
+    g = relatorio["geral"]
+    print("-" * 78)
+    print(f"{'TOTAL':<26}{g['n']:>8}{sum(r['erros'] for r in relatorio['acoes'].values()):>7}"
+          f"{g['p50_ms']:>11.2f}{g['p99_ms']:>11.2f}{g['max_ms']:>11.2f}")
+    m = relatorio["memoria_kb"]
+    print(f"\nVazão: {relatorio['vazao_ops']:.1f} ops/s | Recebido: {relatorio['bytes_recebidos'] / 1e6:.1f} MB | "
+          f"Inicialização: {relatorio['inicializacao_s']:.2f}s")
+    if m["final"] is not None:
+        print(f"Memória do servidor (RSS): inicial {m['inicial'] / 1024:.1f} MB | final {m['final'] / 1024:.1f} MB | "
+              f"pico {m['pico'] / 1024:.1f} MB")
+    else:
+        print("Memória do servidor: indisponível nesta plataforma.")
+    for falha in relatorio["falhas"]:
+        print(f"❌ {falha}")
+
+def comparar(relatorio, anterior):
+    def variacao(novo, velho):
+        return f"{(novo - velho) / velho * 100:+.1f}%" if velho else "n/d"
+    print("\nComparação com a execução anterior:")
+    g, h = relatorio["geral"], anterior["geral"]
+    print(f"  vazão {anterior['vazao_ops']:.1f} -> {relatorio['vazao_ops']:.1f} ops/s ({variacao(relatorio['vazao_ops'], anterior['vazao_ops'])})")
+    print(f"  p50 {h['p50_ms']:.2f} -> {g['p50_ms']:.2f} ms ({variacao(g['p50_ms'], h['p50_ms'])})")
+    print(f"  p99 {h['p99_ms']:.2f} -> {g['p99_ms']:.2f} ms ({variacao(g['p99_ms'], h['p99_ms'])})")
+    pico, pico_anterior = relatorio["memoria_kb"]["pico"], anterior["memoria_kb"]["pico"]
+    if pico and pico_anterior:
+        print(f"  pico RSS {pico_anterior / 1024:.1f} -> {pico / 1024:.1f} MB ({variacao(pico, pico_anterior)})")
+    for acao, r in relatorio["acoes"].items():
+        a = anterior["acoes"].get(acao)
+        if a:
+            print(f"  {acao:<24} p99 {a['p99_ms']:.2f} -> {r['p99_ms']:.2f} ms ({variacao(r['p99_ms'], a['p99_ms'])})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de carga e benchmark do servidor PIM.")
+    parser.add_argument("--professores", type=int, default=20)
+    parser.add_argument("--alunos", type=int, default=2000)
+    parser.add_argument("--turmas", type=int, default=60)
+    parser.add_argument("--alunos-por-turma", type=int, default=40)
+    parser.add_argument("--atividades-por-turma", type=int, default=6)
+    parser.add_argument("--fracao-notas", type=float, default=0.7, help="fração das notas já lançadas no início")
+    parser.add_argument("--clientes", type=int, default=16, help="clientes simultâneos")
+    parser.add_argument("--duracao", type=float, default=20, help="segundos medidos")
+    parser.add_argument("--aquecimento", type=float, default=3, help="segundos iniciais descartados")
+    parser.add_argument("--modo", choices=("threads", "async"), default="threads")
+    parser.add_argument("--leitores", type=int, default=0,
+                        help="sobe o servidor com --leitores N (processos leitores); a memória soma todos os processos")
+    parser.add_argument("--porta", type=int, default=PORTA)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", help="grava o resultado em JSON para comparar com versões futuras")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--manter", action="store_true", help="não apaga a pasta com os dados e o log do servidor")
+    args = parser.parse_args()
+    relatorio = executar(args)
+    imprimir_relatorio(relatorio)
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            comparar(relatorio, json.load(f))
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=4)
+        print(f"\nResultado gravado em '{args.saida}'.")
+
+if __name__ == "__main__":
+    main()
@@ -2,26 +2,90 @@ import socket
 import getpass
 import json
 import sys
+import time
+import csv
+import io
+import itertools
+import threading
+import queue
 
 HOST_SERVIDOR = '0.0.0.0'
-PORTA_SERVIDOR = 50007
+PORTA_SERVIDOR = 5050
+TAM_CABECALHO = 10
+INTERVALO_STATUS = 1
+PAGINA_CLIENTE = 20
+LINHAS_POR_LOTE = 1000
+MAX_ERROS_EXIBIDOS = 20
+COLECOES_ASSINADAS = ["alunos", "turmas", "atividades"]
+DEPENDENTES = {"turmas": ("atividades",)}
 
-def enviar_comando(sock, comando):
+receptores = {}
+avisos_servidor = {}
+
+def enquadrar(comando):
+    comando_bytes = comando.encode('utf-8')
+    return f"{len(comando_bytes):<{TAM_CABECALHO}}".encode('utf-8') + comando_bytes
+
+def receber_exato(sock, tamanho):
+    dados_recebidos = bytearray()
+    while len(dados_recebidos) < tamanho:
+        parte = sock.recv(min(tamanho - len(dados_recebidos), 65536))
+        if not parte:
+            return None
+        dados_recebidos += parte
+    return bytes(dados_recebidos)
+
+def ler_quadro(sock):
+    tamanho_bytes = receber_exato(sock, TAM_CABECALHO)
+    if not tamanho_bytes:
+        return "❌ ERRO: Servidor desconectou (cabeçalho)."
+    tamanho_msg = int(tamanho_bytes.decode('utf-8').strip())
+    dados_recebidos = receber_exato(sock, tamanho_msg)
+    if dados_recebidos is None:
+        return "❌ ERRO: Servidor desconectou (dados)."
+    return dados_recebidos.decode('utf-8')
+
+def receber_resposta(sock):
+    respostas = receptores.get(sock)
+    if respostas is not None:
+        return respostas.get()
+    resposta = ler_quadro(sock)
+    while resposta.startswith("EVENTO "):
+        registrar_eventos(resposta)
+        resposta = ler_quadro(sock)
+    return resposta
+
+def registrar_eventos(quadro):
+    for evento in json.loads(quadro[len("EVENTO "):]):
+        for chave in (evento['colecao'],) + DEPENDENTES.get(evento['colecao'], ()):
+            if evento['versao'] > avisos_servidor.get(chave, 0):
+                avisos_servidor[chave] = evento['versao']
+
+def receber_continuamente(sock, respostas):
+    while True:
+        try:
+            resposta = ler_quadro(sock)
+        except OSError as e:
+            resposta = f"❌ ERRO: Servidor desconectou ({e})."
+        if resposta.startswith("EVENTO "):
+            registrar_eventos(resposta)
+            continue
+        respostas.put(resposta)
+        if resposta.startswith("❌ ERRO: Servidor desconectou"):
+            receptores.pop(sock, None)
+            return
+
+def assinar_eventos(sock, colecoes):
+    resposta = enviar_comando(sock, json.dumps({"acao": "assinar", "colecoes": colecoes}))
+    if not resposta.startswith('{') or sock in receptores:
+        return
+    receptores[sock] = respostas = queue.Queue()
+    threading.Thread(target=receber_continuamente, args=(sock, respostas), daemon=True).start()
+
+def enviar_comandos(sock, comandos):
     try:
-        comando_bytes = comando.encode('utf-8')
-        tamanho = f"{len(comando_bytes):<10}"
-        sock.sendall(tamanho.encode('utf-8') + comando_bytes)
-        tamanho_bytes = sock.recv(10)
-        if not tamanho_bytes:
-            return "❌ ERRO: Servidor desconectou (cabeçalho)."
-        tamanho_msg = int(tamanho_bytes.decode('utf-8').strip())
-        dados_recebidos = b""
-        while len(dados_recebidos) < tamanho_msg:
-            parte = sock.recv(min(tamanho_msg - len(dados_recebidos), 4096))
-            if not parte:
-                return "❌ ERRO: Servidor desconectou (dados)."
-            dados_recebidos += parte
-        return dados_recebidos.decode('utf-8')
+        sock.sendall(b"".join(enquadrar(c) for c in comandos))
+        return [receber_resposta(sock) for _ in comandos]
     except ConnectionResetError:
         print("\n❌ ERRO FATAL: A conexão com o servidor foi perdida.")
         sys.exit()
@@ -29,6 +93,9 @@ def enviar_comando(sock, comando):
         print(f"\n❌ ERRO de comunicação: {e}")
         sys.exit()
 
+def enviar_comando(sock, comando):
+    return enviar_comandos(sock, [comando])[0]
+
 def imprimir_resposta(resposta_str, cache_key=None, cache_ref=None):
     print("\n<<< Resposta do Servidor >>>")
     try:
@@ -94,37 +161,93 @@ def confirma(prompt="Confirmar? (s/n): "):
     r = input(prompt).strip().lower()
     return r in ("s", "y")
 
-def buscar_e_listar(sock, cache_ref, cache_key, comando_lista):
-    print(f"\nBuscando lista de '{cache_key}' no servidor...")
-    resposta_lista = enviar_comando(sock, comando_lista)
-    print("\n" + linha(70))
+def sincronizar_cache(sock, cache_ref, cache_key, comando_lista):
+    versoes = cache_ref.setdefault('_versoes', {})
+    desatualizados = cache_ref.setdefault('_desatualizados', set())
+    if sock in receptores and cache_key in cache_ref and cache_key in versoes \
+            and cache_key not in desatualizados \
+            and avisos_servidor.get(cache_key, 0) <= versoes[cache_key]:
+        return None
+    versao = versoes.get(cache_key, 0) if cache_key in cache_ref else 0
+    resposta = enviar_comando(sock, f"mudancas_desde;{cache_key};{versao}")
     try:
-        if resposta_lista.startswith('[') and resposta_lista.endswith(']'):
-            dados = json.loads(resposta_lista)
-            if not dados:
-                print(f"Nenhum {cache_key} encontrado.")
-                cache_ref[cache_key] = {}
-                return False
-            cache_ref[cache_key] = {item.get('id'): item for item in dados}
-            header(cache_key.upper())
-            for item in dados:
-                id_str = str(item.get('id', ''))
-                mat_str = item.get('matricula', '')
-                nome_str = item.get('nome', 'N/D')
-                if mat_str:
-                    print(f"{id_str.ljust(3)} - {mat_str.ljust(10)} - {nome_str}")
-                else:
-                    alunos_count = item.get('alunos', 0)
-                    atv_count = item.get('atividades', 0)
-                    print(f"{id_str.ljust(3)} - {nome_str.ljust(15)} (Alunos: {alunos_count}, Atividades: {atv_count})")
-            print(linha(70))
-            return True
-        else:
-            print(resposta_lista)
-            return False
+        delta = json.loads(resposta) if resposta.startswith('{') else None
     except json.JSONDecodeError:
-        print(f"ERRO: Resposta inesperada do servidor:\n{resposta_lista}")
+        delta = None
+    if delta is None:
+        resposta = enviar_comando(sock, comando_lista)
+        dados = ler_lista(resposta)
+        if dados is None:
+            return resposta
+        cache_ref[cache_key] = {item.get('id'): item for item in dados}
+        versoes.pop(cache_key, None)
+        desatualizados.discard(cache_key)
+        return None
+    itens = {} if delta['completo'] else cache_ref.get(cache_key, {})
+    for rid in delta['removidos']:
+        itens.pop(rid, None)
+    for item in delta['inseridos'] + delta['atualizados']:
+        itens[item.get('id')] = item
+    cache_ref[cache_key] = itens
+    versoes[cache_key] = delta['versao']
+    desatualizados.discard(cache_key)
+    return None
+
+def marcar_desatualizado(cache_ref, *cache_keys):
+    cache_ref.setdefault('_desatualizados', set()).update(cache_keys)
+
+def buscar_e_listar(sock, cache_ref, cache_key, comando_lista):
+    print(f"\nSincronizando lista de '{cache_key}' com o servidor...")
+    erro = sincronizar_cache(sock, cache_ref, cache_key, comando_lista)
+    print("\n" + linha(70))
+    if erro is not None:
+        print(erro)
+        return False
+    dados = [cache_ref[cache_key][rid] for rid in sorted(cache_ref[cache_key])]
+    if not dados:
+        print(f"Nenhum {cache_key} encontrado.")
         return False
+    header(cache_key.upper())
+    for i, item in enumerate(dados, start=1):
+        print(formatar_item(item))
+        if i % PAGINA_CLIENTE == 0 and i < len(dados) and not continuar_listagem(i, len(dados)):
+            break
+    print(linha(70))
+    return True
+
+def formatar_item(item):
+    id_str = str(item.get('id', ''))
+    mat_str = item.get('matricula', '')
+    nome_str = item.get('nome', 'N/D')
+    if mat_str:
+        return f"{id_str.ljust(3)} - {mat_str.ljust(10)} - {nome_str}"
+    if 'turma_nome' in item:
+        return f"{id_str.ljust(3)} - {nome_str.ljust(30)} (Turma: {item['turma_nome']})"
+    return f"{id_str.ljust(3)} - {nome_str.ljust(15)} (Alunos: {item.get('alunos', 0)}, Atividades: {item.get('atividades', 0)})"
+
+def continuar_listagem(exibidos, total):
+    return input(f"-- {exibidos} de {total} -- Enter para mais, 0 para parar: ").strip() != "0"
+
+def listar_paginado(sock, titulo, pedido):
+    pedido = dict(pedido, limit=PAGINA_CLIENTE)
+    primeira = True
+    while True:
+        resposta = enviar_comando(sock, json.dumps(pedido))
+        if not resposta.startswith('{'):
+            imprimir_resposta(resposta)
+            return
+        pagina = json.loads(resposta)
+        if primeira:
+            header(titulo)
+            if not pagina['itens']:
+                print("(Nenhum item encontrado)")
+            primeira = False
+        for item in pagina['itens']:
+            print(formatar_item(item))
+        if not pagina['proximo_cursor'] or not continuar_listagem(pagina['offset'] + len(pagina['itens']), pagina['total']):
+            break
+        pedido['cursor'] = pagina['proximo_cursor']
+    print(linha(70))
 
 def obter_item_cacheado(cache_ref, cache_key, item_id_str):
     try:
@@ -135,10 +258,213 @@ def obter_item_cacheado(cache_ref, cache_key, item_id_str):
         pass
     return None
 
-def invalidar_cache(cache_ref, cache_key):
-    if cache_key in cache_ref:
-        del cache_ref[cache_key]
-        print(f"(Cache de '{cache_key}' invalidado.)")
+def ler_lista(resposta_str):
+    if resposta_str.startswith('[') and resposta_str.endswith(']'):
+        try:
+            return json.loads(resposta_str)
+        except json.JSONDecodeError:
+            pass
+    return None
+
+def lancar_notas_turma(sock, atividade):
+    resposta = enviar_comando(sock, f"ver_alunos_da_turma;{atividade.get('turma_id', '')}")
+    alunos_turma = ler_lista(resposta)
+    if not alunos_turma:
+        imprimir_resposta(resposta)
+        return
+    header(f"NOTAS EM LOTE - {atividade['nome']}")
+    print("Digite a nota de cada aluno (Enter para pular).")
+    notas = {}
+    for aluno in alunos_turma:
+        nota = input_float(f"{aluno['matricula'].ljust(10)} - {aluno['nome']}: ", 0, 10, allow_empty=True)
+        if nota is not None:
+            notas[str(aluno['id'])] = nota
+    if not notas:
+        print("Nenhuma nota informada.")
+        return
+    if not confirma(f"Enviar {len(notas)} nota(s)? (s/n): "):
+        return
+    comando = json.dumps({"acao": "adicionar_notas_lote", "atividade_id": atividade['id'], "notas": notas})
+    resposta = enviar_comando(sock, comando)
+    try:
+        resultado = json.loads(resposta)
+    except json.JSONDecodeError:
+        imprimir_resposta(resposta)
+        return
+    nomes = {str(a['id']): a['nome'] for a in alunos_turma}
+    print("\n<<< Resposta do Servidor >>>")
+    for r in resultado.get("resultados", []):
+        print(f"{'✅' if r['ok'] else '❌'} {nomes.get(str(r['aluno_id']), r['aluno_id'])}: {r['mensagem']}")
+    if resultado.get("ok"):
+        print(f"✅ {resultado['aplicadas']} nota(s) registrada(s).")
+    else:
+        print("❌ Nenhuma nota foi registrada. Corrija os erros e tente novamente.")
+    print("<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<")
+
+def relatorio_texto_turma(sock, turma):
+    resp_alunos, resp_atv = enviar_comandos(sock, [f"ver_alunos_da_turma;{turma['id']}", f"ver_atividades_da_turma;{turma['id']}"])
+    alunos_turma = ler_lista(resp_alunos) or []
+    atividades_turma = ler_lista(resp_atv) or []
+    respostas_notas = enviar_comandos(sock, [f"ver_notas_atividade;{atv['id']}" for atv in atividades_turma])
+    header(f"RELATÓRIO DA TURMA: {turma['nome']}")
+    print("Alunos:")
+    for a in alunos_turma:
+        print(f"  {a['matricula'].ljust(10)} - {a['nome']}")
+    if not alunos_turma:
+        print("  (nenhum aluno matriculado)")
+    print("\nAtividades:")
+    for atv, resp in zip(atividades_turma, respostas_notas):
+        print(f"  {atv['nome']}")
+        notas = ler_lista(resp)
+        for n in notas or []:
+            print(f"    {n['nome']}: {n['nota']}")
+        if not notas:
+            print(f"    {resp}")
+    if not atividades_turma:
+        print("  (nenhuma atividade cadastrada)")
+    print(linha(70))
+
+def fmt_nota(valor):
+    return "-" if valor is None else f"{valor:.2f}"
+
+def mostrar_medias_turmas(sock):
+    resposta = enviar_comando(sock, "relatorio_medias")
+    dados = ler_lista(resposta)
+    if dados is None:
+        imprimir_resposta(resposta)
+        return
+    header("MÉDIAS POR TURMA")
+    print(f"{'Turma'.ljust(30)} {'Alunos':>6} {'Notas':>6} {'Média':>6} {'Mín':>6} {'Máx':>6} {'Mediana':>7}")
+    for t in dados:
+        print(f"{t['nome'][:30].ljust(30)} {t['alunos']:>6} {t['n_notas']:>6} {fmt_nota(t['media']):>6} "
+              f"{fmt_nota(t['minimo']):>6} {fmt_nota(t['maximo']):>6} {fmt_nota(t['mediana']):>7}")
+    if not dados:
+        print("(nenhuma turma cadastrada)")
+    print(linha(70))
+
+def mostrar_melhor_pior(sock):
+    resposta = enviar_comando(sock, "melhor_pior_aluno")
+    dados = ler_lista(resposta)
+    if dados is None:
+        imprimir_resposta(resposta)
+        return
+    header("MELHOR E PIOR ALUNO POR TURMA")
+    for t in dados:
+        print(f"{t['nome']}:")
+        if not t['melhor']:
+            print("  (sem notas lançadas)")
+            continue
+        print(f"  🏆 Melhor: {t['melhor']['nome']} (média {fmt_nota(t['melhor']['media'])})")
+        print(f"  ⚠️  Pior:   {t['pior']['nome']} (média {fmt_nota(t['pior']['media'])})")
+    print(linha(70))
+
+def acompanhar_trabalho(sock, resposta):
+    try:
+        trabalho = json.loads(resposta) if resposta.startswith('{') else None
+    except json.JSONDecodeError:
+        trabalho = None
+    if trabalho is None:
+        imprimir_resposta(resposta)
+        return
+    print(f"Trabalho {trabalho['id']} iniciado no servidor ({trabalho['total']} PDF(s)). Ctrl+C para voltar ao menu.")
+    try:
+        while trabalho['status'] == "executando":
+            print(f"\r  Gerando... {trabalho['concluidos']}/{trabalho['total']}", end="", flush=True)
+            time.sleep(INTERVALO_STATUS)
+            resposta = enviar_comando(sock, f"status_trabalho;{trabalho['id']}")
+            if not resposta.startswith('{'):
+                print()
+                imprimir_resposta(resposta)
+                return
+            trabalho = json.loads(resposta)
+    except KeyboardInterrupt:
+        print(f"\n⚠️ O trabalho {trabalho['id']} continua no servidor.")
+        return
+    print()
+    if trabalho['status'] == "concluido":
+        imprimir_resposta(f"✅ {trabalho['concluidos']} PDF(s) gerado(s) em: {trabalho['destino']}")
+    else:
+        imprimir_resposta(f"❌ ERRO: {trabalho['falhas']} PDF(s) falharam. " + "; ".join(trabalho['erros']))
+
+def importar_csv(sock, acao, caminho):
+    try:
+        arquivo = open(caminho, newline='', encoding='utf-8-sig')
+    except OSError as e:
+        imprimir_resposta(f"❌ ERRO: Não foi possível abrir o arquivo: {e}")
+        return
+    totais = {"processadas": 0, "aplicadas": 0, "ignoradas": 0}
+    erros = []
+    with arquivo:
+        primeira = arquivo.readline()
+        delimitador = ";" if primeira.count(";") > primeira.count(",") else ","
+        leitor = csv.reader(itertools.chain([primeira], arquivo), delimiter=delimitador)
+        cabecalho = next(leitor, None)
+        if not cabecalho:
+            imprimir_resposta("❌ ERRO: Arquivo vazio.")
+            return
+        numero = 2
+        try:
+            while True:
+                lote = list(itertools.islice(leitor, LINHAS_POR_LOTE))
+                if not lote:
+                    break
+                saida = io.StringIO()
+                escritor = csv.writer(saida, lineterminator="\n")
+                escritor.writerow(cabecalho)
+                escritor.writerows(lote)
+                resposta = enviar_comando(sock, json.dumps({"acao": acao, "csv": saida.getvalue(), "linha": numero}))
+                try:
+                    resultado = json.loads(resposta)
+                except json.JSONDecodeError:
+                    print()
+                    imprimir_resposta(resposta)
+                    return
+                for chave in totais:
+                    totais[chave] += resultado[chave]
+                erros += resultado["erros"]
+                numero += len(lote)
+                print(f"\r  Enviadas {totais['processadas']} linha(s)...", end="", flush=True)
+        except csv.Error as e:
+            print()
+            imprimir_resposta(f"❌ ERRO: CSV inválido na linha {leitor.line_num}: {e}")
+            return
+    print()
+    print("\n<<< Resposta do Servidor >>>")
+    for erro in erros[:MAX_ERROS_EXIBIDOS]:
+        print(f"Linha {erro['linha']}: {erro['mensagem']}")
+    if len(erros) > MAX_ERROS_EXIBIDOS:
+        print(f"... e mais {len(erros) - MAX_ERROS_EXIBIDOS} erro(s).")
+    print(f"✅ {totais['aplicadas']} linha(s) importada(s), {totais['ignoradas']} já existente(s), {len(erros)} com erro.")
+    print("<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<")
+
+def exportar_csv(sock, acao, caminho):
+    try:
+        arquivo = open(caminho, 'w', newline='', encoding='utf-8')
+    except OSError as e:
+        imprimir_resposta(f"❌ ERRO: Não foi possível criar o arquivo: {e}")
+        return
+    total = 0
+    apos = None
+    with arquivo:
+        while True:
+            pedido = {"acao": acao}
+            if apos:
+                pedido["apos"] = apos
+            resposta = enviar_comando(sock, json.dumps(pedido))
+            try:
+                pagina = json.loads(resposta)
+            except json.JSONDecodeError:
+                print()
+                imprimir_resposta(resposta)
+                return
+            arquivo.write(pagina["csv"])
+            total += pagina["linhas"]
+            print(f"\r  Recebidas {total} linha(s)...", end="", flush=True)
+            apos = pagina["proximo"]
+            if not apos:
+                break
+    print()
+    imprimir_resposta(f"✅ {total} linha(s) exportada(s) para {caminho}")
 
 def menu_acesso():
     header("ACESSO AO SISTEMA - Política de Privacidade (LGPD)")
@@ -153,7 +479,8 @@ def menu_principal(nome_prof):
     print("2. Gerenciar Turmas")
     print("3. Gerenciar Atividades e Notas")
     print("4. Gerenciar Relatórios e PDFs")
-    print("5. Logout")
+    print("5. Importar/Exportar CSV")
+    print("6. Logout")
     print("0. Sair")
     return input("Escolha: ").strip()
 
@@ -212,6 +539,20 @@ def menu_relatorios_ui():
     print("0. Voltar")
     return input("Escolha: ").strip()
 
+def menu_csv_ui():
+    header("IMPORTAR / EXPORTAR CSV")
+    print("1. Importar alunos (colunas: nome, matricula)")
+    print("2. Importar matrículas (colunas: turma_id e aluno_id ou matricula)")
+    print("3. Importar notas (colunas: atividade_id, aluno_id ou matricula, nota)")
+    print("4. Exportar alunos")
+    print("5. Exportar matrículas")
+    print("6. Exportar notas")
+    print("0. Voltar")
+    return input("Escolha: ").strip()
+
+ACOES_CSV = {"1": "importar_alunos", "2": "importar_matriculas", "3": "importar_notas",
+             "4": "exportar_alunos", "5": "exportar_matriculas", "6": "exportar_notas"}
+
 def main():
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         try:
@@ -254,6 +595,9 @@ def main():
                         nome_professor_logado = resposta.split(':', 1)[1]
                         is_logged_in = True
                         imprimir_resposta(f"✅ Login efetuado! Bem-vindo, Prof. {nome_professor_logado}.")
+                        assinar_eventos(s, COLECOES_ASSINADAS)
+                    elif resposta == "NECESSARIO_LOGIN":
+                        imprimir_resposta("❌ ERRO: O servidor não aceita cadastro de professores sem login.")
                     else:
                         imprimir_resposta(resposta)
             dados_cache = {}
@@ -266,8 +610,11 @@ def main():
                         sub = menu_alunos_ui()
                         comando = None
                         if sub == "1":
-                            if not buscar_e_listar(s, dados_cache, 'alunos', 'listar_alunos'):
-                                continue
+                            pedido = {"acao": "listar_alunos", "ordenar": "nome"}
+                            filtro = input("Filtrar por nome (Enter para todos): ").strip()
+                            if filtro:
+                                pedido["filtro"] = {"nome": filtro}
+                            listar_paginado(s, "ALUNOS", pedido)
                         elif sub == "2":
                             nome = input("Nome: ").strip()
                             mat = input("Matrícula: ").strip()
@@ -275,7 +622,7 @@ def main():
                                 comando = f"cadastrar_aluno;{nome};{mat}"
                                 resposta = enviar_comando(s, comando)
                                 imprimir_resposta(resposta)
-                                invalidar_cache(dados_cache, 'alunos')
+                                marcar_desatualizado(dados_cache, 'alunos')
                             else:
                                 print("❌ Nome e Matrícula obrigatórios.")
                         elif sub == "3":
@@ -293,7 +640,7 @@ def main():
                             comando = f"editar_aluno;{aid_str};{nome};{mat}"
                             resposta = enviar_comando(s, comando)
                             imprimir_resposta(resposta)
-                            invalidar_cache(dados_cache, 'alunos')
+                            marcar_desatualizado(dados_cache, 'alunos')
                         elif sub == "4":
                             if not buscar_e_listar(s, dados_cache, 'alunos', 'listar_alunos'):
                                 continue
@@ -307,8 +654,7 @@ def main():
                                 comando = f"remover_aluno;{aid_str}"
                                 resposta = enviar_comando(s, comando)
                                 imprimir_resposta(resposta)
-                                invalidar_cache(dados_cache, 'alunos')
-                                invalidar_cache(dados_cache, 'turmas')
+                                marcar_desatualizado(dados_cache, 'alunos', 'turmas')
                         elif sub == "5":
                             query = input("Buscar por nome ou matrícula: ").strip().lower()
                             if query:
@@ -337,15 +683,14 @@ def main():
                         sub = menu_turmas_ui()
                         comando = None
                         if sub == "1":
-                            if not buscar_e_listar(s, dados_cache, 'turmas', 'listar_turmas'):
-                                continue
+                            listar_paginado(s, "TURMAS", {"acao": "listar_turmas"})
                         elif sub == "2":
                             nome = input("Nome da turma: ").strip()
                             if nome:
                                 comando = f"cadastrar_turma;{nome}"
                                 resposta = enviar_comando(s, comando)
                                 imprimir_resposta(resposta)
-                                invalidar_cache(dados_cache, 'turmas')
+                                marcar_desatualizado(dados_cache, 'turmas')
                         elif sub == "3":
                             if not buscar_e_listar(s, dados_cache, 'turmas', 'listar_turmas'):
                                 continue
@@ -360,7 +705,7 @@ def main():
                             comando = f"editar_turma;{tid_str};{nome}"
                             resposta = enviar_comando(s, comando)
                             imprimir_resposta(resposta)
-                            invalidar_cache(dados_cache, 'turmas')
+                            marcar_desatualizado(dados_cache, 'turmas', 'atividades')
                         elif sub == "4":
                             if not buscar_e_listar(s, dados_cache, 'turmas', 'listar_turmas'):
                                 continue
@@ -374,8 +719,7 @@ def main():
                                 comando = f"remover_turma;{tid_str}"
                                 resposta = enviar_comando(s, comando)
                                 imprimir_resposta(resposta)
-                                invalidar_cache(dados_cache, 'turmas')
-                                invalidar_cache(dados_cache, 'atividades')
+                                marcar_desatualizado(dados_cache, 'turmas', 'atividades')
                         elif sub == "5":
                             if not buscar_e_listar(s, dados_cache, 'turmas', 'listar_turmas'):
                                 continue
@@ -384,9 +728,7 @@ def main():
                             if not obter_item_cacheado(dados_cache, 'turmas', tid_str):
                                 imprimir_resposta("❌ ERRO: ID inválido.")
                                 continue
-                            comando = f"ver_alunos_da_turma;{tid_str}"
-                            resposta = enviar_comando(s, comando)
-                            imprimir_resposta(resposta)
+                            listar_paginado(s, "ALUNOS DA TURMA", {"acao": "ver_alunos_da_turma", "id": tid_str, "ordenar": "nome"})
                         elif sub == "6":
                             if not buscar_e_listar(s, dados_cache, 'turmas', 'listar_turmas'):
                                 continue
@@ -416,6 +758,190 @@ def main():
                             comando = f"matricular_aluno_em_turma;{aid_str};{tid_str}"
                             resposta = enviar_comando(s, comando)
                             imprimir_resposta(resposta)
-                            invalidar_cache(dados_cache, 'turmas')
+                            marcar_desatualizado(dados_cache, 'turmas')
                         elif sub == "8":
-                            if
+                            if not buscar_e_listar(s, dados_cache, 'turmas', 'listar_turmas'):
+                                continue
+                            tid_str = input("ID da turma (0 para cancelar): ")
+                            if tid_str == "0": continue
+                            if not obter_item_cacheado(dados_cache, 'turmas', tid_str):
+                                imprimir_resposta("❌ ERRO: ID de turma inválido.")
+                                continue
+                            resposta = enviar_comando(s, f"ver_alunos_da_turma;{tid_str}")
+                            imprimir_resposta(resposta)
+                            aid_str = input("ID do aluno para desmatricular (0 para cancelar): ")
+                            if aid_str == "0": continue
+                            if confirma("Desmatricular aluno e apagar as notas dele nesta turma? (s/n): "):
+                                comando = f"desmatricular_aluno;{tid_str};{aid_str}"
+                                resposta = enviar_comando(s, comando)
+                                imprimir_resposta(resposta)
+                                marcar_desatualizado(dados_cache, 'turmas')
+                        elif sub == "0":
+                            break
+                        else:
+                            print("Inválido.")
+                elif op == "3":
+                    while True:
+                        sub = menu_atividades_ui()
+                        comando = None
+                        if sub == "1":
+                            listar_paginado(s, "ATIVIDADES", {"acao": "listar_atividades"})
+                        elif sub == "2":
+                            if not buscar_e_listar(s, dados_cache, 'turmas', 'listar_turmas'):
+                                continue
+                            tid_str = input("ID da turma (0 para cancelar): ")
+                            if tid_str == "0": continue
+                            if not obter_item_cacheado(dados_cache, 'turmas', tid_str):
+                                imprimir_resposta("❌ ERRO: ID de turma inválido.")
+                                continue
+                            nome = input("Nome da atividade: ").strip()
+                            descricao = input("Descrição: ").strip()
+                            if nome:
+                                comando = f"cadastrar_atividade;{tid_str};{nome};{descricao}"
+                                resposta = enviar_comando(s, comando)
+                                imprimir_resposta(resposta)
+                                marcar_desatualizado(dados_cache, 'atividades', 'turmas')
+                            else:
+                                print("❌ Nome obrigatório.")
+                        elif sub == "3":
+                            if not buscar_e_listar(s, dados_cache, 'atividades', 'listar_atividades'):
+                                continue
+                            atv_str = input("ID da atividade para editar (0 para cancelar): ")
+                            if atv_str == "0": continue
+                            atv_atual = obter_item_cacheado(dados_cache, 'atividades', atv_str)
+                            if not atv_atual:
+                                imprimir_resposta("❌ ERRO: ID inválido.")
+                                continue
+                            print(f"\nEditando Atividade: {atv_atual['nome']}")
+                            nome = input(f"Novo nome (atual: {atv_atual['nome']}): ").strip()
+                            descricao = input("Nova descrição (Enter para manter): ").strip()
+                            comando = f"editar_atividade;{atv_str};{nome};{descricao}"
+                            resposta = enviar_comando(s, comando)
+                            imprimir_resposta(resposta)
+                            marcar_desatualizado(dados_cache, 'atividades')
+                        elif sub == "4":
+                            if not buscar_e_listar(s, dados_cache, 'atividades', 'listar_atividades'):
+                                continue
+                            atv_str = input("ID da atividade para remover (0 para cancelar): ")
+                            if atv_str == "0": continue
+                            atv_atual = obter_item_cacheado(dados_cache, 'atividades', atv_str)
+                            if not atv_atual:
+                                imprimir_resposta("❌ ERRO: ID inválido.")
+                                continue
+                            if confirma(f"Remover atividade {atv_atual['nome']} e suas notas? (s/n): "):
+                                comando = f"remover_atividade;{atv_str}"
+                                resposta = enviar_comando(s, comando)
+                                imprimir_resposta(resposta)
+                                marcar_desatualizado(dados_cache, 'atividades', 'turmas')
+                        elif sub == "5":
+                            if not buscar_e_listar(s, dados_cache, 'atividades', 'listar_atividades'):
+                                continue
+                            atv_str = input("ID da atividade (0 para cancelar): ")
+                            if atv_str == "0": continue
+                            if not obter_item_cacheado(dados_cache, 'atividades', atv_str):
+                                imprimir_resposta("❌ ERRO: ID inválido.")
+                                continue
+                            resposta = enviar_comando(s, f"ver_notas_atividade;{atv_str}")
+                            imprimir_resposta(resposta)
+                        elif sub == "6":
+                            if not buscar_e_listar(s, dados_cache, 'atividades', 'listar_atividades'):
+                                continue
+                            atv_str = input("ID da atividade (0 para cancelar): ")
+                            if atv_str == "0": continue
+                            atv_atual = obter_item_cacheado(dados_cache, 'atividades', atv_str)
+                            if not atv_atual:
+                                imprimir_resposta("❌ ERRO: ID inválido.")
+                                continue
+                            print("1. Nota de um aluno")
+                            print("2. Lançar notas da turma inteira")
+                            modo = input("Escolha: ").strip()
+                            if modo == "1":
+                                resposta = enviar_comando(s, f"ver_alunos_da_turma;{atv_atual.get('turma_id', '')}")
+                                imprimir_resposta(resposta)
+                                aid_str = input("ID do aluno (0 para cancelar): ")
+                                if aid_str == "0": continue
+                                nota = input_float("Nota (0 a 10): ", 0, 10)
+                                comando = f"adicionar_nota;{atv_str};{aid_str};{nota}"
+                                resposta = enviar_comando(s, comando)
+                                imprimir_resposta(resposta)
+                            elif modo == "2":
+                                lancar_notas_turma(s, atv_atual)
+                            else:
+                                print("Inválido.")
+                        elif sub == "7":
+                            if not buscar_e_listar(s, dados_cache, 'atividades', 'listar_atividades'):
+                                continue
+                            atv_str = input("ID da atividade (0 para cancelar): ")
+                            if atv_str == "0": continue
+                            if not obter_item_cacheado(dados_cache, 'atividades', atv_str):
+                                imprimir_resposta("❌ ERRO: ID inválido.")
+                                continue
+                            resposta = enviar_comando(s, f"ver_notas_atividade;{atv_str}")
+                            imprimir_resposta(resposta)
+                            aid_str = input("ID do aluno (0 para cancelar): ")
+                            if aid_str == "0": continue
+                            if confirma("Remover a nota deste aluno? (s/n): "):
+                                comando = f"remover_nota;{atv_str};{aid_str}"
+                                resposta = enviar_comando(s, comando)
+                                imprimir_resposta(resposta)
+                        elif sub == "0":
+                            break
+                        else:
+                            print("Inválido.")
+                elif op == "4":
+                    while True:
+                        sub = menu_relatorios_ui()
+                        if sub == "1":
+                            if not buscar_e_listar(s, dados_cache, 'turmas', 'listar_turmas'):
+                                continue
+                            tid_str = input("ID da turma (0 para cancelar): ")
+                            if tid_str == "0": continue
+                            t_atual = obter_item_cacheado(dados_cache, 'turmas', tid_str)
+                            if not t_atual:
+                                imprimir_resposta("❌ ERRO: ID inválido.")
+                                continue
+                            relatorio_texto_turma(s, t_atual)
+                        elif sub in ("2", "3"):
+                            if not buscar_e_listar(s, dados_cache, 'turmas', 'listar_turmas'):
+                                continue
+                            tid_str = input("ID da turma (0 para cancelar): ")
+                            if tid_str == "0": continue
+                            acao = "gerar_relatorio_pdf" if sub == "2" else "gerar_boletins"
+                            acompanhar_trabalho(s, enviar_comando(s, f"{acao};{tid_str}"))
+                        elif sub == "4":
+                            mostrar_medias_turmas(s)
+                        elif sub == "5":
+                            mostrar_melhor_pior(s)
+                        elif sub == "0":
+                            break
+                        else:
+                            print("Inválido.")
+                elif op == "5":
+                    while True:
+                        sub = menu_csv_ui()
+                        if sub == "0":
+                            break
+                        acao = ACOES_CSV.get(sub)
+                        if not acao:
+                            print("Inválido.")
+                            continue
+                        caminho = input("Caminho do arquivo CSV (Enter para cancelar): ").strip()
+                        if not caminho:
+                            continue
+                        if acao.startswith("importar"):
+                            importar_csv(s, acao, caminho)
+                            marcar_desatualizado(dados_cache, *COLECOES_ASSINADAS)
+                        else:
+                            exportar_csv(s, acao, caminho)
+                elif op == "6":
+                    print(f"Até logo, Prof. {nome_professor_logado}.")
+                    enviar_comando(s, json.dumps({"acao": "logout"}))
+                    is_logged_in = False
+                elif op == "0":
+                    print("Saindo...")
+                    return
+                else:
+                    print("Opção inválida.")
+
+if __name__ == "__main__":
+    main()
@@ -1,500 +1,3295 @@
 import json
+import sys
+import base64
 import os
 import hashlib
+import hmac
+import time
 import socket
+import sqlite3
 import threading
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import cm
-
+import asyncio
+import signal
+import argparse
+import logging
+import logging.handlers
+import queue
+import atexit
+import copy
+import csv
+import io
+import gc
+import pickle
+import zlib
+from contextlib import contextmanager
+import bisect
+import math
+import heapq
+import unicodedata
+import itertools
+from collections import deque
+from dataclasses import dataclass
+from array import array
+import multiprocessing
+import multiprocessing.connection
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 ARQ_PROF = "professores.json"
 ARQ_ALUN = "alunos.json"
 ARQ_TURM = "turmas.json"
 ARQ_ATIV = "atividades.json"
+ARQ_JOURNAL = "journal.jsonl"
+ARQ_BANCO = "pim.db"
+ARQ_SNAPSHOT = "pim.snapshot"
+VERSAO_SNAPSHOT = 5
+LIMITE_JOURNAL = 500
+JANELA_GRAVACAO = 0.05
+LIMITE_MUDANCAS = 5000
+PAGINA_PADRAO = 100
+LIMITE_BUSCA = 50
+LIMITE_PAGINA = 500
+LIMITE_EXPORTACAO = 5000
+LIMITE_LOTE = 1000
+LIMITE_EVENTOS_PENDENTES = 1000
+LIMITE_BUFFER_EVENTOS = 1024 * 1024
+INTERVALO_REENVIO_EVENTOS = 0.5
+
+TAM_CABECALHO = 10
+TAM_LEITURA = 65536
+TAM_MAX_QUADRO = 16 * 1024 * 1024
+
+PORTA = 5050
+BACKLOG = 128
+MAX_CONEXOES = 500
+TIMEOUT_OCIOSO = 900
+WORKERS = 8
+TEMPO_ENCERRAMENTO = 5
+LEITORES = 0
+ESPERA_REPLICACAO = 5
+
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+WORKERS_LOGIN = 2
+FILA_LOGIN = 32
+LIMITE_TENTATIVAS = 5
+JANELA_TENTATIVAS = 300
+MAX_MATRICULAS_VIGIADAS = 10000
+
+class ErroProtocolo(Exception):
+    pass
+
+class ErroArmazenamento(Exception):
+    pass
+
+class LockLeituraEscrita:
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._leitores = {}
+        self._escritor = None
+        self._profundidade = 0
+        self._escritores_esperando = 0
+
+    def adquirir_leitura(self):
+        eu = threading.get_ident()
+        with self._cond:
+            if self._escritor == eu:
+                self._profundidade += 1
+                return
+            if eu not in self._leitores:
+                while self._escritor is not None or self._escritores_esperando:
+                    self._cond.wait()
+            self._leitores[eu] = self._leitores.get(eu, 0) + 1
+
+    def liberar_leitura(self):
+        eu = threading.get_ident()
+        with self._cond:
+            if self._escritor == eu:
+                self._profundidade -= 1
+                return
+            self._leitores[eu] -= 1
+            if not self._leitores[eu]:
+                del self._leitores[eu]
+                if not self._leitores:
+                    self._cond.notify_all()
+
+    def adquirir_escrita(self):
+        eu = threading.get_ident()
+        with self._cond:
+            if self._escritor == eu:
+                self._profundidade += 1
+                return
+            if eu in self._leitores:
+                raise RuntimeError("Não é possível promover leitura para escrita.")
+            self._escritores_esperando += 1
+            while self._escritor is not None or self._leitores:
+                self._cond.wait()
+            self._escritores_esperando -= 1
+            self._escritor = eu
+            self._profundidade = 1
+
+    def liberar_escrita(self):
+        with self._cond:
+            self._profundidade -= 1
+            if not self._profundidade:
+                self._escritor = None
+                self._cond.notify_all()
+
+proxima_versao = itertools.count(1).__next__
+
+def normalizar(texto):
+    return "".join(c for c in unicodedata.normalize("NFKD", str(texto)) if not unicodedata.combining(c)).casefold()
+
+class IndiceBusca:
+    def __init__(self, campos):
+        self.campos = campos
+        self.textos = {}
+        self.postagens = {}
+
+    def limpar(self):
+        self.textos.clear()
+        self.postagens.clear()
+
+    def _chaves(self, textos):
+        chaves = set()
+        for texto in textos:
+            for termo in texto.split():
+                chaves.update(termo[i:i + 3] for i in range(len(termo) - 2))
+        return chaves
+
+    def incluir(self, registro):
+        textos = tuple(normalizar(getattr(registro, campo) or "") for campo in self.campos)
+        self.textos[registro.id] = textos
+        for chave in self._chaves(textos):
+            self.postagens.setdefault(chave, set()).add(registro.id)
+
+    def excluir(self, registro):
+        textos = self.textos.pop(registro.id, None)
+        if textos is not None:
+            for chave in self._chaves(textos):
+                _descartar(self.postagens, chave, registro.id)
+
+    def _classificar(self, termos, textos):
+        palavras = [p for texto in textos for p in texto.split()]
+        prefixos = 0
+        for termo in termos:
+            if any(p.startswith(termo) for p in palavras):
+                prefixos += 1
+            elif not any(termo in texto for texto in textos):
+                return None
+        consulta = " ".join(termos)
+        if consulta in textos: return 0
+        if any(texto.startswith(consulta) for texto in textos): return 1
+        return 2 if prefixos == len(termos) else 3
+
+    def buscar(self, consulta, limite):
+        termos = normalizar(consulta).split()
+        if not termos: return []
+        chaves = {termo[i:i + 3] for termo in termos for i in range(len(termo) - 2)}
+        if chaves:
+            postagens = sorted((self.postagens.get(chave, set()) for chave in chaves), key=len)
+            candidatos = postagens[0].intersection(*postagens[1:])
+        else:
+            candidatos = self.textos
+        resultados = []
+        for rid in candidatos:
+            posicao = self._classificar(termos, self.textos[rid])
+            if posicao is not None:
+                resultados.append((posicao, self.textos[rid], rid))
+        return [rid for _, _, rid in heapq.nsmallest(limite, resultados)]
+
+def _extras(dados, campos):
+    return {k: v for k, v in dados.items() if k not in campos} or None
+
+@dataclass(slots=True)
+class Professor:
+    id: int
+    nome: str
+    matricula: str
+    senha: str = ""
+    extra: dict = None
+
+    @classmethod
+    def de_dict(cls, d):
+        return cls(int(d["id"]), d.get("nome", ""), d.get("matricula", ""), d.get("senha", ""),
+                   _extras(d, ("id", "nome", "matricula", "senha")))
+
+    def para_dict(self):
+        return {"id": self.id, "nome": self.nome, "matricula": self.matricula, "senha": self.senha, **(self.extra or {})}
+
+@dataclass(slots=True)
+class Aluno:
+    id: int
+    nome: str
+    matricula: str
+    extra: dict = None
+
+    @classmethod
+    def de_dict(cls, d):
+        return cls(int(d["id"]), d.get("nome", ""), d.get("matricula", ""), _extras(d, ("id", "nome", "matricula")))
+
+    def para_dict(self):
+        return {"id": self.id, "nome": self.nome, "matricula": self.matricula, **(self.extra or {})}
+
+@dataclass(slots=True)
+class Turma:
+    id: int
+    nome: str
+    alunos: array
+    atividades: array
+    extra: dict = None
+
+    @classmethod
+    def de_dict(cls, d):
+        return cls(int(d["id"]), d.get("nome", ""), array("i", sorted({int(a) for a in d.get("alunos", ())})),
+                   array("i", (int(a) for a in d.get("atividades", ()))), _extras(d, ("id", "nome", "alunos", "atividades")))
+
+    def para_dict(self):
+        return {"id": self.id, "nome": self.nome, "alunos": self.alunos.tolist(), "atividades": self.atividades.tolist(),
+                **(self.extra or {})}
+
+    def tem_aluno(self, aid):
+        i = bisect.bisect_left(self.alunos, aid)
+        return i < len(self.alunos) and self.alunos[i] == aid
+
+    def incluir_aluno(self, aid):
+        i = bisect.bisect_left(self.alunos, aid)
+        if i == len(self.alunos) or self.alunos[i] != aid:
+            self.alunos.insert(i, aid)
+
+    def retirar_aluno(self, aid):
+        i = bisect.bisect_left(self.alunos, aid)
+        if i < len(self.alunos) and self.alunos[i] == aid:
+            del self.alunos[i]
+
+@dataclass(slots=True)
+class Atividade:
+    id: int
+    nome: str
+    descricao: str
+    turma_id: int
+    alunos_com_nota: array
+    valores: array
+    extra: dict = None
+
+    @classmethod
+    def de_dict(cls, d):
+        notas = sorted((int(aid), float(nota)) for aid, nota in (d.get("notas") or {}).items())
+        turma_id = d.get("turma_id")
+        return cls(int(d["id"]), d.get("nome", ""), d.get("descricao", ""), int(turma_id) if turma_id is not None else None,
+                   array("i", (aid for aid, _ in notas)), array("d", (nota for _, nota in notas)),
+                   _extras(d, ("id", "nome", "descricao", "turma_id", "notas")))
+
+    def para_dict(self):
+        return {"id": self.id, "nome": self.nome, "descricao": self.descricao, "turma_id": self.turma_id,
+                "notas": {str(aid): nota for aid, nota in self.notas()}, **(self.extra or {})}
+
+    def notas(self):
+        return zip(self.alunos_com_nota, self.valores)
+
+    def nota(self, aid):
+        i = bisect.bisect_left(self.alunos_com_nota, aid)
+        if i < len(self.alunos_com_nota) and self.alunos_com_nota[i] == aid:
+            return self.valores[i]
+        return None
+
+    def definir_nota(self, aid, nota):
+        i = bisect.bisect_left(self.alunos_com_nota, aid)
+        if i < len(self.alunos_com_nota) and self.alunos_com_nota[i] == aid:
+            anterior, self.valores[i] = self.valores[i], nota
+            return anterior
+        self.alunos_com_nota.insert(i, aid)
+        self.valores.insert(i, nota)
+        return None
+
+    def apagar_nota(self, aid):
+        i = bisect.bisect_left(self.alunos_com_nota, aid)
+        if i < len(self.alunos_com_nota) and self.alunos_com_nota[i] == aid:
+            anterior = self.valores[i]
+            del self.alunos_com_nota[i]
+            del self.valores[i]
+            return anterior
+        return None
+
+class Colecao:
+    def __init__(self, nome, arquivo, tipo, indices=(), busca=(), ao_colocar=None, ao_retirar=None):
+        self.nome = nome
+        self.arquivo = arquivo
+        self.tipo = tipo
+        self.por_id = {}
+        self.indices = {campo: {} for campo in indices}
+        self.busca = IndiceBusca(busca) if busca else None
+        self.ultimo_id = 0
+        self.versao = 0
+        self.piso = 0
+        self.mudancas = deque(maxlen=LIMITE_MUDANCAS)
+        self.deltas = {}
+        self.ao_colocar = ao_colocar
+        self.ao_retirar = ao_retirar
+        self.lock = LockLeituraEscrita()
+
+    def __iter__(self):
+        return iter(self.por_id.values())
+
+    def __len__(self):
+        return len(self.por_id)
+
+    def lista(self):
+        return list(self.por_id.values())
+
+    def carregar(self, registros):
+        self.por_id = {}
+        self.indices = {campo: {} for campo in self.indices}
+        if self.busca: self.busca.limpar()
+        self.ultimo_id = 0
+        self.mudancas.clear()
+        self.versao = self.piso = proxima_versao()
+        for r in registros:
+            if str(r.get("id")).isdigit():
+                self._colocar(self.tipo.de_dict(r))
+
+    def estado(self):
+        return self.por_id, self.indices, self.busca and (self.busca.textos, self.busca.postagens), self.ultimo_id
+
+    def restaurar(self, estado):
+        self.por_id, self.indices, busca, self.ultimo_id = estado
+        if self.busca: self.busca.textos, self.busca.postagens = busca
+        self.mudancas.clear()
+        self.versao = self.piso = proxima_versao()
+
+    def prox_id(self):
+        return self.ultimo_id + 1
+
+    def buscar(self, rid):
+        try:
+            return self.por_id.get(int(rid))
+        except (TypeError, ValueError):
+            return None
+
+    def buscar_por(self, campo, valor):
+        if valor is None: return None
+        rid = self.indices[campo].get(str(valor).lower())
+        return self.por_id.get(rid) if rid is not None else None
+
+    def preservar(self, registro, novo=False):
+        desfazer = getattr(lote_atual, "desfazer", None)
+        if desfazer is not None and (self.nome, registro.id) not in desfazer:
+            desfazer[(self.nome, registro.id)] = (self, None if novo else copy.deepcopy(registro))
+
+    def inserir(self, registro):
+        if registro.id is None:
+            registro.id = self.prox_id()
+        self.preservar(registro, novo=True)
+        self._colocar(registro)
+        registrar_mutacao(self, "put", registro)
+        return registro
+
+    def anotar(self, registro, *delta):
+        self.deltas.setdefault(registro.id, []).append(delta)
+
+    def atualizar(self, registro, **campos):
+        delta = self.deltas.pop(registro.id, None)
+        self.preservar(registro)
+        self._desindexar(registro)
+        for campo, valor in campos.items():
+            setattr(registro, campo, valor)
+        self._indexar(registro)
+        self._marcar(registro.id)
+        registrar_mutacao(self, "put", registro, None if campos else delta)
+
+    def remover(self, registro):
+        self.deltas.pop(registro.id, None)
+        self.preservar(registro)
+        self._retirar(registro)
+        registrar_mutacao(self, "del", registro)
+
+    def _colocar(self, registro):
+        rid = registro.id
+        anterior = self.por_id.get(rid)
+        if anterior is not None:
+            self._desindexar(anterior)
+            if self.ao_retirar: self.ao_retirar(anterior)
+        self.por_id[rid] = registro
+        self.ultimo_id = max(self.ultimo_id, rid)
+        self._marcar(rid, criado=anterior is None)
+        self._indexar(registro)
+        if self.ao_colocar: self.ao_colocar(registro)
+
+    def _retirar(self, registro):
+        self._desindexar(registro)
+        del self.por_id[registro.id]
+        self._marcar(registro.id)
+        if self.ao_retirar: self.ao_retirar(registro)
+
+    def _marcar(self, rid, criado=False):
+        self.versao = proxima_versao()
+        if len(self.mudancas) == self.mudancas.maxlen:
+            self.piso = self.mudancas[0][0]
+        self.mudancas.append((self.versao, rid, criado))
+        if assinaturas or canais_leitores:
+            anotar_evento(self, rid, criado)
+
+    def alterados_desde(self, versao):
+        if versao < self.piso:
+            return None
+        alterados = {}
+        for v, rid, criado in reversed(self.mudancas):
+            if v <= versao:
+                break
+            alterados[rid] = alterados.get(rid, False) or criado
+        return alterados
+
+    def _indexar(self, registro):
+        for campo, indice in self.indices.items():
+            valor = getattr(registro, campo)
+            if valor is not None:
+                indice.setdefault(str(valor).lower(), registro.id)
+        if self.busca: self.busca.incluir(registro)
+
+    def _desindexar(self, registro):
+        for campo, indice in self.indices.items():
+            chave = str(getattr(registro, campo)).lower()
+            if indice.get(chave) == registro.id:
+                del indice[chave]
+        if self.busca: self.busca.excluir(registro)
+
+def _somar_exato(parciais, x):
+    i = 0
+    for y in parciais:
+        if abs(x) < abs(y):
+            x, y = y, x
+        alto = x + y
+        baixo = y - (alto - x)
+        if baixo:
+            parciais[i] = baixo
+            i += 1
+        x = alto
+    parciais[i:] = [x]
+
+class Agregado:
+    __slots__ = ("valores", "parciais")
+
+    def __init__(self, valores=()):
+        self.valores = array("d", valores)
+        self.parciais = []
+        for nota in self.valores:
+            _somar_exato(self.parciais, nota)
+
+    def __len__(self):
+        return len(self.valores)
+
+    def incluir(self, nota):
+        bisect.insort(self.valores, nota)
+        _somar_exato(self.parciais, nota)
+
+    def excluir(self, nota):
+        i = bisect.bisect_left(self.valores, nota)
+        if i < len(self.valores) and self.valores[i] == nota:
+            del self.valores[i]
+            _somar_exato(self.parciais, -nota)
+
+    def media(self):
+        return math.fsum(self.parciais) / len(self.valores) if self.valores else None
+
+    def resumo(self):
+        n = len(self.valores)
+        if not n:
+            return {"n_notas": 0, "media": None, "minimo": None, "maximo": None, "mediana": None}
+        meio = n // 2
+        mediana = self.valores[meio] if n % 2 else (self.valores[meio - 1] + self.valores[meio]) / 2
+        return {"n_notas": n, "media": round(self.media(), 2), "minimo": self.valores[0],
+                "maximo": self.valores[-1], "mediana": round(mediana, 2)}
+
+estat_turma = {}
+estat_aluno = {}
+estat_turma_aluno = {}
+rankings = {}
+estatisticas_ativas = True
+
+def _estatistica_incluir(tid, aid, nota):
+    if not estatisticas_ativas: return
+    nota = float(nota)
+    for indice, chave in ((estat_turma, tid), (estat_aluno, aid), (estat_turma_aluno, (tid, aid))):
+        indice.setdefault(chave, Agregado()).incluir(nota)
+    rankings.pop(tid, None)
+
+def _estatistica_excluir(tid, aid, nota):
+    if not estatisticas_ativas: return
+    nota = float(nota)
+    for indice, chave in ((estat_turma, tid), (estat_aluno, aid), (estat_turma_aluno, (tid, aid))):
+        agregado = indice.get(chave)
+        if agregado is not None:
+            agregado.excluir(nota)
+            if not agregado:
+                del indice[chave]
+    rankings.pop(tid, None)
+
+np = None
+numpy_verificado = False
+
+def obter_numpy():
+    global np, numpy_verificado
+    if not numpy_verificado:
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        numpy_verificado = True
+    return np
+
+def _agrupar(chaves, notas):
+    grupos = {}
+    np = obter_numpy()
+    if np is not None:
+        chaves = np.asarray(chaves, dtype=np.int64)
+        notas = np.asarray(notas, dtype=float)
+        ordem = np.lexsort((notas, chaves))
+        chaves_ord, notas_ord = chaves[ordem], notas[ordem]
+        unicas, inicios = np.unique(chaves_ord, return_index=True)
+        fins = np.append(inicios[1:], len(chaves_ord))
+        for chave, ini, fim in zip(unicas.tolist(), inicios.tolist(), fins.tolist()):
+            grupos[chave] = Agregado(notas_ord[ini:fim].tolist())
+    else:
+        for chave, nota in zip(chaves, notas):
+            grupos.setdefault(chave, []).append(nota)
+        for chave, valores in grupos.items():
+            valores.sort()
+            grupos[chave] = Agregado(valores)
+    return grupos
+
+def recalcular_estatisticas():
+    tids, aids, notas = [], [], []
+    for atv in atividades:
+        tids.extend([atv.turma_id or 0] * len(atv.valores))
+        aids.extend(atv.alunos_com_nota)
+        notas.extend(atv.valores)
+    estat_turma.clear()
+    estat_aluno.clear()
+    estat_turma_aluno.clear()
+    rankings.clear()
+    if notas:
+        estat_turma.update(_agrupar(tids, notas))
+        estat_aluno.update(_agrupar(aids, notas))
+        fator = max(aids) + 1
+        for chave, agregado in _agrupar([t * fator + a for t, a in zip(tids, aids)], notas).items():
+            estat_turma_aluno[divmod(chave, fator)] = agregado
+    return len(notas)
+
+def ranking_turma(t):
+    ranking = rankings.get(t.id)
+    if ranking is None:
+        ranking = []
+        for aid in t.alunos:
+            agregado = estat_turma_aluno.get((t.id, aid))
+            if agregado:
+                ranking.append((agregado.media(), aid))
+        ranking.sort(key=lambda item: (-item[0], item[1]))
+        rankings[t.id] = ranking
+    return ranking
+
+turmas_por_aluno = {}
+atividades_com_nota = {}
+atividades_por_turma = {}
+
+def _indexar_turma(t):
+    for aid in t.alunos:
+        _vincular_id(turmas_por_aluno, aid, t.id)
+
+def _desindexar_turma(t):
+    for aid in t.alunos:
+        _desvincular_id(turmas_por_aluno, aid, t.id)
+
+def _indexar_atividade(atv):
+    if atv.turma_id is not None:
+        _vincular_id(atividades_por_turma, atv.turma_id, atv.id)
+    for aid, nota in atv.notas():
+        _vincular_id(atividades_com_nota, aid, atv.id)
+        _estatistica_incluir(atv.turma_id or 0, aid, nota)
+
+def _desindexar_atividade(atv):
+    if atv.turma_id is not None:
+        _desvincular_id(atividades_por_turma, atv.turma_id, atv.id)
+    for aid, nota in atv.notas():
+        _desvincular_id(atividades_com_nota, aid, atv.id)
+        _estatistica_excluir(atv.turma_id or 0, aid, nota)
+
+def _vincular_id(indice, chave, valor):
+    ids = indice.get(chave)
+    if ids is None:
+        indice[chave] = array("i", (valor,))
+        return
+    i = bisect.bisect_left(ids, valor)
+    if i == len(ids) or ids[i] != valor:
+        ids.insert(i, valor)
+
+def _desvincular_id(indice, chave, valor):
+    ids = indice.get(chave)
+    if ids is None: return
+    i = bisect.bisect_left(ids, valor)
+    if i < len(ids) and ids[i] == valor:
+        del ids[i]
+        if not ids:
+            del indice[chave]
+
+def _descartar(indice, chave, valor):
+    conjunto = indice.get(chave)
+    if conjunto is not None:
+        conjunto.discard(valor)
+        if not conjunto:
+            del indice[chave]
+
+def _vincular_aluno(t, aid):
+    turmas.preservar(t)
+    t.incluir_aluno(aid)
+    turmas.anotar(t, "aluno", aid)
+    _vincular_id(turmas_por_aluno, aid, t.id)
+
+def _desvincular_aluno(t, aid):
+    turmas.preservar(t)
+    t.retirar_aluno(aid)
+    turmas.anotar(t, "sem_aluno", aid)
+    _desvincular_id(turmas_por_aluno, aid, t.id)
+
+def _definir_nota(atv, aid, nota):
+    atividades.preservar(atv)
+    anterior = atv.definir_nota(aid, nota)
+    atividades.anotar(atv, "nota", aid, nota)
+    if anterior is not None:
+        _estatistica_excluir(atv.turma_id or 0, aid, anterior)
+    _vincular_id(atividades_com_nota, aid, atv.id)
+    _estatistica_incluir(atv.turma_id or 0, aid, nota)
+
+def _apagar_nota(atv, aid):
+    atividades.preservar(atv)
+    anterior = atv.apagar_nota(aid)
+    atividades.anotar(atv, "sem_nota", aid)
+    if anterior is not None:
+        _estatistica_excluir(atv.turma_id or 0, aid, anterior)
+    _desvincular_id(atividades_com_nota, aid, atv.id)
+
+def _incluir_atividade(t, atv_id):
+    turmas.preservar(t)
+    t.atividades.append(atv_id)
+    turmas.anotar(t, "atividade", atv_id)
+
+def _retirar_atividade(t, atv_id):
+    if atv_id not in t.atividades: return
+    turmas.preservar(t)
+    t.atividades.remove(atv_id)
+    turmas.anotar(t, "sem_atividade", atv_id)
+
+APLICAR_DELTA = {
+    "aluno": _vincular_aluno,
+    "sem_aluno": _desvincular_aluno,
+    "nota": _definir_nota,
+    "sem_nota": _apagar_nota,
+    "atividade": _incluir_atividade,
+    "sem_atividade": _retirar_atividade,
+}
+
+professores = Colecao("professores", ARQ_PROF, Professor, indices=("matricula",), busca=("nome", "matricula"))
+alunos = Colecao("alunos", ARQ_ALUN, Aluno, indices=("matricula",), busca=("nome", "matricula"))
+turmas = Colecao("turmas", ARQ_TURM, Turma, ao_colocar=_indexar_turma, ao_retirar=_desindexar_turma)
+atividades = Colecao("atividades", ARQ_ATIV, Atividade, ao_colocar=_indexar_atividade, ao_retirar=_desindexar_atividade)
+COLECOES = (professores, alunos, turmas, atividades)
+COLECOES_POR_NOME = {c.nome: c for c in COLECOES}
+ESTADO_DERIVADO = (turmas_por_aluno, atividades_com_nota, atividades_por_turma, estat_turma, estat_aluno, estat_turma_aluno)
+
+def capturar_estado():
+    return {"colecoes": {c.nome: c.estado() for c in COLECOES}, "derivados": ESTADO_DERIVADO}
+
+def restaurar_estado(estado):
+    for colecao in COLECOES:
+        colecao.restaurar(estado["colecoes"][colecao.nome])
+    for indice, valores in zip(ESTADO_DERIVADO, estado["derivados"]):
+        indice.clear()
+        indice.update(valores)
+    rankings.clear()
+
+log = logging.getLogger("pim")
+ouvinte_log = None
+
+def encerrar_log():
+    global ouvinte_log
+    if ouvinte_log is not None:
+        ouvinte_log.stop()
+        ouvinte_log = None
+
+def configurar_log(nivel="info"):
+    global ouvinte_log
+    encerrar_log()
+    fila = queue.SimpleQueue()
+    saida = logging.StreamHandler(sys.stdout)
+    saida.setFormatter(logging.Formatter("%(message)s"))
+    ouvinte_log = logging.handlers.QueueListener(fila, saida)
+    log.handlers[:] = [logging.handlers.QueueHandler(fila)]
+    log.setLevel(nivel.upper())
+    log.propagate = False
+    ouvinte_log.start()
+
+atexit.register(encerrar_log)
 
-professores = []
-alunos = []
-turmas = []
-atividades = []
+LIMITES_HISTOGRAMA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
 
-dados_lock = threading.Lock()
+class Histograma:
+    def __init__(self):
+        self.contagens = [0] * (len(LIMITES_HISTOGRAMA) + 1)
+        self.soma = 0.0
+        self.total = 0
+        self.maximo = 0.0
+
+    def observar(self, segundos):
+        self.contagens[bisect.bisect_left(LIMITES_HISTOGRAMA, segundos)] += 1
+        self.soma += segundos
+        self.total += 1
+        if segundos > self.maximo:
+            self.maximo = segundos
+
+    def percentil(self, p):
+        alvo, acumulado = p / 100 * self.total, 0
+        for i, n in enumerate(self.contagens):
+            acumulado += n
+            if n and acumulado >= alvo:
+                return min(LIMITES_HISTOGRAMA[i], self.maximo) if i < len(LIMITES_HISTOGRAMA) else self.maximo
+        return 0.0
+
+    def resumo(self):
+        return {"total": self.total, "media_ms": self.soma / self.total * 1000 if self.total else 0.0,
+                "p50_ms": self.percentil(50) * 1000, "p99_ms": self.percentil(99) * 1000, "max_ms": self.maximo * 1000}
+
+    def prometheus(self, nome, rotulos):
+        linhas, acumulado = [], 0
+        for limite, n in zip(LIMITES_HISTOGRAMA + ("+Inf",), self.contagens):
+            acumulado += n
+            linhas.append(f'{nome}_bucket{{{rotulos}{"," if rotulos else ""}le="{limite}"}} {acumulado}')
+        sufixo = f"{{{rotulos}}}" if rotulos else ""
+        linhas.append(f"{nome}_sum{sufixo} {self.soma:.6f}")
+        linhas.append(f"{nome}_count{sufixo} {self.total}")
+        return linhas
+
+metricas_lock = threading.Lock()
+metricas_comandos = {}
+metricas_persistencia = {}
+metricas_espera_lock = {}
+metricas_bytes = {"entrada": 0, "saida": 0}
+inicio_metricas = time.time()
+
+def registrar_comando(acao, segundos, resposta):
+    erro = isinstance(resposta, str) and (resposta.startswith("❌") or resposta == "NECESSARIO_LOGIN")
+    with metricas_lock:
+        m = metricas_comandos.get(acao)
+        if m is None:
+            m = metricas_comandos[acao] = {"erros": 0, "latencia": Histograma()}
+        m["latencia"].observar(segundos)
+        if erro:
+            m["erros"] += 1
+
+def registrar_tempo(operacao, segundos):
+    with metricas_lock:
+        h = metricas_persistencia.get(operacao)
+        if h is None:
+            h = metricas_persistencia[operacao] = Histograma()
+        h.observar(segundos)
+
+def registrar_bytes(entrada, saida):
+    with metricas_lock:
+        metricas_bytes["entrada"] += entrada
+        metricas_bytes["saida"] += saida
+
+def _registrar_espera(nome, escrita, segundos):
+    with metricas_lock:
+        h = metricas_espera_lock.get((nome, escrita))
+        if h is None:
+            h = metricas_espera_lock[(nome, escrita)] = Histograma()
+        h.observar(segundos)
+
+@contextmanager
+def transacao(le=(), escreve=()):
+    modos = {nome: False for nome in le}
+    modos.update((nome, True) for nome in escreve)
+    adquiridos = []
+    try:
+        for nome in sorted(modos):
+            lock = COLECOES_POR_NOME[nome].lock
+            inicio = time.perf_counter()
+            if modos[nome]:
+                lock.adquirir_escrita()
+            else:
+                lock.adquirir_leitura()
+            _registrar_espera(nome, modos[nome], time.perf_counter() - inicio)
+            adquiridos.append((lock, modos[nome]))
+        yield
+    finally:
+        for lock, escrita in reversed(adquiridos):
+            if escrita:
+                lock.liberar_escrita()
+            else:
+                lock.liberar_leitura()
+
+disco_lock = threading.RLock()
 
 def carregar_arquivo(nome, default=[]):
-    with dados_lock:
-        if os.path.exists(nome):
+    with disco_lock:
+        if not os.path.exists(nome):
+            return default
+        try:
+            with open(nome, "r", encoding="utf-8") as f:
+                conteudo = f.read()
+            if not conteudo.strip():
+                return default
+            return json.loads(conteudo)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            copia = f"{nome}.corrompido"
+            if os.path.exists(copia):
+                copia = f"{nome}.{time.strftime('%Y%m%d%H%M%S')}.corrompido"
+            os.replace(nome, copia)
+            log.warning(f"AVISO: Arquivo '{nome}' corrompido. Original preservado em '{copia}'. Iniciando com dados padrão.")
+            return default
+        except Exception as e:
+            log.error(f"ERRO ao ler {nome}: {e}")
+            raise
+
+def codificar_json(dados):
+    return json.dumps(dados, ensure_ascii=False, separators=(",", ":"), default=para_json).encode("utf-8")
+
+def gravar_atomico(nome, conteudo):
+    temporario = f"{nome}.tmp"
+    with open(temporario, "wb") as f:
+        f.write(conteudo)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, nome)
+    try:
+        pasta = os.open(os.path.dirname(os.path.abspath(nome)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(pasta)
+    except OSError:
+        pass
+    finally:
+        os.close(pasta)
+
+def para_json(valor):
+    if hasattr(valor, "para_dict"):
+        return valor.para_dict()
+    if isinstance(valor, array):
+        return valor.tolist()
+    if isinstance(valor, set):
+        return sorted(valor)
+    raise TypeError(f"Tipo {type(valor).__name__} não serializável")
+
+tempos_carga = {}
+
+@contextmanager
+def fase(nome):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tempos_carga[nome] = duracao = time.perf_counter() - inicio
+        log.info(f">> {nome}: {duracao:.2f}s")
+
+def assinar_arquivos():
+    assinatura = {}
+    for colecao in COLECOES:
+        try:
+            with open(colecao.arquivo, "rb") as f:
+                conteudo = f.read()
+        except FileNotFoundError:
+            assinatura[colecao.arquivo] = None
+            continue
+        assinatura[colecao.arquivo] = (len(conteudo), zlib.crc32(conteudo))
+    return assinatura
+
+class ArmazenamentoJSON:
+    nome = "json"
+    transacional = False
+
+    def __init__(self, snapshot=False):
+        self.pendente = []
+        self.sujas = set()
+        self.total = 0
+        self.enfileiradas = 0
+        self.gravadas = 0
+        self.condicao = threading.Condition(threading.Lock())
+        self.gravador = None
+        self.encerrando = False
+        self.snapshot = snapshot
+
+    def carregar(self, restaurado=False):
+        with self.condicao:
+            self.pendente.clear()
+            self.sujas.clear()
+            self.gravadas = self.enfileiradas
+        if not restaurado:
+            for colecao in COLECOES:
+                with fase(f"ler {colecao.arquivo}"):
+                    registros = carregar_arquivo(colecao.arquivo, [])
+                with fase(f"indexar {colecao.nome}"):
+                    colecao.carregar(registros)
+        with fase(f"reaplicar {ARQ_JOURNAL}"):
+            aplicadas, nomes = self.reaplicar()
+        self.total = aplicadas
+        with self.condicao:
+            self.sujas |= nomes
+        if aplicadas:
+            log.info(f">> {aplicadas} alteração(ões) reaplicada(s) do journal.")
+
+    def restaurar_snapshot(self):
+        if not self.snapshot or not os.path.exists(ARQ_SNAPSHOT):
+            return False
+        with fase(f"ler {ARQ_SNAPSHOT}"):
             try:
-                with open(nome, "r", encoding="utf-8") as f:
+                with open(ARQ_SNAPSHOT, "rb") as f:
+                    cabecalho = pickle.load(f)
+                    if cabecalho.get("versao") != VERSAO_SNAPSHOT or cabecalho.get("arquivos") != assinar_arquivos():
+                        log.info(f">> Snapshot '{ARQ_SNAPSHOT}' desatualizado. Carregando os arquivos .json.")
+                        return False
                     conteudo = f.read()
-                    if not conteudo:
-                        return default
-                    return json.loads(conteudo)
-            except json.JSONDecodeError:
-                print(f"AVISO: Arquivo '{nome}' corrompido ou vazio. Iniciando com dados padrão.")
-                return default
+                if zlib.crc32(conteudo) != cabecalho.get("crc"):
+                    raise ValueError("soma de verificação não confere")
+                restaurar_estado(pickle.loads(conteudo))
             except Exception as e:
-                print(f"ERRO ao ler {nome}: {e}")
-                return default
-        return default
+                log.warning(f"AVISO: Snapshot '{ARQ_SNAPSHOT}' ilegível ({e}). Carregando os arquivos .json.")
+                return False
+        return True
 
-def salvar_arquivo(nome, dados):
-    with dados_lock:
-        try:
-            with open(nome, "w", encoding="utf-8") as f:
-                json.dump(dados, f, ensure_ascii=False, indent=4)
-        except Exception as e:
-            print(f"ERRO CRÍTICO ao salvar {nome}: {e}")
+    def gravar_snapshot(self):
+        inicio = time.perf_counter()
+        with transacao(le=COLECOES_POR_NOME), disco_lock:
+            gc.disable()
+            try:
+                estado = pickle.dumps(capturar_estado(), protocol=pickle.HIGHEST_PROTOCOL)
+            finally:
+                gc.enable()
+            cabecalho = {"versao": VERSAO_SNAPSHOT, "arquivos": assinar_arquivos(), "crc": zlib.crc32(estado)}
+            try:
+                gravar_atomico(ARQ_SNAPSHOT, pickle.dumps(cabecalho, protocol=pickle.HIGHEST_PROTOCOL) + estado)
+            except OSError as e:
+                log.error(f"ERRO ao gravar snapshot '{ARQ_SNAPSHOT}': {e}")
+                return
+        log.info(f">> Snapshot gravado em '{ARQ_SNAPSHOT}' ({len(estado) / 2**20:.1f} MB, {time.perf_counter() - inicio:.2f}s).")
+
+    def confirmar_mudancas(self, mudancas):
+        for colecao, op, registro in mudancas:
+            self.registrar(colecao, op, registro)
+        self.confirmar()
+
+    def registrar(self, colecao, op, registro, delta=None):
+        entrada = {"c": colecao.nome, "op": op, "id": registro.id}
+        if delta:
+            entrada["op"] = "mod"
+            entrada["d"] = delta
+        elif op == "put":
+            entrada["r"] = registro
+        linha = json.dumps(entrada, ensure_ascii=False, default=para_json)
+        with self.condicao:
+            self.pendente.append(linha)
+            self.sujas.add(colecao.nome)
+            self.enfileiradas += 1
+
+    def confirmar(self):
+        with self.condicao:
+            if not self.pendente:
+                return
+            if self.gravador is None or not self.gravador.is_alive():
+                self.encerrando = False
+                self.gravador = threading.Thread(target=self._gravar_em_segundo_plano, name="gravador-journal", daemon=True)
+                self.gravador.start()
+            self.condicao.notify_all()
+
+    def descarregar(self):
+        with self.condicao:
+            alvo = self.enfileiradas
+            while self.gravadas < alvo and self.gravador is not None and self.gravador.is_alive():
+                self.condicao.wait()
+        if self.gravadas < alvo:
+            self._gravar_journal()
+
+    def _gravar_em_segundo_plano(self):
+        while True:
+            with self.condicao:
+                while not self.pendente and not self.encerrando:
+                    self.condicao.wait()
+                if not self.pendente:
+                    return
+                encerrando = self.encerrando
+            if not encerrando:
+                time.sleep(JANELA_GRAVACAO)
+            self._gravar_journal()
+            if self.precisa_compactar():
+                self._compactar_sujas()
+
+    def _gravar_journal(self):
+        with disco_lock:
+            with self.condicao:
+                linhas, self.pendente = self.pendente, []
+                alvo = self.enfileiradas
+            if linhas:
+                inicio = time.perf_counter()
+                try:
+                    with open(ARQ_JOURNAL, "a", encoding="utf-8") as f:
+                        f.write("\n".join(linhas) + "\n")
+                        f.flush()
+                        os.fsync(f.fileno())
+                except Exception as e:
+                    log.critical(f"ERRO CRÍTICO ao gravar journal: {e}")
+                    with self.condicao:
+                        self.pendente[:0] = linhas
+                        self.condicao.notify_all()
+                    return
+                self.total += len(linhas)
+                registrar_tempo("journal", time.perf_counter() - inicio)
+            with self.condicao:
+                self.gravadas = max(self.gravadas, alvo)
+                self.condicao.notify_all()
+
+    def precisa_compactar(self):
+        return self.total >= LIMITE_JOURNAL
+
+    def _compactar_sujas(self):
+        with transacao(le=COLECOES_POR_NOME):
+            self._gravar_journal()
+            with self.condicao:
+                nomes, self.sujas = self.sujas, set()
+            arquivos = [(c.arquivo, codificar_json(c.lista())) for c in COLECOES if c.nome in nomes]
+        self._substituir(arquivos, nomes)
+
+    def _substituir(self, arquivos, nomes):
+        with disco_lock:
+            try:
+                for nome, conteudo in arquivos:
+                    inicio = time.perf_counter()
+                    gravar_atomico(nome, conteudo)
+                    registrar_tempo("salvar_arquivo", time.perf_counter() - inicio)
+                open(ARQ_JOURNAL, "w", encoding="utf-8").close()
+                self.total = 0
+            except Exception as e:
+                log.critical(f"ERRO CRÍTICO ao compactar: {e}")
+                with self.condicao:
+                    self.sujas |= nomes
+
+    def reaplicar(self):
+        if not os.path.exists(ARQ_JOURNAL):
+            return 0, set()
+        aplicadas = 0
+        nomes = set()
+        posicao = 0
+        with open(ARQ_JOURNAL, "rb") as f:
+            for linha in f:
+                try:
+                    if not linha.endswith(b"\n"):
+                        raise ValueError("linha sem terminador")
+                    entrada = json.loads(linha) if linha.strip() else None
+                except ValueError:
+                    log.warning("AVISO: Entrada incompleta no fim do journal descartada.")
+                    break
+                posicao += len(linha)
+                if entrada is None:
+                    continue
+                colecao = COLECOES_POR_NOME.get(entrada.get("c"))
+                if not colecao:
+                    continue
+                nomes.add(colecao.nome)
+                if entrada["op"] == "put":
+                    colecao._colocar(colecao.tipo.de_dict(entrada["r"]))
+                elif entrada["op"] == "del":
+                    registro = colecao.buscar(entrada["id"])
+                    if registro:
+                        colecao._retirar(registro)
+                elif entrada["op"] == "mod":
+                    registro = colecao.buscar(entrada["id"])
+                    if registro:
+                        for nome, *args in entrada["d"]:
+                            APLICAR_DELTA[nome](registro, *args)
+                        colecao.deltas.pop(registro.id, None)
+                        colecao._marcar(registro.id)
+                aplicadas += 1
+        if posicao < os.path.getsize(ARQ_JOURNAL):
+            os.truncate(ARQ_JOURNAL, posicao)
+        return aplicadas, nomes
+
+    def fechar(self):
+        with self.condicao:
+            self.encerrando = True
+            self.condicao.notify_all()
+            gravador = self.gravador
+        if gravador is not None:
+            gravador.join()
+        self.descarregar()
+        if self.snapshot:
+            self.gravar_snapshot()
+
+ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS professores (id INTEGER PRIMARY KEY, nome TEXT, matricula TEXT, senha TEXT, extra TEXT);
+CREATE INDEX IF NOT EXISTS idx_professores_matricula ON professores(matricula);
+CREATE TABLE IF NOT EXISTS alunos (id INTEGER PRIMARY KEY, nome TEXT, matricula TEXT, extra TEXT);
+CREATE INDEX IF NOT EXISTS idx_alunos_matricula ON alunos(matricula);
+CREATE TABLE IF NOT EXISTS turmas (id INTEGER PRIMARY KEY, nome TEXT, atividades TEXT, extra TEXT);
+CREATE TABLE IF NOT EXISTS turma_alunos (
+    turma_id INTEGER NOT NULL REFERENCES turmas(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+    aluno_id INTEGER NOT NULL REFERENCES alunos(id) DEFERRABLE INITIALLY DEFERRED,
+    PRIMARY KEY (turma_id, aluno_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_turma_alunos_aluno ON turma_alunos(aluno_id);
+CREATE TABLE IF NOT EXISTS atividades (id INTEGER PRIMARY KEY, turma_id INTEGER REFERENCES turmas(id) DEFERRABLE INITIALLY DEFERRED, nome TEXT, descricao TEXT, extra TEXT);
+CREATE INDEX IF NOT EXISTS idx_atividades_turma ON atividades(turma_id);
+CREATE TABLE IF NOT EXISTS notas (
+    atividade_id INTEGER NOT NULL REFERENCES atividades(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+    aluno_id INTEGER NOT NULL REFERENCES alunos(id) DEFERRABLE INITIALLY DEFERRED,
+    nota REAL NOT NULL,
+    PRIMARY KEY (atividade_id, aluno_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_notas_aluno ON notas(aluno_id);
+"""
+
+COLUNAS_SQLITE = {
+    "professores": ("nome", "matricula", "senha"),
+    "alunos": ("nome", "matricula"),
+    "turmas": ("nome", "atividades"),
+    "atividades": ("turma_id", "nome", "descricao"),
+}
+FILHOS_SQLITE = {"turmas": "alunos", "atividades": "notas"}
 
-def salvar_tudo():
-    salvar_arquivo(ARQ_PROF, professores)
-    salvar_arquivo(ARQ_ALUN, alunos)
-    salvar_arquivo(ARQ_TURM, turmas)
-    salvar_arquivo(ARQ_ATIV, atividades)
+class ArmazenamentoSQLite:
+    nome = "sqlite"
+    transacional = True
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.conn = sqlite3.connect(caminho, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(ESQUEMA_SQLITE)
+
+    def vazio(self):
+        return all(self.conn.execute(f"SELECT 1 FROM {tabela} LIMIT 1").fetchone() is None for tabela in COLUNAS_SQLITE)
+
+    def _registros(self, tabela):
+        colunas = COLUNAS_SQLITE[tabela]
+        for linha in self.conn.execute(f"SELECT id, {', '.join(colunas)}, extra FROM {tabela} ORDER BY id"):
+            registro = {"id": linha[0]}
+            registro.update((c, json.loads(v) if c == "atividades" else v) for c, v in zip(colunas, linha[1:-1]))
+            registro.update(json.loads(linha[-1] or "{}"))
+            yield registro
+
+    def restaurar_snapshot(self):
+        return False
+
+    def carregar(self, restaurado=False):
+        log.info(f">> Carregando banco '{self.caminho}'...")
+        if self.vazio() and os.path.exists(ARQ_ALUN):
+            log.warning("AVISO: Banco vazio e arquivos .json presentes. Use --migrar para importá-los.")
+        with disco_lock:
+            matriculas = {}
+            for turma_id, aluno_id in self.conn.execute("SELECT turma_id, aluno_id FROM turma_alunos"):
+                matriculas.setdefault(turma_id, []).append(aluno_id)
+            notas = {}
+            for atividade_id, aluno_id, nota in self.conn.execute("SELECT atividade_id, aluno_id, nota FROM notas"):
+                notas.setdefault(atividade_id, {})[str(aluno_id)] = nota
+            for colecao in COLECOES:
+                with fase(f"ler {colecao.nome}"):
+                    registros = list(self._registros(colecao.nome))
+                    for r in registros:
+                        if colecao is turmas:
+                            r["alunos"] = matriculas.get(r["id"], [])
+                        elif colecao is atividades:
+                            r["notas"] = notas.get(r["id"], {})
+                with fase(f"indexar {colecao.nome}"):
+                    colecao.carregar(registros)
+                log.info(f">> {len(registros)} registro(s) em '{colecao.nome}'.")
+
+    def _gravar(self, tabela, registro):
+        colunas = COLUNAS_SQLITE[tabela]
+        filho = FILHOS_SQLITE.get(tabela)
+        valores = [json.dumps(registro.get(c, [])) if c == "atividades" else registro.get(c) for c in colunas]
+        extra = {k: v for k, v in registro.items() if k != "id" and k != filho and k not in colunas}
+        self.conn.execute(
+            f"INSERT INTO {tabela} (id, {', '.join(colunas)}, extra) VALUES ({', '.join('?' * (len(colunas) + 2))}) "
+            f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in colunas)}, extra = excluded.extra",
+            [registro["id"], *valores, json.dumps(extra, ensure_ascii=False, default=para_json) if extra else None])
+        if tabela == "turmas":
+            atuais = {a for (a,) in self.conn.execute("SELECT aluno_id FROM turma_alunos WHERE turma_id = ?", (registro["id"],))}
+            novos = set(registro.get("alunos", ()))
+            self.conn.executemany("DELETE FROM turma_alunos WHERE turma_id = ? AND aluno_id = ?",
+                                  [(registro["id"], a) for a in atuais - novos])
+            self.conn.executemany("INSERT INTO turma_alunos (turma_id, aluno_id) VALUES (?, ?)",
+                                  [(registro["id"], a) for a in novos - atuais])
+        elif tabela == "atividades":
+            atuais = dict(self.conn.execute("SELECT aluno_id, nota FROM notas WHERE atividade_id = ?", (registro["id"],)))
+            novas = {int(a): n for a, n in registro.get("notas", {}).items()}
+            self.conn.executemany("DELETE FROM notas WHERE atividade_id = ? AND aluno_id = ?",
+                                  [(registro["id"], a) for a in atuais.keys() - novas.keys()])
+            self.conn.executemany("INSERT INTO notas (atividade_id, aluno_id, nota) VALUES (?, ?, ?) "
+                                  "ON CONFLICT(atividade_id, aluno_id) DO UPDATE SET nota = excluded.nota",
+                                  [(registro["id"], a, n) for a, n in novas.items() if atuais.get(a) != n])
+
+    def _registrar(self, colecao, op, registro):
+        if op == "put":
+            self._gravar(colecao.nome, registro.para_dict())
+        else:
+            self.conn.execute(f"DELETE FROM {colecao.nome} WHERE id = ?", (registro.id,))
+
+    def registrar(self, colecao, op, registro, delta=None):
+        self.confirmar_mudancas([(colecao, op, registro)])
+
+    def confirmar_mudancas(self, mudancas):
+        with disco_lock:
+            inicio = time.perf_counter()
+            try:
+                for colecao, op, registro in mudancas:
+                    self._registrar(colecao, op, registro)
+                self.conn.commit()
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                log.error(f"ERRO ao gravar {len(mudancas)} alteração(ões) no banco, transação desfeita: {e}")
+                raise ErroArmazenamento(str(e))
+            registrar_tempo("commit_sqlite", time.perf_counter() - inicio)
+
+    def confirmar(self):
+        with disco_lock:
+            inicio = time.perf_counter()
+            try:
+                self.conn.commit()
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                log.critical(f"ERRO CRÍTICO ao confirmar transação no banco: {e}")
+                return
+            registrar_tempo("commit_sqlite", time.perf_counter() - inicio)
+
+    def descarregar(self):
+        self.confirmar()
+
+    def importar(self, colecoes):
+        with disco_lock:
+            self.conn.commit()
+            self.conn.execute("PRAGMA foreign_keys=OFF")
+            try:
+                with self.conn:
+                    for tabela in ("notas", "turma_alunos", "atividades", "turmas", "alunos", "professores"):
+                        self.conn.execute(f"DELETE FROM {tabela}")
+                    for colecao in colecoes:
+                        for registro in colecao:
+                            self._gravar(colecao.nome, registro.para_dict())
+                orfaos = self.conn.execute("PRAGMA foreign_key_check").fetchall()
+            finally:
+                self.conn.execute("PRAGMA foreign_keys=ON")
+            if orfaos:
+                log.warning(f"AVISO: {len(orfaos)} referência(s) a registros inexistentes foram migradas como estavam.")
+
+    def fechar(self):
+        with disco_lock:
+            self.conn.commit()
+            self.conn.close()
+
+armazenamento = ArmazenamentoJSON()
+
+def configurar_armazenamento(tipo, banco=ARQ_BANCO, snapshot=False):
+    global armazenamento
+    if tipo == "sqlite" and snapshot:
+        log.warning("AVISO: --snapshot só vale para o armazenamento json e será ignorado.")
+    armazenamento = ArmazenamentoSQLite(banco) if tipo == "sqlite" else ArmazenamentoJSON(snapshot)
+    return armazenamento
+
+lote_atual = threading.local()
+
+def registrar_mutacao(colecao, op, registro, delta=None):
+    if getattr(lote_atual, "desfazer", None) is None:
+        armazenamento.registrar(colecao, op, registro, delta)
+
+def persistir():
+    if getattr(lote_atual, "desfazer", None) is None:
+        armazenamento.confirmar()
+
+class Assinatura:
+    def __init__(self, colecoes):
+        self.colecoes = frozenset(colecoes)
+        self.pendentes = {}
+        self.lock = threading.Lock()
+        self.avisar = None
+        self.ativa = True
+
+    def adicionar(self, eventos):
+        with self.lock:
+            vazia = not self.pendentes
+            for evento in eventos:
+                if evento[0] in self.colecoes:
+                    anterior = self.pendentes.get(evento[:2])
+                    if anterior and anterior[2] == "inserido" and evento[2] == "atualizado":
+                        evento = evento[:2] + ("inserido", evento[3])
+                    self.pendentes[evento[:2]] = evento
+            if len(self.pendentes) > LIMITE_EVENTOS_PENDENTES:
+                self._resumir()
+            avisar = vazia and bool(self.pendentes)
+        if avisar:
+            self.avisar()
+
+    def _resumir(self):
+        ultimas = {}
+        for nome, _, _, versao in self.pendentes.values():
+            ultimas[nome] = max(versao, ultimas.get(nome, 0))
+        self.pendentes = {(nome, None): (nome, None, "recarregar", versao) for nome, versao in ultimas.items()}
+
+    def retirar(self):
+        with self.lock:
+            eventos = list(self.pendentes.values())
+            self.pendentes.clear()
+        return eventos
+
+    def cancelar(self):
+        self.ativa = False
+        if self.avisar: self.avisar()
+
+assinaturas = set()
+assinaturas_lock = threading.Lock()
+eventos_locais = threading.local()
+fila_eventos = queue.Queue()
+notificador = None
+publicacao_lock = threading.Lock()
+proxima_publicacao = itertools.count(1).__next__
+ultima_publicacao = 0
+canais_leitores = []
+canais_lock = threading.Lock()
+
+def anotar_evento(colecao, rid, criado):
+    op = "removido" if rid not in colecao.por_id else "inserido" if criado else "atualizado"
+    pendentes = getattr(eventos_locais, "pendentes", None)
+    if pendentes is None:
+        pendentes = eventos_locais.pendentes = []
+    pendentes.append((colecao.nome, rid, op, colecao.versao))
+
+def publicar_eventos():
+    global ultima_publicacao
+    pendentes = getattr(eventos_locais, "pendentes", None)
+    if pendentes:
+        eventos_locais.pendentes = None
+        with publicacao_lock:
+            eventos_locais.seq = ultima_publicacao = proxima_publicacao()
+            fila_eventos.put((ultima_publicacao, pendentes))
+
+def descartar_eventos():
+    eventos_locais.pendentes = None
+
+def notificar():
+    while True:
+        seq, eventos = fila_eventos.get()
+        if canais_leitores:
+            transmitir_mudancas(seq, eventos)
+        with assinaturas_lock:
+            ativas = list(assinaturas)
+        for assinatura in ativas:
+            try:
+                assinatura.adicionar(eventos)
+            except RuntimeError:
+                with assinaturas_lock:
+                    assinaturas.discard(assinatura)
+                assinatura.ativa = False
+
+def iniciar_notificador():
+    global notificador
+    with assinaturas_lock:
+        if notificador is None:
+            notificador = threading.Thread(target=notificar, name="notificador-eventos", daemon=True)
+            notificador.start()
+
+def registrar_assinatura(sessao, assinatura):
+    sessao["ligar_assinatura"](assinatura)
+    iniciar_notificador()
+    with assinaturas_lock:
+        assinaturas.add(assinatura)
+    sessao["assinatura"] = assinatura
+
+def cancelar_assinatura(sessao):
+    assinatura = sessao.pop("assinatura", None)
+    if assinatura is not None:
+        with assinaturas_lock:
+            assinaturas.discard(assinatura)
+        assinatura.cancelar()
+
+def quadro_eventos(eventos):
+    return enquadrar("EVENTO " + json.dumps([{"colecao": nome, "id": rid, "op": op, "versao": versao}
+                                              for nome, rid, op, versao in eventos], ensure_ascii=False))
+
+def entregar_em_thread(assinatura, enviar):
+    sinal = threading.Event()
+    assinatura.avisar = sinal.set
+    def entregar():
+        while True:
+            sinal.wait()
+            sinal.clear()
+            if not assinatura.ativa:
+                break
+            eventos = assinatura.retirar()
+            if eventos:
+                quadro = quadro_eventos(eventos)
+                try:
+                    enviar(quadro)
+                except OSError:
+                    break
+                registrar_bytes(0, len(quadro))
+    threading.Thread(target=entregar, name="entrega-eventos", daemon=True).start()
+
+def entregar_no_laco(assinatura, writer, loop):
+    def entregar():
+        if not assinatura.ativa or writer.is_closing():
+            return
+        if writer.transport.get_write_buffer_size() > LIMITE_BUFFER_EVENTOS:
+            loop.call_later(INTERVALO_REENVIO_EVENTOS, entregar)
+            return
+        eventos = assinatura.retirar()
+        if eventos:
+            quadro = quadro_eventos(eventos)
+            writer.write(quadro)
+            registrar_bytes(0, len(quadro))
+    assinatura.avisar = lambda: loop.call_soon_threadsafe(entregar)
+
+def transmitir_mudancas(seq, eventos):
+    chaves = dict.fromkeys((nome, rid) for nome, rid, _, _ in eventos)
+    with canais_lock:
+        with transacao(le={nome for nome, _ in chaves}):
+            quadro = enquadrar(pickle.dumps((seq, [(chave, COLECOES_POR_NOME[chave[0]].por_id.get(chave[1])) for chave in chaves]),
+                                            protocol=pickle.HIGHEST_PROTOCOL))
+        for canal in list(canais_leitores):
+            try:
+                canal.sendall(quadro)
+            except OSError:
+                canais_leitores.remove(canal)
+
+def alimentar_leitor(conn, addr):
+    iniciar_notificador()
+    with canais_lock:
+        with transacao(le=COLECOES_POR_NOME):
+            gc.disable()
+            try:
+                estado = pickle.dumps((ultima_publicacao, capturar_estado()), protocol=pickle.HIGHEST_PROTOCOL)
+            finally:
+                gc.enable()
+            canais_leitores.append(conn)
+        conn.sendall(enquadrar(estado))
+    log.info(f"[LEITOR] Processo leitor conectado: {addr} ({len(estado) / 2**20:.1f} MB de estado inicial)")
+    try:
+        while conn.recv(TAM_LEITURA):
+            pass
+    except OSError:
+        pass
+    with canais_lock:
+        if conn in canais_leitores:
+            canais_leitores.remove(conn)
+    log.info(f"[LEITOR] Processo leitor desconectado: {addr}")
+
+def aplicar_mudancas(mudancas):
+    with transacao(escreve={nome for (nome, _), _ in mudancas}):
+        for (nome, rid), registro in mudancas:
+            colecao = COLECOES_POR_NOME[nome]
+            if registro is not None:
+                colecao._colocar(registro)
+            elif rid in colecao.por_id:
+                colecao._retirar(colecao.por_id[rid])
 
 def carregar_tudo():
-    global professores, alunos, turmas, atividades
-    print(">> Carregando 'professores.json'...")
-    professores = carregar_arquivo(ARQ_PROF, [])
-    print(">> Carregando 'alunos.json'...")
-    alunos = carregar_arquivo(ARQ_ALUN, [])
-    print(">> Carregando 'turmas.json'...")
-    turmas = carregar_arquivo(ARQ_TURM, [])
-    print(">> Carregando 'atividades.json'...")
-    atividades = carregar_arquivo(ARQ_ATIV, [])
-    print(">> Verificando e salvando arquivos...")
-    salvar_tudo()
-
-def prox_id(lista):
-    ids = [int(x.get("id", 0)) for x in lista if str(x.get("id")).isdigit()]
-    return max(ids, default=0) + 1
+    global estatisticas_ativas
+    armazenamento.descarregar()
+    tempos_carga.clear()
+    inicio = time.perf_counter()
+    gc.disable()
+    try:
+        with disco_lock:
+            estatisticas_ativas = False
+            restaurado = armazenamento.restaurar_snapshot()
+            if not restaurado:
+                turmas_por_aluno.clear()
+                atividades_com_nota.clear()
+                atividades_por_turma.clear()
+            estatisticas_ativas = restaurado
+            armazenamento.carregar(restaurado)
+            if not restaurado:
+                with fase("estatísticas"):
+                    recalcular_estatisticas()
+                estatisticas_ativas = True
+    finally:
+        gc.enable()
+    gc.freeze()
+    tempos_carga["total"] = duracao = time.perf_counter() - inicio
+    log.info(f">> Dados carregados em {duracao:.2f}s (origem: {'snapshot' if restaurado else armazenamento.nome}).")
 
-def hash_senha(senha):
-    return hashlib.sha256(senha.encode()).hexdigest()
+def migrar_para_sqlite(banco=ARQ_BANCO):
+    configurar_armazenamento("json")
+    carregar_tudo()
+    destino = ArmazenamentoSQLite(banco)
+    destino.importar(COLECOES)
+    destino.fechar()
+    log.info(f">> Migração concluída: {sum(len(c) for c in COLECOES)} registro(s) gravados em '{banco}'.")
 
-def buscar_professor_por_id(pid):
+NOMES_TIPOS = {int: "um número inteiro", float: "um número", str: "um texto", dict: "um objeto JSON", list: "uma lista JSON"}
+
+class ErroArgumento(Exception):
+    pass
+
+class Arg:
+    def __init__(self, nome, tipo=str, obrigatorio=True, minimo=None, maximo=None, rotulo=None):
+        self.nome = nome
+        self.tipo = tipo
+        self.obrigatorio = obrigatorio
+        self.minimo = minimo
+        self.maximo = maximo
+        self.rotulo = rotulo or f"Campo '{nome}'"
+
+    def converter(self, valor):
+        if valor is None or (isinstance(valor, str) and not valor.strip()):
+            if self.obrigatorio:
+                raise ErroArgumento(f"❌ ERRO: Campo '{self.nome}' é obrigatório.")
+            return None
+        try:
+            if self.tipo is float and isinstance(valor, str):
+                valor = valor.replace(",", ".")
+            elif self.tipo in (dict, list) and isinstance(valor, str):
+                valor = json.loads(valor)
+            if self.tipo is list and not isinstance(valor, list):
+                raise TypeError
+            valor = self.tipo(valor)
+        except (TypeError, ValueError):
+            raise ErroArgumento(f"❌ ERRO: {self.rotulo} deve ser {NOMES_TIPOS[self.tipo]}.")
+        if (self.minimo is not None and not self.minimo <= valor) or (self.maximo is not None and not valor <= self.maximo):
+            if self.maximo is None:
+                raise ErroArgumento(f"❌ ERRO: {self.rotulo} deve ser no mínimo {self.minimo:g}.")
+            if self.minimo is None:
+                raise ErroArgumento(f"❌ ERRO: {self.rotulo} deve ser no máximo {self.maximo:g}.")
+            raise ErroArgumento(f"❌ ERRO: {self.rotulo} deve ser entre {self.minimo:g} e {self.maximo:g}.")
+        return valor
+
+    def descrever(self):
+        return {"nome": self.nome, "tipo": self.tipo.__name__, "obrigatorio": self.obrigatorio,
+                "minimo": self.minimo, "maximo": self.maximo}
+
+class Comando:
+    def __init__(self, acao, funcao, args, publico=False, com_sessao=False, aliases=(), le=(), escreve=(), em_cache=False):
+        self.acao = acao
+        self.funcao = funcao
+        self.args = args
+        self.publico = publico
+        self.com_sessao = com_sessao
+        self.aliases = aliases
+        self.le = le
+        self.escreve = escreve
+        self.em_cache = em_cache
+
+    def liberado(self):
+        return self.publico() if callable(self.publico) else self.publico
+
+    def converter(self, dados):
+        if isinstance(dados, dict):
+            brutos = [dados.get(arg.nome) for arg in self.args]
+        else:
+            brutos = dados.split(";", len(self.args) - 1) if self.args and dados else []
+            brutos += [None] * (len(self.args) - len(brutos))
+        return [arg.converter(valor) for arg, valor in zip(self.args, brutos)]
+
+    def descrever(self):
+        return {"acao": self.acao, "argumentos": [arg.descrever() for arg in self.args],
+                "publico": self.liberado(), "aliases": list(self.aliases),
+                "le": list(self.le), "escreve": list(self.escreve), "em_cache": self.em_cache}
+
+COMANDOS = {}
+ARG_NOTA = Arg("nota", float, minimo=0.0, maximo=10.0, rotulo="Nota")
+ARGS_PAGINA = (Arg("offset", int, obrigatorio=False, minimo=0), Arg("limit", int, obrigatorio=False, minimo=1, maximo=LIMITE_PAGINA),
+               Arg("cursor", obrigatorio=False), Arg("campos", obrigatorio=False), Arg("ordenar", obrigatorio=False),
+               Arg("filtro", dict, obrigatorio=False))
+ARG_LIMITE_BUSCA = Arg("limite", int, obrigatorio=False, minimo=1, maximo=LIMITE_PAGINA, rotulo="Limite")
+
+def comando(acao, *args, publico=False, com_sessao=False, aliases=(), le=(), escreve=(), em_cache=False):
+    def registrar(funcao):
+        cmd = Comando(acao, funcao, args, publico, com_sessao, aliases, le, escreve, em_cache)
+        COMANDOS[acao] = cmd
+        for alias in aliases:
+            COMANDOS[alias] = cmd
+        return funcao
+    return registrar
+
+cache_respostas = {}
+
+def resposta_em_cache(cmd, valores):
+    versoes = tuple(COLECOES_POR_NOME[nome].versao for nome in sorted(cmd.le))
+    chave = (cmd.acao, *valores)
+    guardada = cache_respostas.get(chave)
+    if guardada and guardada[0] == versoes:
+        return guardada[1]
+    resposta = cmd.funcao(*valores)
+    if isinstance(resposta, str):
+        resposta = resposta.encode("utf-8")
+    cache_respostas[chave] = (versoes, resposta)
+    return resposta
+
+def _chave_ordenacao(valor):
+    if valor is None:
+        return (2, "")
+    if isinstance(valor, str):
+        return (1, valor.lower())
+    return (0, valor)
+
+def _combina(valor, esperado):
+    if isinstance(valor, str) and isinstance(esperado, str):
+        return esperado.lower() in valor.lower()
+    return valor == esperado
+
+def _gerar_cursor(ordenar, chave):
+    return base64.urlsafe_b64encode(json.dumps([ordenar, chave]).encode("utf-8")).decode("ascii")
+
+def _ler_cursor(cursor, ordenar):
     try:
-        pid_int = int(pid)
-        return next((p for p in professores if p["id"] == pid_int), None)
-    except ValueError:
+        ordem, ((rank, valor), rid) = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError):
+        return None
+    if ordem != ordenar or type(rank) is not int or type(rid) is not int or rank not in (0, 1, 2):
+        return None
+    if isinstance(valor, bool) or not isinstance(valor, (int, float) if rank == 0 else str):
         return None
+    return ((rank, valor), rid)
+
+def paginar(linhas, offset=None, limit=None, cursor=None, campos=None, ordenar=None, filtro=None):
+    linhas = list(linhas)
+    if all(v is None for v in (offset, limit, cursor, campos, ordenar, filtro)):
+        return json.dumps(linhas)
+    ordenar = ordenar or "id"
+    campo_ordem = ordenar.lstrip("-")
+    lista_campos = ["id"] + [c.strip() for c in campos.split(",") if c.strip() and c.strip() != "id"] if campos else None
+    if linhas:
+        for nome in [campo_ordem, *(lista_campos or ()), *(filtro or {})]:
+            if nome not in linhas[0]:
+                return f"❌ ERRO: Campo '{nome}' inválido."
+    if filtro:
+        linhas = [l for l in linhas if all(_combina(l.get(c), v) for c, v in filtro.items())]
+    linhas.sort(key=lambda l: (_chave_ordenacao(l.get(campo_ordem)), l["id"]))
+    chaves = [(_chave_ordenacao(l.get(campo_ordem)), l["id"]) for l in linhas]
+    decrescente = ordenar.startswith("-")
+    if cursor is not None:
+        marca = _ler_cursor(cursor, ordenar)
+        if marca is None: return "❌ ERRO: Cursor inválido."
+        inicio = len(linhas) - bisect.bisect_left(chaves, marca) if decrescente else bisect.bisect_right(chaves, marca)
+    else:
+        inicio = offset or 0
+    if decrescente:
+        linhas.reverse()
+        chaves.reverse()
+    fim = inicio + (limit or PAGINA_PADRAO)
+    pagina = linhas[inicio:fim]
+    if lista_campos:
+        pagina = [{c: l.get(c) for c in lista_campos} for l in pagina]
+    proximo = _gerar_cursor(ordenar, chaves[fim - 1]) if fim < len(linhas) else None
+    return json.dumps({"itens": pagina, "total": len(linhas), "offset": inicio, "proximo_cursor": proximo})
+
+def buscar_professor_por_id(pid):
+    return professores.buscar(pid)
 
 def buscar_aluno_por_id(aid):
-    try:
-        aid_int = int(aid)
-        return next((a for a in alunos if a["id"] == aid_int), None)
-    except ValueError:
-        return None
+    return alunos.buscar(aid)
 
 def buscar_turma_por_id(tid):
-    try:
-        tid_int = int(tid)
-        return next((t for t in turmas if t["id"] == tid_int), None)
-    except ValueError:
-        return None
+    return turmas.buscar(tid)
 
 def buscar_atividade_por_id(aid):
+    return atividades.buscar(aid)
+
+class ErroLogin(Exception):
+    pass
+
+cadastro_aberto = False
+
+pool_login = ThreadPoolExecutor(max_workers=WORKERS_LOGIN, thread_name_prefix="pim-login")
+vagas_login = threading.BoundedSemaphore(FILA_LOGIN)
+tentativas_login = {}
+tentativas_lock = threading.Lock()
+hash_ficticio = None
+
+def hash_senha(senha):
+    sal = os.urandom(16)
+    chave = hashlib.scrypt(senha.encode(), salt=sal, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${base64.b64encode(sal).decode()}${base64.b64encode(chave).decode()}"
+
+def verificar_senha(senha, armazenado):
+    if not armazenado.startswith("scrypt$"):
+        return hmac.compare_digest(hashlib.sha256(senha.encode()).hexdigest(), armazenado), True
     try:
-        aid_int = int(aid)
-        return next((a for a in atividades if a["id"] == aid_int), None)
+        _, n, r, p, sal, chave = armazenado.split("$")
+        n, r, p, chave = int(n), int(r), int(p), base64.b64decode(chave)
+        calculada = hashlib.scrypt(senha.encode(), salt=base64.b64decode(sal), n=n, r=r, p=p, dklen=len(chave))
     except ValueError:
-        return None
+        return False, False
+    return hmac.compare_digest(calculada, chave), (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+def calcular_senha(funcao, *args):
+    if not vagas_login.acquire(blocking=False):
+        raise ErroLogin("❌ ERRO: Servidor ocupado com outros logins. Tente novamente em instantes.")
+    try:
+        return pool_login.submit(funcao, *args).result()
+    finally:
+        vagas_login.release()
+
+class ArgSenha(Arg):
+    def converter(self, valor):
+        senha = super().converter(valor)
+        if senha is None:
+            return None
+        try:
+            return calcular_senha(hash_senha, senha)
+        except ErroLogin as e:
+            raise ErroArgumento(str(e))
+
+def _falhas_recentes(chave, agora):
+    falhas = tentativas_login.get(chave)
+    while falhas and falhas[0] <= agora - JANELA_TENTATIVAS:
+        falhas.popleft()
+    return falhas
+
+def verificar_bloqueio(matricula):
+    with tentativas_lock:
+        agora = time.monotonic()
+        falhas = _falhas_recentes(matricula.lower(), agora)
+        if falhas and len(falhas) >= LIMITE_TENTATIVAS:
+            espera = int(falhas[0] + JANELA_TENTATIVAS - agora) + 1
+            raise ErroLogin(f"❌ ERRO: Muitas tentativas para esta matrícula. Aguarde {espera} s.")
+
+def registrar_tentativa(matricula, sucesso):
+    with tentativas_lock:
+        chave = matricula.lower()
+        if sucesso:
+            tentativas_login.pop(chave, None)
+            return
+        tentativas_login.setdefault(chave, deque(maxlen=LIMITE_TENTATIVAS)).append(time.monotonic())
+        if len(tentativas_login) > MAX_MATRICULAS_VIGIADAS:
+            agora = time.monotonic()
+            for outra in [c for c in tentativas_login if not _falhas_recentes(c, agora)]:
+                del tentativas_login[outra]
 
 def login_professor(matricula, senha_plana):
-    senha_hash = hash_senha(senha_plana)
-    for p in professores:
-        if p["matricula"] == matricula and p["senha"] == senha_hash:
-            print(f"[Log Servidor] Login bem-sucedido para: {p['nome']}")
-            return p
-    print(f"[Log Servidor] Tentativa de login falhou para matrícula: {matricula}")
-    return None
-
-def listar_professores():
-    if not professores: return json.dumps([])
-    return json.dumps(professores)
-
-def cadastrar_professor(nome, matricula, senha_plana):
-    if any(p["matricula"].lower() == matricula.lower() for p in professores):
+    global hash_ficticio
+    verificar_bloqueio(matricula)
+    with transacao(le=("professores",)):
+        p = professores.buscar_por("matricula", matricula)
+        if p and p.matricula != matricula: p = None
+        armazenado = p.senha if p else None
+    if armazenado is None and hash_ficticio is None:
+        hash_ficticio = calcular_senha(hash_senha, "")
+    ok, migrar = calcular_senha(verificar_senha, senha_plana, armazenado if armazenado is not None else hash_ficticio)
+    ok = ok and p is not None
+    registrar_tentativa(matricula, ok)
+    if not ok:
+        log.info(f"[Log Servidor] Tentativa de login falhou para matrícula: {matricula}")
+        return None
+    if migrar:
+        try:
+            novo = calcular_senha(hash_senha, senha_plana)
+        except ErroLogin:
+            novo = None
+        if novo:
+            with transacao(escreve=("professores",)):
+                if professores.por_id.get(p.id) is p and p.senha == armazenado:
+                    executar_transacional(_migrar_senha, p, novo)
+    log.info(f"[Log Servidor] Login bem-sucedido para: {p.nome}")
+    return p
+
+def _migrar_senha(p, novo):
+    professores.atualizar(p, senha=novo)
+    persistir()
+    log.info(f"[Log Servidor] Senha de {p.nome} migrada para scrypt")
+
+@comando("login_professor", Arg("matricula", rotulo="Matrícula"), Arg("senha", rotulo="Senha"), publico=True, com_sessao=True)
+def entrar(sessao, matricula, senha):
+    try:
+        prof = login_professor(matricula, senha)
+    except ErroLogin as e:
+        return str(e)
+    if not prof:
+        return "❌ ERRO: Matrícula ou senha inválida."
+    if sessao is not None:
+        sessao["usuario"] = prof
+    return f"SUCESSO_LOGIN:{prof.nome}"
+
+SESSAO_ENCERRADA = "✅ Sessão encerrada."
+
+@comando("logout", publico=True, com_sessao=True)
+def sair(sessao):
+    if sessao is not None:
+        sessao["usuario"] = None
+        cancelar_assinatura(sessao)
+    return SESSAO_ENCERRADA
+
+@comando("listar_comandos", publico=True)
+def listar_comandos():
+    return json.dumps([cmd.descrever() for acao, cmd in COMANDOS.items() if acao == cmd.acao], ensure_ascii=False)
+
+def _linha_professor(p):
+    return {"id": p.id, "nome": p.nome, "matricula": p.matricula, **(p.extra or {})}
+
+@comando("listar_professores", *ARGS_PAGINA, le=("professores",), em_cache=True)
+def listar_professores(*pagina):
+    return paginar(map(_linha_professor, professores), *pagina)
+
+@comando("buscar_professor", Arg("query", rotulo="Busca"), ARG_LIMITE_BUSCA, le=("professores",))
+def buscar_professor(query, limite):
+    encontrados = [_linha_professor(professores.por_id[pid]) for pid in professores.busca.buscar(query, limite or LIMITE_BUSCA)]
+    return json.dumps(encontrados)
+
+@comando("cadastrar_professor", Arg("nome"), Arg("matricula", rotulo="Matrícula"), ArgSenha("senha", rotulo="Senha"),
+         publico=lambda: cadastro_aberto, escreve=("professores",))
+def cadastrar_professor(nome, matricula, senha):
+    if professores.buscar_por("matricula", matricula):
         return "❌ ERRO: Matrícula já cadastrada."
-    pid = prox_id(professores)
-    professores.append({"id": pid, "nome": nome, "matricula": matricula, "senha": hash_senha(senha_plana)})
-    salvar_arquivo(ARQ_PROF, professores)
-    print(f"[Log Servidor] Professor cadastrado: {nome}")
+    professores.inserir(Professor(None, nome, matricula, senha))
+    persistir()
+    log.info(f"[Log Servidor] Professor cadastrado: {nome}")
     return "✅ Professor cadastrado."
-def editar_professor(pid_str, novo_nome, nova_mat, nova_senha_plana):
-    p = buscar_professor_por_id(pid_str)
+@comando("editar_professor", Arg("id", int), Arg("nome", obrigatorio=False), Arg("matricula", obrigatorio=False), ArgSenha("senha", obrigatorio=False), escreve=("professores",))
+def editar_professor(pid, novo_nome, nova_mat, nova_senha):
+    p = buscar_professor_por_id(pid)
     if not p: return "❌ ERRO: Professor não encontrado."
-    if novo_nome: p["nome"] = novo_nome
-    if nova_mat: p["matricula"] = nova_mat
-    if nova_senha_plana: p["senha"] = hash_senha(nova_senha_plana)
-    salvar_arquivo(ARQ_PROF, professores)
-    print(f"[Log Servidor] Professor editado: ID {pid_str}")
+    outro = professores.buscar_por("matricula", nova_mat)
+    if outro and outro is not p: return "❌ ERRO: Matrícula já cadastrada."
+    campos = {}
+    if novo_nome: campos["nome"] = novo_nome
+    if nova_mat: campos["matricula"] = nova_mat
+    if nova_senha: campos["senha"] = nova_senha
+    professores.atualizar(p, **campos)
+    persistir()
+    log.info(f"[Log Servidor] Professor editado: ID {pid}")
     return "✅ Professor atualizado."
 
-def remover_professor(pid_str):
-    p = buscar_professor_por_id(pid_str)
+@comando("remover_professor", Arg("id", int), escreve=("professores",))
+def remover_professor(pid):
+    p = buscar_professor_por_id(pid)
     if not p: return "❌ ERRO: Professor não encontrado."
-    professores.remove(p)
-    salvar_arquivo(ARQ_PROF, professores)
-    print(f"[Log Servidor] Professor removido: {p['nome']}")
+    professores.remover(p)
+    persistir()
+    log.info(f"[Log Servidor] Professor removido: {p.nome}")
     return "✅ Professor removido."
 
-def listar_alunos():
-    if not alunos: return json.dumps([])
-    return json.dumps(alunos)
+@comando("listar_alunos", *ARGS_PAGINA, le=("alunos",), em_cache=True)
+def listar_alunos(*pagina):
+    return paginar(map(_linha_registro, alunos), *pagina)
 
+@comando("cadastrar_aluno", Arg("nome"), Arg("matricula", rotulo="Matrícula"), escreve=("alunos",))
 def cadastrar_aluno(nome, matricula):
-    if any(x["matricula"].lower() == matricula.lower() for x in alunos):
+    if alunos.buscar_por("matricula", matricula):
         return "❌ ERRO: Matrícula já cadastrada."
-    aid = prox_id(alunos)
-    alunos.append({"id": aid, "nome": nome, "matricula": matricula})
-    salvar_arquivo(ARQ_ALUN, alunos)
-    print(f"[Log Servidor] Aluno cadastrado: {nome}")
+    alunos.inserir(Aluno(None, nome, matricula))
+    persistir()
+    log.info(f"[Log Servidor] Aluno cadastrado: {nome}")
     return "✅ Aluno cadastrado."
 
-def editar_aluno(aid_str, novo_nome, nova_mat):
-    a = buscar_aluno_por_id(aid_str)
+@comando("editar_aluno", Arg("id", int), Arg("nome", obrigatorio=False), Arg("matricula", obrigatorio=False), escreve=("alunos",))
+def editar_aluno(aid, novo_nome, nova_mat):
+    a = buscar_aluno_por_id(aid)
     if not a: return "❌ ERRO: Aluno não encontrado."
-    if novo_nome: a['nome'] = novo_nome
-    if nova_mat: a['matricula'] = nova_mat
-    salvar_arquivo(ARQ_ALUN, alunos)
-    print(f"[Log Servidor] Aluno editado: ID {aid_str}")
+    outro = alunos.buscar_por("matricula", nova_mat)
+    if outro and outro is not a: return "❌ ERRO: Matrícula já cadastrada."
+    campos = {}
+    if novo_nome: campos['nome'] = novo_nome
+    if nova_mat: campos['matricula'] = nova_mat
+    alunos.atualizar(a, **campos)
+    persistir()
+    log.info(f"[Log Servidor] Aluno editado: ID {aid}")
     return "✅ Aluno atualizado."
 
-def remover_aluno(aid_str):
-    a = buscar_aluno_por_id(aid_str)
+@comando("remover_aluno", Arg("id", int), escreve=("alunos", "turmas", "atividades"))
+def remover_aluno(aid):
+    a = buscar_aluno_por_id(aid)
     if not a: return "❌ ERRO: Aluno não encontrado."
-    aid = a['id']
-    for t in turmas:
-        if aid in t.get("alunos", []):
-            t["alunos"].remove(aid)
-    for atv in atividades:
-        if str(aid) in atv.get("notas", {}):
-            del atv["notas"][str(aid)]
-    alunos.remove(a)
-    salvar_tudo()
-    print(f"[Log Servidor] Aluno removido: {a['nome']}")
+    aid = a.id
+    for tid in list(turmas_por_aluno.get(aid, ())):
+        t = turmas.por_id[tid]
+        _desvincular_aluno(t, aid)
+        turmas.atualizar(t)
+    for atv_id in list(atividades_com_nota.get(aid, ())):
+        atv = atividades.por_id[atv_id]
+        _apagar_nota(atv, aid)
+        atividades.atualizar(atv)
+    alunos.remover(a)
+    persistir()
+    log.info(f"[Log Servidor] Aluno removido: {a.nome}")
     return "✅ Aluno removido."
 
-def buscar_aluno(query):
-    encontrados = [a for a in alunos if query in a["nome"].lower() or query in a["matricula"].lower()]
+@comando("buscar_aluno", Arg("query", rotulo="Busca"), ARG_LIMITE_BUSCA, le=("alunos",))
+def buscar_aluno(query, limite):
+    encontrados = [_linha_registro(alunos.por_id[aid]) for aid in alunos.busca.buscar(query, limite or LIMITE_BUSCA)]
     return json.dumps(encontrados)
 
-def ver_turmas_do_aluno(aid_str):
-    a = buscar_aluno_por_id(aid_str)
+@comando("ver_turmas_do_aluno", Arg("id", int), le=("alunos", "turmas"))
+def ver_turmas_do_aluno(aid):
+    a = buscar_aluno_por_id(aid)
     if not a: return "❌ ERRO: Aluno não encontrado."
-    aid = a['id']
-    turmas_do_aluno = [t for t in turmas if aid in t.get("alunos", [])]
+    turmas_do_aluno = [turmas.por_id[tid] for tid in turmas_por_aluno.get(a.id, ())]
     if not turmas_do_aluno:
         return "Aluno não está matriculado em nenhuma turma."
-    turmas_info = [{"id": t["id"], "nome": t["nome"]} for t in turmas_do_aluno]
+    turmas_info = [{"id": t.id, "nome": t.nome} for t in turmas_do_aluno]
     return json.dumps(turmas_info)
 
-def listar_turmas():
-    if not turmas: return json.dumps([])
-    lista = []
-    for t in turmas:
-        lista.append({
-            "id": t.get('id', 0),
-            "nome": t.get('nome', 'N/D'),
-            "alunos": len(t.get('alunos', [])),
-            "atividades": len(t.get('atividades', []))
-        })
-    return json.dumps(lista)
+def _linha_turma(t):
+    return {
+        "id": t.id,
+        "nome": t.nome,
+        "alunos": len(t.alunos),
+        "atividades": len(t.atividades)
+    }
+
+@comando("listar_turmas", *ARGS_PAGINA, le=("turmas",), em_cache=True)
+def listar_turmas(*pagina):
+    return paginar(map(_linha_turma, turmas), *pagina)
 
+@comando("cadastrar_turma", Arg("nome"), escreve=("turmas",))
 def cadastrar_turma(nome):
-    tid = prox_id(turmas)
-    turmas.append({"id": tid, "nome": nome, "alunos": [], "atividades": []})
-    salvar_arquivo(ARQ_TURM, turmas)
-    print(f"[Log Servidor] Turma cadastrada: {nome}")
+    turmas.inserir(Turma(None, nome, array("i"), array("i")))
+    persistir()
+    log.info(f"[Log Servidor] Turma cadastrada: {nome}")
     return "✅ Turma cadastrada."
 
-def editar_turma(tid_str, novo_nome):
-    t = buscar_turma_por_id(tid_str)
+@comando("editar_turma", Arg("id", int), Arg("nome", obrigatorio=False), escreve=("turmas",))
+def editar_turma(tid, novo_nome):
+    t = buscar_turma_por_id(tid)
     if not t: return "❌ ERRO: Turma não encontrada."
-    if novo_nome: t['nome'] = novo_nome
-    salvar_arquivo(ARQ_TURM, turmas)
-    print(f"[Log Servidor] Turma editada: ID {tid_str}")
+    if novo_nome: turmas.atualizar(t, nome=novo_nome)
+    persistir()
+    log.info(f"[Log Servidor] Turma editada: ID {tid}")
     return "✅ Turma atualizada."
 
-def remover_turma(tid_str):
-    t = buscar_turma_por_id(tid_str)
+@comando("remover_turma", Arg("id", int), escreve=("turmas", "atividades"))
+def remover_turma(tid):
+    t = buscar_turma_por_id(tid)
     if not t: return "❌ ERRO: Turma não encontrada."
-    tid = t['id']
-    atv_to_remove = [a for a in atividades if a.get("turma_id") == tid]
-    for a in atv_to_remove:
-        atividades.remove(a)
-    turmas.remove(t)
-    salvar_tudo()
-    print(f"[Log Servidor] Turma removida: {t['nome']}")
+    for atv_id in list(atividades_por_turma.get(t.id, ())):
+        atividades.remover(atividades.por_id[atv_id])
+    turmas.remover(t)
+    persistir()
+    log.info(f"[Log Servidor] Turma removida: {t.nome}")
     return "✅ Turma e atividades associadas removidas."
-def ver_alunos_da_turma(tid_str):
-    t = buscar_turma_por_id(tid_str)
+@comando("ver_alunos_da_turma", Arg("id", int), *ARGS_PAGINA, le=("turmas", "alunos"))
+def ver_alunos_da_turma(tid, *pagina):
+    t = buscar_turma_por_id(tid)
     if not t: return "❌ ERRO: Turma não encontrada."
-    if not t.get("alunos"): return "Nenhum aluno matriculado nesta turma."
+    paginado = any(v is not None for v in pagina)
+    if not t.alunos and not paginado: return "Nenhum aluno matriculado nesta turma."
     lista_alunos_turma = []
-    for aid in t["alunos"]:
+    for aid in t.alunos:
         a = buscar_aluno_por_id(aid)
         if a:
-            lista_alunos_turma.append({"id": a['id'], "matricula": a['matricula'], "nome": a['nome']})
-    return json.dumps(lista_alunos_turma)
+            lista_alunos_turma.append({"id": a.id, "matricula": a.matricula, "nome": a.nome})
+    return paginar(lista_alunos_turma, *pagina)
 
-def ver_atividades_da_turma(tid_str):
-    t = buscar_turma_por_id(tid_str)
+@comando("ver_atividades_da_turma", Arg("id", int), le=("turmas", "atividades"))
+def ver_atividades_da_turma(tid):
+    t = buscar_turma_por_id(tid)
     if not t: return "❌ ERRO: Turma não encontrada."
-    if not t.get("atividades"): return "Nenhuma atividade nesta turma."
+    if not t.atividades: return "Nenhuma atividade nesta turma."
     lista_atv_turma = []
-    for aid in t["atividades"]:
+    for aid in t.atividades:
         atv = buscar_atividade_por_id(aid)
         if atv:
-            lista_atv_turma.append({"id": atv['id'], "nome": atv['nome'], "descricao": atv.get("descricao", "")})
+            lista_atv_turma.append({"id": atv.id, "nome": atv.nome, "descricao": atv.descricao})
     return json.dumps(lista_atv_turma)
 
-def matricular_aluno_em_turma(aid_str, tid_str):
-    a = buscar_aluno_por_id(aid_str)
-    t = buscar_turma_por_id(tid_str)
+@comando("matricular_aluno", Arg("aluno_id", int), Arg("turma_id", int), aliases=("matricular_aluno_em_turma",), le=("alunos",), escreve=("turmas",))
+def matricular_aluno_em_turma(aid, tid):
+    a = buscar_aluno_por_id(aid)
+    t = buscar_turma_por_id(tid)
     if not a: return "❌ ERRO: Aluno não encontrado."
     if not t: return "❌ ERRO: Turma não encontrada."
-    aid = a['id']
-    if aid in t.get("alunos", []): return "Aluno já matriculado."
-    t["alunos"].append(aid)
-    salvar_arquivo(ARQ_TURM, turmas)
-    print(f"[Log Servidor] Aluno {a['nome']} matriculado na {t['nome']}")
+    aid = a.id
+    if t.tem_aluno(aid): return "Aluno já matriculado."
+    _vincular_aluno(t, aid)
+    turmas.atualizar(t)
+    persistir()
+    log.info(f"[Log Servidor] Aluno {a.nome} matriculado na {t.nome}")
     return "✅ Matriculado com sucesso."
 
-def desmatricular_aluno(tid_str, aid_str):
-    t = buscar_turma_por_id(tid_str)
-    a = buscar_aluno_por_id(aid_str)
+@comando("desmatricular_aluno", Arg("turma_id", int), Arg("aluno_id", int), le=("alunos",), escreve=("turmas", "atividades"))
+def desmatricular_aluno(tid, aid):
+    t = buscar_turma_por_id(tid)
+    a = buscar_aluno_por_id(aid)
     if not t: return "❌ ERRO: Turma não encontrada."
     if not a: return "❌ ERRO: Aluno não encontrado."
-    aid = a['id']
-    if aid not in t.get("alunos", []): return "❌ ERRO: Aluno não está matriculado nessa turma."
-    t["alunos"].remove(aid)
-    for atv_id in list(t.get("atividades", [])):
-        atv = buscar_atividade_por_id(atv_id)
-        if atv and str(aid) in atv.get("notas", {}):
-            del atv["notas"][str(aid)]
-    salvar_tudo()
-    print(f"[Log Servidor] Aluno ID {aid} desmatriculado da {t['nome']}")
+    aid = a.id
+    if not t.tem_aluno(aid): return "❌ ERRO: Aluno não está matriculado nessa turma."
+    _desvincular_aluno(t, aid)
+    turmas.atualizar(t)
+    for atv_id in list(atividades_com_nota.get(aid, ())):
+        atv = atividades.por_id[atv_id]
+        if atv.turma_id == t.id:
+            _apagar_nota(atv, aid)
+            atividades.atualizar(atv)
+    persistir()
+    log.info(f"[Log Servidor] Aluno ID {aid} desmatriculado da {t.nome}")
     return "✅ Desmatriculado."
 
-def listar_atividades():
-    if not atividades: return json.dumps([])
-    lista = []
-    for a in atividades:
-        t = buscar_turma_por_id(a.get("turma_id"))
-        lista.append({
-            "id": a.get('id', 0),
-            "nome": a.get('nome', 'N/D'),
-            "turma_nome": t["nome"] if t else "N/D",
-            "descricao": a.get("descricao", "")
-        })
-    return json.dumps(lista)
+def _linha_atividade(a):
+    t = buscar_turma_por_id(a.turma_id)
+    return {
+        "id": a.id,
+        "nome": a.nome,
+        "turma_id": a.turma_id,
+        "turma_nome": t.nome if t else "N/D",
+        "descricao": a.descricao
+    }
 
-def cadastrar_atividade(tid_str, nome, descricao):
-    t = buscar_turma_por_id(tid_str)
+@comando("listar_atividades", *ARGS_PAGINA, le=("atividades", "turmas"), em_cache=True)
+def listar_atividades(*pagina):
+    return paginar(map(_linha_atividade, atividades), *pagina)
+
+@comando("cadastrar_atividade", Arg("turma_id", int), Arg("nome"), Arg("descricao", obrigatorio=False), escreve=("atividades", "turmas"))
+def cadastrar_atividade(tid, nome, descricao):
+    t = buscar_turma_por_id(tid)
     if not t: return "❌ ERRO: Turma não encontrada."
-    aid = prox_id(atividades)
-    atv = {"id": aid, "nome": nome, "descricao": descricao, "turma_id": t['id'], "notas": {}}
-    atividades.append(atv)
-    t.setdefault("atividades", []).append(aid)
-    salvar_tudo()
-    print(f"[Log Servidor] Atividade '{nome}' cadastrada na {t['nome']}")
+    atv = atividades.inserir(Atividade(None, nome, descricao or "", t.id, array("i"), array("d")))
+    _incluir_atividade(t, atv.id)
+    turmas.atualizar(t)
+    persistir()
+    log.info(f"[Log Servidor] Atividade '{nome}' cadastrada na {t.nome}")
     return "✅ Atividade cadastrada."
 
-def editar_atividade(aid_str, novo_nome, nova_descr):
-    atv = buscar_atividade_por_id(aid_str)
+@comando("editar_atividade", Arg("id", int), Arg("nome", obrigatorio=False), Arg("descricao", obrigatorio=False), escreve=("atividades",))
+def editar_atividade(aid, novo_nome, nova_descr):
+    atv = buscar_atividade_por_id(aid)
     if not atv: return "❌ ERRO: Atividade não encontrada."
-    if novo_nome: atv["nome"] = novo_nome
-    if nova_descr: atv["descricao"] = nova_descr
-    salvar_arquivo(ARQ_ATIV, atividades)
-    print(f"[Log Servidor] Atividade editada: ID {aid_str}")
+    campos = {}
+    if novo_nome: campos["nome"] = novo_nome
+    if nova_descr: campos["descricao"] = nova_descr
+    atividades.atualizar(atv, **campos)
+    persistir()
+    log.info(f"[Log Servidor] Atividade editada: ID {aid}")
     return "✅ Atividade atualizada."
 
-def remover_atividade(aid_str):
-    atv = buscar_atividade_por_id(aid_str)
+@comando("remover_atividade", Arg("id", int), escreve=("atividades", "turmas"))
+def remover_atividade(aid):
+    atv = buscar_atividade_por_id(aid)
     if not atv: return "❌ ERRO: Atividade não encontrada."
-    tid = atv.get("turma_id")
+    tid = atv.turma_id
     if tid:
         t = buscar_turma_por_id(tid)
-        if t and atv['id'] in t.get("atividades", []):
-            t["atividades"].remove(atv['id'])
-    atividades.remove(atv)
-    salvar_tudo()
-    print(f"[Log Servidor] Atividade removida: {atv['nome']}")
+        if t and atv.id in t.atividades:
+            _retirar_atividade(t, atv.id)
+            turmas.atualizar(t)
+    atividades.remover(atv)
+    persistir()
+    log.info(f"[Log Servidor] Atividade removida: {atv.nome}")
     return "✅ Atividade removida."
 
-def ver_notas_atividade(aid_str):
-    atv = buscar_atividade_por_id(aid_str)
+@comando("ver_notas_atividade", Arg("id", int), le=("atividades", "alunos"))
+def ver_notas_atividade(aid):
+    atv = buscar_atividade_por_id(aid)
     if not atv: return "❌ ERRO: Atividade não encontrada."
-    if not atv.get("notas"): return "Sem notas registradas."
+    if not atv.valores: return "Sem notas registradas."
     lista_notas = []
-    for sid, nota in atv["notas"].items():
-        aluno = buscar_aluno_por_id(sid)
+    for aid, nota in atv.notas():
+        aluno = buscar_aluno_por_id(aid)
         lista_notas.append({
-            "id_aluno": sid,
-            "nome": aluno["nome"] if aluno else "Aluno Removido",
+            "id_aluno": str(aid),
+            "nome": aluno.nome if aluno else "Aluno Removido",
             "nota": nota
         })
     return json.dumps(lista_notas)
 
-def adicionar_editar_nota(atv_id_str, aluno_id_str, nota_str):
-    atv = buscar_atividade_por_id(atv_id_str)
-    aluno = buscar_aluno_por_id(aluno_id_str)
+@comando("adicionar_nota", Arg("atividade_id", int), Arg("aluno_id", int), ARG_NOTA, aliases=("adicionar_editar_nota",), le=("alunos", "turmas"), escreve=("atividades",))
+def adicionar_editar_nota(atv_id, aluno_id, nota):
+    atv = buscar_atividade_por_id(atv_id)
+    aluno = buscar_aluno_por_id(aluno_id)
     if not atv: return "❌ ERRO: Atividade não encontrada."
     if not aluno: return "❌ ERRO: Aluno não encontrado."
-    try:
-        nota = float(nota_str.replace(",", "."))
-        if not (0.0 <= nota <= 10.0): return "❌ ERRO: Nota deve ser entre 0 e 10."
-    except ValueError:
-        return "❌ ERRO: Nota deve ser um número."
-    t = buscar_turma_por_id(atv.get("turma_id"))
+    t = buscar_turma_por_id(atv.turma_id)
     if not t: return "❌ ERRO: Turma da atividade não encontrada."
-    if aluno['id'] not in t.get("alunos", []): return "❌ ERRO: Aluno não pertence a esta turma."
-    atv.setdefault("notas", {})[str(aluno['id'])] = nota
-    salvar_arquivo(ARQ_ATIV, atividades)
-    print(f"[Log Servidor] Nota {nota} registrada para Aluno ID {aluno_id_str} em Atividade ID {atv_id_str}")
+    if not t.tem_aluno(aluno.id): return "❌ ERRO: Aluno não pertence a esta turma."
+    _definir_nota(atv, aluno.id, nota)
+    atividades.atualizar(atv)
+    persistir()
+    log.info(f"[Log Servidor] Nota {nota} registrada para Aluno ID {aluno_id} em Atividade ID {atv_id}")
     return "✅ Nota registrada/atualizada."
-def remover_nota(atv_id_str, aluno_id_str):
-    atv = buscar_atividade_por_id(atv_id_str)
+
+@comando("adicionar_notas_lote", Arg("atividade_id", int), Arg("notas", dict), le=("turmas",), escreve=("atividades",))
+def adicionar_notas_lote(atv_id, notas):
+    atv = buscar_atividade_por_id(atv_id)
     if not atv: return "❌ ERRO: Atividade não encontrada."
-    aluno = buscar_aluno_por_id(aluno_id_str)
+    t = buscar_turma_por_id(atv.turma_id)
+    if not t: return "❌ ERRO: Turma da atividade não encontrada."
+    resultados = []
+    validas = {}
+    for aluno_id, nota in notas.items():
+        try:
+            aluno_id = int(aluno_id)
+            nota = ARG_NOTA.converter(nota)
+        except ValueError:
+            resultados.append({"aluno_id": aluno_id, "ok": False, "mensagem": "❌ ERRO: ID de aluno inválido."})
+            continue
+        except ErroArgumento as e:
+            resultados.append({"aluno_id": aluno_id, "ok": False, "mensagem": str(e)})
+            continue
+        if not t.tem_aluno(aluno_id):
+            resultados.append({"aluno_id": aluno_id, "ok": False, "mensagem": "❌ ERRO: Aluno não pertence a esta turma."})
+            continue
+        validas[aluno_id] = nota
+        resultados.append({"aluno_id": aluno_id, "ok": True, "mensagem": f"Nota {nota} registrada/atualizada."})
+    ok = len(validas) == len(notas)
+    if ok and validas:
+        for aluno_id, nota in validas.items():
+            _definir_nota(atv, aluno_id, nota)
+        atividades.atualizar(atv)
+        persistir()
+        log.info(f"[Log Servidor] {len(validas)} nota(s) registrada(s) em lote na Atividade ID {atv_id}")
+    return json.dumps({"ok": ok, "aplicadas": len(validas) if ok else 0, "resultados": resultados}, ensure_ascii=False)
+
+@comando("remover_nota", Arg("atividade_id", int), Arg("aluno_id", int), le=("alunos",), escreve=("atividades",))
+def remover_nota(atv_id, aluno_id):
+    atv = buscar_atividade_por_id(atv_id)
+    if not atv: return "❌ ERRO: Atividade não encontrada."
+    aluno = buscar_aluno_por_id(aluno_id)
     if not aluno: return "❌ ERRO: Aluno não encontrado."
-    sid = str(aluno['id'])
-    if sid not in atv.get("notas", {}): return "❌ Este aluno não possui nota cadastrada."
-    del atv["notas"][sid]
-    salvar_arquivo(ARQ_ATIV, atividades)
-    print(f"[Log Servidor] Nota removida de Aluno ID {aluno_id_str} da Atividade ID {atv_id_str}")
+    if atv.nota(aluno.id) is None: return "❌ Este aluno não possui nota cadastrada."
+    _apagar_nota(atv, aluno.id)
+    atividades.atualizar(atv)
+    persistir()
+    log.info(f"[Log Servidor] Nota removida de Aluno ID {aluno_id} da Atividade ID {atv_id}")
     return "Nota removida."
 
-def gerar_relatorio_turma(tid_str, caminho_pdf):
-    t = buscar_turma_por_id(tid_str)
-    if not t: return "❌ ERRO: Turma não encontrada."
-    if not os.path.exists(os.path.dirname(caminho_pdf)):
+def _linha_registro(r):
+    return r.para_dict()
+
+LISTAGENS = {
+    "professores": (professores, _linha_professor),
+    "alunos": (alunos, _linha_registro),
+    "turmas": (turmas, _linha_turma),
+    "atividades": (atividades, _linha_atividade),
+}
+
+@comando("mudancas_desde", Arg("colecao", rotulo="Coleção"), Arg("versao", int, obrigatorio=False, minimo=0, rotulo="Versão"))
+def mudancas_desde(nome, versao):
+    if nome not in LISTAGENS: return "❌ ERRO: Coleção desconhecida."
+    colecao, linha = LISTAGENS[nome]
+    nomes = (nome, "turmas") if colecao is atividades else (nome,)
+    with transacao(le=nomes):
+        atual = max(COLECOES_POR_NOME[n].versao for n in nomes)
+        alterados = colecao.alterados_desde(versao) if versao and versao <= atual else None
+        if alterados is not None and colecao is atividades:
+            turmas_alteradas = turmas.alterados_desde(versao)
+            if turmas_alteradas is None:
+                alterados = None
+            else:
+                for tid in turmas_alteradas:
+                    t = turmas.por_id.get(tid)
+                    for atv_id in (t.atividades if t else ()):
+                        alterados.setdefault(atv_id, False)
+        resposta = {"colecao": nome, "versao": atual, "completo": alterados is None,
+                    "inseridos": [], "atualizados": [], "removidos": []}
+        if alterados is None:
+            resposta["inseridos"] = [linha(r) for r in colecao]
+        else:
+            for rid, criado in alterados.items():
+                r = colecao.por_id.get(rid)
+                if r is None:
+                    if not criado: resposta["removidos"].append(rid)
+                else:
+                    resposta["inseridos" if criado else "atualizados"].append(linha(r))
+    return json.dumps(resposta, default=para_json)
+
+@comando("assinar", Arg("colecoes", list, rotulo="Coleções"), com_sessao=True)
+def assinar(sessao, colecoes):
+    for nome in colecoes:
+        if not isinstance(nome, str) or nome not in LISTAGENS: return f"❌ ERRO: Coleção desconhecida: {nome}."
+    if sessao is None or "ligar_assinatura" not in sessao:
+        return "❌ ERRO: Assinaturas só valem numa conexão com o servidor."
+    cancelar_assinatura(sessao)
+    if not colecoes:
+        return "✅ Assinatura cancelada."
+    registrar_assinatura(sessao, Assinatura(colecoes))
+    with transacao(le=colecoes):
+        versoes = {nome: COLECOES_POR_NOME[nome].versao for nome in colecoes}
+    log.info(f"[Log Servidor] {sessao['addr']} assinou {', '.join(sorted(versoes))}")
+    return json.dumps({"colecoes": sorted(versoes), "versoes": versoes}, ensure_ascii=False)
+
+ARG_CSV = Arg("csv", rotulo="CSV")
+ARG_LINHA_CSV = Arg("linha", int, obrigatorio=False, minimo=1, rotulo="Linha inicial")
+ARG_APOS = Arg("apos", obrigatorio=False, rotulo="Cursor")
+ARG_LIMITE_EXPORTACAO = Arg("limite", int, obrigatorio=False, minimo=1, maximo=LIMITE_EXPORTACAO, rotulo="Limite")
+ARGS_ALUNO_CSV = (Arg("nome"), Arg("matricula", rotulo="Matrícula"))
+ARG_ALUNO_ID = Arg("aluno_id", int)
+ARG_TURMA_ID = Arg("turma_id", int)
+ARG_ATIVIDADE_ID = Arg("atividade_id", int)
+
+def _ler_csv(texto, linha):
+    cabecalho = texto.partition("\n")[0]
+    delimitador = ";" if cabecalho.count(";") > cabecalho.count(",") else ","
+    leitor = csv.reader(io.StringIO(texto.lstrip("\ufeff"), newline=""), delimiter=delimitador)
+    colunas = [c.strip().lower() for c in next(leitor, [])]
+    linhas = []
+    for i, valores in enumerate(leitor):
+        if any(v.strip() for v in valores):
+            linhas.append((linha + i, dict(zip(colunas, (v.strip() for v in valores)))))
+    return colunas, linhas
+
+def _importar(nome, texto, linha, obrigatorias, aplicar):
+    try:
+        colunas, linhas = _ler_csv(texto, linha or 2)
+    except csv.Error as e:
+        return f"❌ ERRO: CSV inválido ({e})."
+    ausentes = [" ou ".join(opcoes) for opcoes in obrigatorias if not any(c in colunas for c in opcoes)]
+    if ausentes:
+        return f"❌ ERRO: Coluna(s) ausente(s) no CSV: {', '.join(ausentes)}."
+    resultado = {"processadas": len(linhas), "aplicadas": 0, "ignoradas": 0, "erros": []}
+    for numero, campos in linhas:
         try:
-            os.makedirs(os.path.dirname(caminho_pdf), exist_ok=True)
-        except Exception as e:
-            return f"❌ ERRO: Não foi possível criar diretório: {e}"
-    c = canvas.Canvas(caminho_pdf, pagesize=letter)
-    largura, altura = letter
-    y = altura - 50
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(50, y, f"Relatório da Turma: {t['nome']}")
-    y -= 30
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(50, y, "Alunos:")
-    y -= 20
-    for aid in t.get("alunos", []):
+            mensagem = aplicar(campos)
+        except ErroArgumento as e:
+            mensagem = str(e)
+        if mensagem is None:
+            resultado["aplicadas"] += 1
+        elif mensagem.startswith("❌"):
+            resultado["erros"].append({"linha": numero, "mensagem": mensagem})
+        else:
+            resultado["ignoradas"] += 1
+    log.info(f"[Log Servidor] Importação de {nome}: {resultado['aplicadas']} aplicada(s), "
+             f"{resultado['ignoradas']} ignorada(s), {len(resultado['erros'])} erro(s)")
+    return json.dumps(resultado, ensure_ascii=False)
+
+def _aluno_do_csv(campos):
+    if campos.get("aluno_id"):
+        return buscar_aluno_por_id(ARG_ALUNO_ID.converter(campos["aluno_id"]))
+    return alunos.buscar_por("matricula", campos.get("matricula"))
+
+@comando("importar_alunos", ARG_CSV, ARG_LINHA_CSV, escreve=("alunos",))
+def importar_alunos(texto, linha):
+    def aplicar(campos):
+        nome, matricula = (arg.converter(campos.get(arg.nome)) for arg in ARGS_ALUNO_CSV)
+        if alunos.buscar_por("matricula", matricula):
+            return "❌ ERRO: Matrícula já cadastrada."
+        alunos.inserir(Aluno(None, nome, matricula))
+    resposta = _importar("alunos", texto, linha, (("nome",), ("matricula",)), aplicar)
+    persistir()
+    return resposta
+
+@comando("importar_matriculas", ARG_CSV, ARG_LINHA_CSV, le=("alunos",), escreve=("turmas",))
+def importar_matriculas(texto, linha):
+    alteradas = {}
+    def aplicar(campos):
+        t = buscar_turma_por_id(ARG_TURMA_ID.converter(campos.get("turma_id")))
+        a = _aluno_do_csv(campos)
+        if not t: return "❌ ERRO: Turma não encontrada."
+        if not a: return "❌ ERRO: Aluno não encontrado."
+        if t.tem_aluno(a.id): return "Aluno já matriculado."
+        _vincular_aluno(t, a.id)
+        alteradas[t.id] = t
+    resposta = _importar("matrículas", texto, linha, (("turma_id",), ("aluno_id", "matricula")), aplicar)
+    for t in alteradas.values():
+        turmas.atualizar(t)
+    persistir()
+    return resposta
+
+@comando("importar_notas", ARG_CSV, ARG_LINHA_CSV, le=("alunos", "turmas"), escreve=("atividades",))
+def importar_notas(texto, linha):
+    alteradas = {}
+    def aplicar(campos):
+        atv = buscar_atividade_por_id(ARG_ATIVIDADE_ID.converter(campos.get("atividade_id")))
+        a = _aluno_do_csv(campos)
+        nota = ARG_NOTA.converter(campos.get("nota"))
+        if not atv: return "❌ ERRO: Atividade não encontrada."
+        if not a: return "❌ ERRO: Aluno não encontrado."
+        t = buscar_turma_por_id(atv.turma_id)
+        if not t: return "❌ ERRO: Turma da atividade não encontrada."
+        if not t.tem_aluno(a.id): return "❌ ERRO: Aluno não pertence a esta turma."
+        _definir_nota(atv, a.id, nota)
+        alteradas[atv.id] = atv
+    resposta = _importar("notas", texto, linha, (("atividade_id",), ("aluno_id", "matricula"), ("nota",)), aplicar)
+    for atv in alteradas.values():
+        atividades.atualizar(atv)
+    persistir()
+    return resposta
+
+def _ler_apos(apos, partes):
+    if apos is None: return ()
+    try:
+        chave = tuple(int(p) for p in apos.split(":"))
+    except ValueError:
+        return None
+    return chave if len(chave) == partes else None
+
+def _pares(colecao, membros, apos):
+    ids = sorted(colecao.por_id)
+    for pid in ids[bisect.bisect_left(ids, apos[0]) if apos else 0:]:
+        registro = colecao.por_id[pid]
+        lista = membros(registro)
+        inicio = bisect.bisect_right(lista, apos[1]) if apos and pid == apos[0] else 0
+        for i in range(inicio, len(lista)):
+            yield registro, lista[i], i
+
+def _exportar(colunas, linhas, apos, limite):
+    saida = io.StringIO()
+    escritor = csv.writer(saida, lineterminator="\n")
+    if not apos:
+        escritor.writerow(colunas)
+    quantidade = 0
+    proximo = None
+    for chave, valores in linhas:
+        if quantidade == (limite or LIMITE_EXPORTACAO):
+            proximo = ":".join(map(str, ultima))
+            break
+        escritor.writerow(valores)
+        ultima = chave
+        quantidade += 1
+    return json.dumps({"csv": saida.getvalue(), "linhas": quantidade, "proximo": proximo}, ensure_ascii=False)
+
+def _matricula(aid):
+    a = alunos.por_id.get(aid)
+    return a.matricula if a else ""
+
+@comando("exportar_alunos", ARG_APOS, ARG_LIMITE_EXPORTACAO, le=("alunos",))
+def exportar_alunos(apos, limite):
+    chave = _ler_apos(apos, 1)
+    if chave is None: return "❌ ERRO: Cursor inválido."
+    ids = sorted(alunos.por_id)
+    linhas = (((rid,), (rid, alunos.por_id[rid].nome, alunos.por_id[rid].matricula))
+              for rid in ids[bisect.bisect_right(ids, chave[0]) if chave else 0:])
+    return _exportar(("id", "nome", "matricula"), linhas, chave, limite)
+
+@comando("exportar_matriculas", ARG_APOS, ARG_LIMITE_EXPORTACAO, le=("turmas", "alunos"))
+def exportar_matriculas(apos, limite):
+    chave = _ler_apos(apos, 2)
+    if chave is None: return "❌ ERRO: Cursor inválido."
+    linhas = (((t.id, aid), (t.id, aid, _matricula(aid))) for t, aid, _ in _pares(turmas, lambda t: t.alunos, chave))
+    return _exportar(("turma_id", "aluno_id", "matricula"), linhas, chave, limite)
+
+@comando("exportar_notas", ARG_APOS, ARG_LIMITE_EXPORTACAO, le=("atividades", "alunos"))
+def exportar_notas(apos, limite):
+    chave = _ler_apos(apos, 2)
+    if chave is None: return "❌ ERRO: Cursor inválido."
+    linhas = (((atv.id, aid), (atv.id, aid, _matricula(aid), atv.valores[i]))
+              for atv, aid, i in _pares(atividades, lambda atv: atv.alunos_com_nota, chave))
+    return _exportar(("atividade_id", "aluno_id", "matricula", "nota"), linhas, chave, limite)
+
+def _media_aluno_na_turma(tid, aid):
+    agregado = estat_turma_aluno.get((tid, aid))
+    return agregado.resumo() if agregado else Agregado().resumo()
+
+@comando("estatisticas_turma", Arg("id", int), le=("turmas", "alunos", "atividades"))
+def estatisticas_turma(tid):
+    t = buscar_turma_por_id(tid)
+    if not t: return "❌ ERRO: Turma não encontrada."
+    ranking = []
+    for posicao, (media, aid) in enumerate(ranking_turma(t), start=1):
         a = buscar_aluno_por_id(aid)
+        ranking.append({"posicao": posicao, "aluno_id": aid, "nome": a.nome if a else "Aluno Removido",
+                        **_media_aluno_na_turma(t.id, aid)})
+    resumo = estat_turma.get(t.id, Agregado()).resumo()
+    return json.dumps({"turma_id": t.id, "nome": t.nome, **resumo, "ranking": ranking}, ensure_ascii=False)
+
+@comando("estatisticas_aluno", Arg("id", int), le=("alunos", "turmas", "atividades"))
+def estatisticas_aluno(aid):
+    a = buscar_aluno_por_id(aid)
+    if not a: return "❌ ERRO: Aluno não encontrado."
+    por_turma = []
+    for tid in turmas_por_aluno.get(a.id, ()):
+        t = turmas.por_id[tid]
+        posicao = next((i for i, (_, x) in enumerate(ranking_turma(t), start=1) if x == a.id), None)
+        por_turma.append({"turma_id": tid, "nome": t.nome, "posicao": posicao, **_media_aluno_na_turma(tid, a.id)})
+    geral = estat_aluno.get(a.id, Agregado()).resumo()
+    return json.dumps({"aluno_id": a.id, "nome": a.nome, **geral, "turmas": por_turma}, ensure_ascii=False)
+
+@comando("relatorio_medias", le=("turmas", "atividades"))
+def relatorio_medias():
+    lista = []
+    for t in turmas:
+        lista.append({"id": t.id, "nome": t.nome, "alunos": len(t.alunos),
+                      **estat_turma.get(t.id, Agregado()).resumo()})
+    return json.dumps(lista, ensure_ascii=False)
+
+@comando("melhor_pior_aluno", le=("turmas", "alunos", "atividades"))
+def melhor_pior_aluno():
+    lista = []
+    for t in turmas:
+        ranking = ranking_turma(t)
+        item = {"id": t.id, "nome": t.nome, "melhor": None, "pior": None}
+        for campo, (media, aid) in (("melhor", ranking[0]), ("pior", ranking[-1])) if ranking else ():
+            a = buscar_aluno_por_id(aid)
+            item[campo] = {"aluno_id": aid, "nome": a.nome if a else "Aluno Removido", "media": round(media, 2)}
+        lista.append(item)
+    return json.dumps(lista, ensure_ascii=False)
+
+@comando("recalcular_estatisticas", le=("turmas",), escreve=("atividades",))
+def recalcular_estatisticas_cmd():
+    total = recalcular_estatisticas()
+    log.info(f"[Log Servidor] Estatísticas recalculadas ({total} notas, numpy={'sim' if obter_numpy() is not None else 'não'})")
+    return f"✅ Estatísticas recalculadas ({total} notas)."
+
+DIR_RELATORIOS = "relatorios"
+WORKERS_PDF = max(1, (os.cpu_count() or 2) - 1)
+BOLETINS_POR_TAREFA = 25
+MAX_TRABALHOS = 100
+
+trabalhos = {}
+trabalhos_lock = threading.Lock()
+ultimo_trabalho = 0
+pool_pdf = None
+pool_pdf_lock = threading.Lock()
+
+def obter_pool_pdf():
+    global pool_pdf
+    with pool_pdf_lock:
+        if pool_pdf is None:
+            pool_pdf = ProcessPoolExecutor(max_workers=WORKERS_PDF, mp_context=multiprocessing.get_context("spawn"))
+        return pool_pdf
+
+def encerrar_pool_pdf():
+    global pool_pdf
+    with pool_pdf_lock:
+        if pool_pdf is not None:
+            pool_pdf.shutdown(wait=True, cancel_futures=True)
+            pool_pdf = None
+
+def nome_arquivo_seguro(texto):
+    return "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in str(texto)) or "sem_nome"
+
+def preparar_dados_turma(t):
+    posicoes = {aid: i for i, (_, aid) in enumerate(ranking_turma(t), start=1)}
+    lista_alunos = []
+    for aid in t.alunos:
+        a = alunos.por_id.get(aid)
         if a:
-            c.setFont("Helvetica", 11)
-            c.drawString(60, y, f"{a['nome']} (Matrícula: {a['matricula']})")
-            y -= 15
-            if y < 50:
-                c.showPage()
-                y = altura - 50
-    y -= 20
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(50, y, "Atividades:")
-    y -= 20
-    for atv_id in t.get("atividades", []):
-        atv = buscar_atividade_por_id(atv_id)
-        if atv:
-            c.setFont("Helvetica-Bold", 11)
-            c.drawString(60, y, f"Atividade: {atv['nome']}")
-            y -= 15
-            c.setFont("Helvetica", 10)
-            for sid, nota in atv.get("notas", {}).items():
-                aluno = buscar_aluno_por_id(sid)
-                nome_alu = aluno["nome"] if aluno else "Aluno removido"
-                c.drawString(80, y, f"{nome_alu}: {nota}")
-                y -= 15
-                if y < 50:
-                    c.showPage()
-                    y = altura - 50
-            y -= 10
-    c.save()
-    print(f"[Log Servidor] Relatório PDF gerado em: {caminho_pdf}")
-    return "PDF gerado com sucesso."
-
-def processar_comandos(comando_json):
+            lista_alunos.append({"id": aid, "nome": a.nome, "matricula": a.matricula,
+                                 "media": _media_aluno_na_turma(t.id, aid)["media"], "posicao": posicoes.get(aid)})
+    nomes = {a["id"]: a["nome"] for a in lista_alunos}
+    lista_atividades = []
+    for atv_id in t.atividades:
+        atv = atividades.por_id.get(atv_id)
+        if not atv: continue
+        notas = dict(atv.notas())
+        for aid in notas:
+            if aid not in nomes:
+                aluno = alunos.por_id.get(aid)
+                nomes[aid] = aluno.nome if aluno else "Aluno removido"
+        lista_atividades.append({"id": atv_id, "nome": atv.nome, "notas": notas})
+    return {"id": t.id, "nome": t.nome, "alunos": lista_alunos, "atividades": lista_atividades,
+            "nomes": nomes, "resumo": estat_turma.get(t.id, Agregado()).resumo(), "classificados": len(posicoes)}
+
+def preparar_boletins(dados):
+    boletins = []
+    for a in dados["alunos"]:
+        boletins.append({**a, "turma": dados["nome"], "classificados": dados["classificados"],
+                         "notas": [(atv["nome"], atv["notas"].get(a["id"])) for atv in dados["atividades"]]})
+    return boletins
+
+class Pagina:
+    def __init__(self, caminho_pdf):
+        from reportlab.lib.pagesizes import letter
+        from reportlab.pdfgen import canvas
+        self.c = canvas.Canvas(caminho_pdf, pagesize=letter)
+        self.altura = letter[1]
+        self.y = self.altura - 50
+
+    def escrever(self, x, texto, fonte="Helvetica", tamanho=11, passo=15):
+        if self.y < 50:
+            self.c.showPage()
+            self.y = self.altura - 50
+        self.c.setFont(fonte, tamanho)
+        self.c.drawString(x, self.y, texto)
+        self.y -= passo
+
+    def pular(self, passo):
+        self.y -= passo
+
+    def salvar(self):
+        self.c.save()
+
+def renderizar_relatorio_turma(dados, caminho_pdf):
+    os.makedirs(os.path.dirname(caminho_pdf) or ".", exist_ok=True)
+    p = Pagina(caminho_pdf)
+    p.escrever(50, f"Relatório da Turma: {dados['nome']}", "Helvetica-Bold", 16, 30)
+    if dados["resumo"]["media"] is not None:
+        p.escrever(50, f"Média da turma: {dados['resumo']['media']:.2f} ({dados['resumo']['n_notas']} notas)", passo=25)
+    p.escrever(50, "Alunos:", "Helvetica-Bold", 12, 20)
+    for a in dados["alunos"]:
+        p.escrever(60, f"{a['nome']} (Matrícula: {a['matricula']})")
+    p.pular(20)
+    p.escrever(50, "Atividades:", "Helvetica-Bold", 12, 20)
+    for atv in dados["atividades"]:
+        p.escrever(60, f"Atividade: {atv['nome']}", "Helvetica-Bold", 11)
+        for aid, nota in atv["notas"].items():
+            p.escrever(80, f"{dados['nomes'].get(aid, 'Aluno removido')}: {nota}", tamanho=10)
+        p.pular(10)
+    p.salvar()
+    return [caminho_pdf]
+
+def renderizar_boletins(boletins, pasta):
+    os.makedirs(pasta, exist_ok=True)
+    gerados = []
+    for b in boletins:
+        caminho_pdf = os.path.join(pasta, f"{nome_arquivo_seguro(b['matricula'])}.pdf")
+        p = Pagina(caminho_pdf)
+        p.escrever(50, "Boletim Escolar", "Helvetica-Bold", 16, 30)
+        p.escrever(50, f"Aluno: {b['nome']}", "Helvetica-Bold", 12)
+        p.escrever(50, f"Matrícula: {b['matricula']}")
+        p.escrever(50, f"Turma: {b['turma']}", passo=30)
+        p.escrever(50, "Atividade", "Helvetica-Bold", 11, 0)
+        p.escrever(400, "Nota", "Helvetica-Bold", 11, 20)
+        for nome_atv, nota in b["notas"]:
+            p.escrever(50, nome_atv[:60], passo=0)
+            p.escrever(400, "-" if nota is None else f"{nota:.2f}")
+        p.pular(15)
+        p.escrever(50, f"Média: {'-' if b['media'] is None else format(b['media'], '.2f')}", "Helvetica-Bold", 12)
+        if b["posicao"]:
+            p.escrever(50, f"Posição na turma: {b['posicao']}º de {b['classificados']}")
+        p.salvar()
+        gerados.append(caminho_pdf)
+    return gerados
+
+def _resumo_trabalho(trabalho):
+    return {campo: trabalho[campo] for campo in ("id", "tipo", "turma_id", "turma_nome", "status", "total",
+                                                 "concluidos", "falhas", "destino", "erros")}
+
+def _descartar_trabalhos_antigos():
+    finalizados = [tid for tid, tr in trabalhos.items() if tr["status"] != "executando"]
+    for tid in finalizados[:max(0, len(trabalhos) - MAX_TRABALHOS)]:
+        del trabalhos[tid]
+
+def _tarefa_concluida(trabalho, quantidade, futuro):
+    with trabalhos_lock:
+        erro = None if futuro.cancelled() else futuro.exception()
+        if futuro.cancelled() or erro:
+            trabalho["falhas"] += quantidade
+            if len(trabalho["erros"]) < 10:
+                trabalho["erros"].append("cancelado" if futuro.cancelled() else f"{type(erro).__name__}: {erro}")
+        else:
+            trabalho["concluidos"] += len(futuro.result())
+        trabalho["pendentes"] -= 1
+        if trabalho["pendentes"] == 0:
+            trabalho["status"] = "erro" if trabalho["falhas"] else "concluido"
+            log.info(f"[Log Servidor] Trabalho {trabalho['id']} ({trabalho['tipo']}) {trabalho['status']}: "
+                     f"{trabalho['concluidos']}/{trabalho['total']} PDF(s) em {trabalho['destino']}")
+
+def iniciar_trabalho(tipo, t, destino, tarefas):
+    global ultimo_trabalho
+    with trabalhos_lock:
+        for trabalho in trabalhos.values():
+            if trabalho["status"] == "executando" and trabalho["tipo"] == tipo and trabalho["turma_id"] == t.id:
+                return trabalho
+        ultimo_trabalho += 1
+        trabalho = {"id": ultimo_trabalho, "tipo": tipo, "turma_id": t.id, "turma_nome": t.nome,
+                    "status": "executando", "total": sum(q for _, _, q in tarefas), "concluidos": 0, "falhas": 0,
+                    "destino": os.path.abspath(destino), "erros": [], "pendentes": len(tarefas)}
+        trabalhos[trabalho["id"]] = trabalho
+        _descartar_trabalhos_antigos()
+    for funcao, args, quantidade in tarefas:
+        try:
+            futuro = obter_pool_pdf().submit(funcao, *args)
+        except BrokenProcessPool:
+            encerrar_pool_pdf()
+            futuro = obter_pool_pdf().submit(funcao, *args)
+        futuro.add_done_callback(lambda f, q=quantidade: _tarefa_concluida(trabalho, q, f))
+    log.info(f"[Log Servidor] Trabalho {trabalho['id']} ({tipo}) iniciado para Turma ID {t.id}: {trabalho['total']} PDF(s)")
+    return trabalho
+
+@comando("gerar_relatorio_pdf", Arg("turma_id", int), le=("turmas", "alunos", "atividades"))
+def gerar_relatorio_pdf(tid):
+    t = buscar_turma_por_id(tid)
+    if not t: return "❌ ERRO: Turma não encontrada."
+    caminho_pdf = os.path.join(DIR_RELATORIOS, f"turma_{t.id}.pdf")
+    trabalho = iniciar_trabalho("relatorio_turma", t, caminho_pdf, [(renderizar_relatorio_turma, (preparar_dados_turma(t), caminho_pdf), 1)])
+    return json.dumps(_resumo_trabalho(trabalho), ensure_ascii=False)
+
+@comando("gerar_boletins", Arg("turma_id", int), le=("turmas", "alunos", "atividades"))
+def gerar_boletins(tid):
+    t = buscar_turma_por_id(tid)
+    if not t: return "❌ ERRO: Turma não encontrada."
+    boletins = preparar_boletins(preparar_dados_turma(t))
+    if not boletins: return "❌ ERRO: A turma não possui alunos matriculados."
+    pasta = os.path.join(DIR_RELATORIOS, "boletins", f"turma_{t.id}")
+    tarefas = [(renderizar_boletins, (boletins[i:i + BOLETINS_POR_TAREFA], pasta), len(boletins[i:i + BOLETINS_POR_TAREFA]))
+               for i in range(0, len(boletins), BOLETINS_POR_TAREFA)]
+    trabalho = iniciar_trabalho("boletins", t, pasta, tarefas)
+    return json.dumps(_resumo_trabalho(trabalho), ensure_ascii=False)
+
+@comando("status_trabalho", Arg("id", int))
+def status_trabalho(trabalho_id):
+    with trabalhos_lock:
+        trabalho = trabalhos.get(trabalho_id)
+        if not trabalho: return "❌ ERRO: Trabalho não encontrado."
+        return json.dumps(_resumo_trabalho(trabalho), ensure_ascii=False)
+
+@comando("listar_trabalhos")
+def listar_trabalhos():
+    with trabalhos_lock:
+        return json.dumps([_resumo_trabalho(tr) for tr in trabalhos.values()], ensure_ascii=False)
+
+def coletar_metricas():
+    with metricas_lock:
+        return {
+            "ativo_s": round(time.time() - inicio_metricas, 1),
+            "comandos": {acao: dict(m["latencia"].resumo(), erros=m["erros"]) for acao, m in sorted(metricas_comandos.items())},
+            "bytes": dict(metricas_bytes),
+            "persistencia": {op: h.resumo() for op, h in sorted(metricas_persistencia.items())},
+            "espera_lock": {f"{nome}:{'escrita' if escrita else 'leitura'}": h.resumo()
+                            for (nome, escrita), h in sorted(metricas_espera_lock.items())},
+            "registros": {c.nome: len(c) for c in COLECOES},
+            "armazenamento": armazenamento.nome,
+            "carga_s": {nome: round(duracao, 3) for nome, duracao in tempos_carga.items()},
+            "assinaturas": len(assinaturas),
+        }
+
+def metricas_prometheus():
+    linhas = []
+    def cabecalho(nome, tipo, ajuda):
+        linhas.append(f"# HELP {nome} {ajuda}")
+        linhas.append(f"# TYPE {nome} {tipo}")
+    with metricas_lock:
+        cabecalho("pim_comando_duracao_segundos", "histogram", "Tempo de execução por ação, incluindo espera de locks.")
+        for acao, m in sorted(metricas_comandos.items()):
+            linhas += m["latencia"].prometheus("pim_comando_duracao_segundos", f'acao="{acao}"')
+        cabecalho("pim_comando_erros_total", "counter", "Respostas de erro por ação.")
+        for acao, m in sorted(metricas_comandos.items()):
+            linhas.append(f'pim_comando_erros_total{{acao="{acao}"}} {m["erros"]}')
+        cabecalho("pim_bytes_total", "counter", "Bytes recebidos e enviados pelos sockets dos clientes.")
+        for direcao, total in metricas_bytes.items():
+            linhas.append(f'pim_bytes_total{{direcao="{direcao}"}} {total}')
+        cabecalho("pim_persistencia_segundos", "histogram", "Tempo gasto gravando dados em disco.")
+        for operacao, h in sorted(metricas_persistencia.items()):
+            linhas += h.prometheus("pim_persistencia_segundos", f'operacao="{operacao}"')
+        cabecalho("pim_espera_lock_segundos", "histogram", "Tempo esperando o lock de cada coleção.")
+        for (nome, escrita), h in sorted(metricas_espera_lock.items()):
+            linhas += h.prometheus("pim_espera_lock_segundos", f'colecao="{nome}",modo="{"escrita" if escrita else "leitura"}"')
+    cabecalho("pim_registros", "gauge", "Registros em memória por coleção.")
+    for c in COLECOES:
+        linhas.append(f'pim_registros{{colecao="{c.nome}"}} {len(c)}')
+    cabecalho("pim_carga_segundos", "gauge", "Duração de cada fase da última carga dos dados.")
+    for nome, duracao in tempos_carga.items():
+        linhas.append(f'pim_carga_segundos{{fase="{nome}"}} {duracao:.3f}')
+    cabecalho("pim_assinaturas", "gauge", "Conexões assinando eventos de mudança.")
+    linhas.append(f"pim_assinaturas {len(assinaturas)}")
+    cabecalho("pim_ativo_segundos", "gauge", "Tempo desde o início da coleta.")
+    linhas.append(f"pim_ativo_segundos {time.time() - inicio_metricas:.1f}")
+    return "\n".join(linhas) + "\n"
+
+@comando("metricas", Arg("formato", obrigatorio=False, rotulo="Formato"))
+def metricas(formato):
+    if formato in (None, "json"):
+        return json.dumps(coletar_metricas(), ensure_ascii=False)
+    if formato == "prometheus":
+        return metricas_prometheus()
+    return "❌ ERRO: Formato deve ser 'json' ou 'prometheus'."
+
+def interpretar_comando(mensagem):
+    if mensagem.startswith("{"):
+        cmd = json.loads(mensagem)
+        return cmd.get("acao"), cmd
+    acao, _, resto = mensagem.partition(";")
+    return acao.strip(), resto
+
+def processar_comandos(comando_json, sessao=None):
+    inicio = time.perf_counter()
     try:
-        cmd = json.loads(comando_json)
-    except:
+        acao, dados = interpretar_comando(comando_json)
+    except (json.JSONDecodeError, AttributeError):
         return "❌ JSON inválido."
-    acao = cmd.get("acao")
-    if acao == "listar_professores": return listar_professores()
-    if acao == "cadastrar_professor": return cadastrar_professor(cmd.get("nome"), cmd.get("matricula"), cmd.get("senha"))
-    if acao == "editar_professor": return editar_professor(cmd.get("id"), cmd.get("nome"), cmd.get("matricula"), cmd.get("senha"))
-    if acao == "remover_professor": return remover_professor(cmd.get("id"))
-    if acao == "listar_alunos": return listar_alunos()
-    if acao == "cadastrar_aluno": return cadastrar_aluno(cmd.get("nome"), cmd.get("matricula"))
-    if acao == "editar_aluno": return editar_aluno(cmd.get("id"), cmd.get("nome"), cmd.get("matricula"))
-    if acao == "remover_aluno": return remover_aluno(cmd.get("id"))
-    if acao == "buscar_aluno": return buscar_aluno(cmd.get("query"))
-    if acao == "ver_turmas_do_aluno": return ver_turmas_do_aluno(cmd.get("id"))
-    if acao == "listar_turmas": return listar_turmas()
-    if acao == "cadastrar_turma": return cadastrar_turma(cmd.get("nome"))
-    if acao == "editar_turma": return editar_turma(cmd.get("id"), cmd.get("nome"))
-    if acao == "remover_turma": return remover_turma(cmd.get("id"))
-    if acao == "ver_alunos_da_turma": return ver_alunos_da_turma(cmd.get("id"))
-    if acao == "ver_atividades_da_turma": return ver_atividades_da_turma(cmd.get("id"))
-    if acao == "matricular_aluno": return matricular_aluno_em_turma(cmd.get("aluno_id"), cmd.get("turma_id"))
-    if acao == "desmatricular_aluno": return desmatricular_aluno(cmd.get("turma_id"), cmd.get("aluno_id"))
-    if acao == "listar_atividades": return listar_atividades()
-    if acao == "cadastrar_atividade": return cadastrar_atividade(cmd.get("turma_id"), cmd.get("nome"), cmd.get("descricao"))
-    if acao == "editar_atividade": return editar_atividade(cmd.get("id"), cmd.get("nome"), cmd.get("descricao"))
-    if acao == "remover_atividade": return remover_atividade(cmd.get("id"))
-    if acao == "ver_notas_atividade": return ver_notas_atividade(cmd.get("id"))
-    if acao == "adicionar_nota": return adicionar_editar_nota(cmd.get("atividade_id"), cmd.get("aluno_id"), cmd.get("nota"))
-    if acao == "remover_nota": return remover_nota(cmd.get("atividade_id"), cmd.get("aluno_id"))
-    return "❌ Ação desconhecida."
-def tratar_cliente(conn, addr):
-    print(f"[CONEXÃO] Cliente conectado: {addr}")
-    conn.sendall("Conexão estabelecida com o servidor Python.\n".encode())
-    user_logado = None
+    cmd = COMANDOS.get(acao)
+    if not cmd:
+        return "❌ Ação desconhecida."
+    if sessao is not None and "encaminhador" in sessao and (cmd.escreve or cmd.acao in ENCAMINHADOS):
+        resposta = encaminhar(sessao, comando_json, lambda: cmd.converter(dados)[0])
+    else:
+        resposta = executar_comando(cmd, dados, sessao)
+    registrar_comando(cmd.acao, time.perf_counter() - inicio, resposta)
+    return resposta
+
+def executar_comando(cmd, dados, sessao):
+    if sessao is not None and not cmd.liberado() and not sessao["usuario"]:
+        return "NECESSARIO_LOGIN"
+    try:
+        valores = cmd.converter(dados)
+    except ErroArgumento as e:
+        return str(e)
+    with transacao(cmd.le, cmd.escreve):
+        if cmd.em_cache and all(v is None for v in valores):
+            return resposta_em_cache(cmd, valores)
+        argumentos = (sessao, *valores) if cmd.com_sessao else valores
+        if cmd.escreve:
+            return executar_transacional(cmd.funcao, *argumentos)
+        return cmd.funcao(*argumentos)
+
+ENCAMINHADOS = ("login_professor", "logout", "lote")
+FORA_DE_LOTE = ("lote", "mudancas_desde", "gerar_relatorio_pdf", "gerar_boletins")
+
+def _confirmar_lote(desfazer):
+    mudancas = []
+    for (_, rid), (colecao, antes) in desfazer.items():
+        atual = colecao.por_id.get(rid)
+        if atual is not None:
+            mudancas.append((colecao, "put", atual))
+        elif antes is not None:
+            mudancas.append((colecao, "del", antes))
+    armazenamento.confirmar_mudancas(mudancas)
+
+def executar_transacional(funcao, *args):
+    if not armazenamento.transacional or getattr(lote_atual, "desfazer", None) is not None:
+        return funcao(*args)
+    ultimos = [(c, c.ultimo_id) for c in COLECOES]
+    lote_atual.desfazer = desfazer = {}
+    try:
+        resposta = funcao(*args)
+    except BaseException:
+        _desfazer_lote(desfazer, ultimos)
+        descartar_eventos()
+        raise
+    finally:
+        lote_atual.desfazer = None
+    if desfazer:
+        try:
+            _confirmar_lote(desfazer)
+        except ErroArmazenamento as e:
+            _desfazer_lote(desfazer, ultimos)
+            descartar_eventos()
+            return f"❌ ERRO: Falha ao gravar no banco ({e}). Nenhuma alteração foi feita."
+    return resposta
+
+def _resolver_referencias(dados, criados):
+    resolvidos = {}
+    for chave, valor in dados.items():
+        if isinstance(valor, str) and valor.startswith("$") and valor[1:].isdigit():
+            n = int(valor[1:])
+            if not 1 <= n <= len(criados) or criados[n - 1] is None:
+                raise ErroArgumento(f"❌ ERRO: Referência '{valor}' não aponta para um registro criado no lote.")
+            valor = criados[n - 1]
+        resolvidos[chave] = valor
+    return resolvidos
+
+def _desfazer_lote(desfazer, ultimos):
+    reinseridas = set()
+    for (_, rid), (colecao, antes) in reversed(desfazer.items()):
+        if antes is not None:
+            if rid not in colecao.por_id:
+                reinseridas.add(colecao)
+            colecao._colocar(antes)
+        elif rid in colecao.por_id:
+            colecao._retirar(colecao.por_id[rid])
+    for colecao in reinseridas:
+        colecao.por_id = dict(sorted(colecao.por_id.items()))
+    tocadas = {colecao for colecao, _ in desfazer.values()}
+    for colecao in tocadas:
+        colecao.deltas.clear()
+    for colecao, ultimo in ultimos:
+        if colecao in tocadas:
+            colecao.ultimo_id = ultimo
+
+@comando("lote", Arg("comandos", list, rotulo="Comandos"), com_sessao=True)
+def lote(sessao, comandos):
+    if not comandos: return "❌ ERRO: Lote vazio."
+    if len(comandos) > LIMITE_LOTE: return f"❌ ERRO: Lote com mais de {LIMITE_LOTE} comandos."
+    pedidos = []
+    for i, dados in enumerate(comandos, 1):
+        cmd = COMANDOS.get(dados.get("acao")) if isinstance(dados, dict) else None
+        if not cmd: return f"❌ ERRO: Comando {i} do lote tem ação desconhecida."
+        if cmd.acao in FORA_DE_LOTE or cmd.com_sessao or any(isinstance(arg, ArgSenha) for arg in cmd.args):
+            return f"❌ ERRO: '{cmd.acao}' não pode ser usado em lote."
+        pedidos.append((cmd, dados))
+    escreve = {nome for cmd, _ in pedidos for nome in cmd.escreve}
+    le = {nome for cmd, _ in pedidos for nome in cmd.le} - escreve
+    resultados = []
+    criados = []
+    falha = None
+    with transacao(le, escreve):
+        lote_atual.desfazer = desfazer = {}
+        ultimos = [(COLECOES_POR_NOME[nome], COLECOES_POR_NOME[nome].ultimo_id) for nome in escreve]
+        try:
+            for i, (cmd, dados) in enumerate(pedidos):
+                tocados = len(desfazer)
+                try:
+                    resposta = executar_comando(cmd, _resolver_referencias(dados, criados), sessao)
+                except ErroArgumento as e:
+                    resposta = str(e)
+                except Exception as e:
+                    log.error(f"[ERRO] Comando '{cmd.acao}' falhou no lote: {e}")
+                    resposta = "❌ ERRO: Falha interna ao executar o comando."
+                if isinstance(resposta, bytes):
+                    resposta = resposta.decode("utf-8")
+                resultados.append(resposta)
+                criados.append(next((rid for (_, rid), (_, antes) in itertools.islice(desfazer.items(), tocados, None)
+                                     if antes is None), None))
+                if resposta.startswith("❌") or resposta == "NECESSARIO_LOGIN":
+                    falha = i
+                    break
+        finally:
+            lote_atual.desfazer = None
+        erro_banco = None
+        if falha is None:
+            try:
+                _confirmar_lote(desfazer)
+            except ErroArmazenamento as e:
+                erro_banco = e
+        if falha is not None or erro_banco is not None:
+            _desfazer_lote(desfazer, ultimos)
+            descartar_eventos()
+    if erro_banco is not None:
+        return f"❌ ERRO: Falha ao gravar o lote no banco ({erro_banco}). Nenhuma alteração foi feita."
+    if falha is None:
+        log.info(f"[Log Servidor] Lote com {len(pedidos)} comando(s) executado; {len(desfazer)} registro(s) gravados")
+    else:
+        log.info(f"[Log Servidor] Lote desfeito: comando {falha + 1} ('{pedidos[falha][0].acao}') falhou")
+    return json.dumps({"ok": falha is None, "falha": falha, "resultados": resultados, "criados": criados}, ensure_ascii=False)
+
+CAMPOS_SENSIVEIS = ("senha",)
+
+def mascarar(mensagem):
+    if mensagem.startswith("LOGIN"):
+        partes = mensagem.split(" ", 2)
+        return f"{partes[0]} {partes[1]} ***" if len(partes) == 3 else mensagem
+    try:
+        acao, dados = interpretar_comando(mensagem)
+    except (json.JSONDecodeError, AttributeError):
+        return f"(JSON inválido, {len(mensagem)} caracteres)"
+    cmd = COMANDOS.get(acao)
+    if isinstance(dados, dict):
+        return json.dumps(_ocultar(dados), ensure_ascii=False)
+    if not cmd or not any(arg.nome in CAMPOS_SENSIVEIS or arg.tipo in (dict, list) for arg in cmd.args) or not dados:
+        return mensagem
+    valores = dados.split(";", len(cmd.args) - 1)
+    for i, arg in enumerate(cmd.args[:len(valores)]):
+        if arg.nome in CAMPOS_SENSIVEIS:
+            valores[i] = "***"
+        elif arg.tipo in (dict, list):
+            try:
+                valores[i] = json.dumps(_ocultar(json.loads(valores[i])), ensure_ascii=False)
+            except json.JSONDecodeError:
+                pass
+    return ";".join([acao] + valores)
+
+def _ocultar(valor):
+    if isinstance(valor, dict):
+        return {k: "***" if k in CAMPOS_SENSIVEIS else _ocultar(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_ocultar(v) for v in valor]
+    return valor
+
+def extrair_quadros(buffer):
+    quadros = []
+    while len(buffer) >= TAM_CABECALHO:
+        try:
+            tamanho = int(buffer[:TAM_CABECALHO].decode("ascii").strip())
+        except ValueError:
+            raise ErroProtocolo("Cabeçalho de tamanho inválido.")
+        if tamanho < 0 or tamanho > TAM_MAX_QUADRO:
+            raise ErroProtocolo(f"Quadro de {tamanho} bytes fora do limite.")
+        fim = TAM_CABECALHO + tamanho
+        if len(buffer) < fim:
+            break
+        quadros.append(bytes(buffer[TAM_CABECALHO:fim]))
+        del buffer[:fim]
+    return quadros
+
+def enquadrar(resposta):
+    if isinstance(resposta, str):
+        resposta = resposta.encode("utf-8")
+    return f"{len(resposta):<{TAM_CABECALHO}}".encode("ascii") + resposta
+
+def processar_mensagem(sessao, mensagem):
+    try:
+        return _processar_mensagem(sessao, mensagem)
+    finally:
+        publicar_eventos()
+
+def _processar_mensagem(sessao, mensagem):
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(f"[RECEBIDO de {sessao['addr']}]: {mascarar(mensagem)}")
+    if mensagem.startswith("LOGIN") and "encaminhador" in sessao:
+        return encaminhar(sessao, mensagem, lambda: mensagem.split(" ", 2)[1])
+    if mensagem.startswith("LOGIN"):
+        try:
+            _, matr, senha = mensagem.split(" ", 2)
+            prof = login_professor(matr, senha)
+            if prof:
+                sessao["usuario"] = prof
+                return f"LOGIN_OK {prof.nome}"
+            return "LOGIN_FALHOU"
+        except:
+            return "ERRO_LOGIN"
+    resposta = processar_comandos(mensagem, sessao)
+    return resposta if isinstance(resposta, bytes) else str(resposta)
+
+def tratar_cliente(conn, addr, porta_escritor=None):
+    log.info(f"[CONEXÃO] Cliente conectado: {addr}")
+    envio_lock = threading.Lock()
+    def enviar(dados):
+        with envio_lock:
+            conn.sendall(dados)
+    sessao = {"addr": addr, "usuario": None, "ligar_assinatura": lambda a: entregar_em_thread(a, enviar)}
+    if porta_escritor:
+        sessao["encaminhador"] = Encaminhador(porta_escritor)
+    buffer = bytearray()
     while True:
         try:
-            dados = conn.recv(4096)
+            dados = conn.recv(TAM_LEITURA)
             if not dados:
-                print(f"[CONEXÃO] Cliente desconectado: {addr}")
+                log.info(f"[CONEXÃO] Cliente desconectado: {addr}")
                 break
-            mensagem = dados.decode().strip()
-            print(f"[RECEBIDO de {addr}]: {mensagem}")
-            if mensagem.startswith("LOGIN"):
-                try:
-                    _, matr, senha = mensagem.split(" ", 2)
-                    prof = login_professor(matr, senha)
-                    if prof:
-                        user_logado = prof
-                        resposta = f"LOGIN_OK {prof['nome']}"
-                    else:
-                        resposta = "LOGIN_FALHOU"
-                except:
-                    resposta = "ERRO_LOGIN"
-                conn.sendall(resposta.encode())
-                continue
-            if not user_logado:
-                conn.sendall("NECESSARIO_LOGIN".encode())
-                continue
-            resposta = processar_comandos(mensagem)
-            conn.sendall(str(resposta).encode())
+            buffer += dados
+            respostas = b"".join(enquadrar(processar_mensagem(sessao, q.decode("utf-8").strip()))
+                                 for q in extrair_quadros(buffer))
+            registrar_bytes(len(dados), len(respostas))
+            if respostas:
+                enviar(respostas)
+        except ErroProtocolo as e:
+            log.error(f"[ERRO] Protocolo inválido de {addr}: {e}")
+            break
         except ConnectionResetError:
-            print(f"[ERRO] Conexão perdida com {addr}")
+            log.error(f"[ERRO] Conexão perdida com {addr}")
             break
         except Exception as e:
-            print(f"[ERRO inesperado]: {e}")
+            log.error(f"[ERRO inesperado]: {e}")
             break
+    cancelar_assinatura(sessao)
+    if porta_escritor:
+        sessao["encaminhador"].fechar()
     conn.close()
 
-def iniciar_servidor():
+async def tratar_cliente_async(reader, writer, sessao, executor, timeout_ocioso):
+    addr = sessao["addr"]
+    log.info(f"[CONEXÃO] Cliente conectado: {addr}")
+    loop = asyncio.get_running_loop()
+    sessao["ligar_assinatura"] = lambda a: entregar_no_laco(a, writer, loop)
+    buffer = bytearray()
+    try:
+        while True:
+            try:
+                limite = None if sessao.get("assinatura") else timeout_ocioso
+                dados = await asyncio.wait_for(reader.read(TAM_LEITURA), limite)
+            except asyncio.TimeoutError:
+                log.info(f"[CONEXÃO] Cliente ocioso desconectado: {addr}")
+                break
+            if not dados:
+                log.info(f"[CONEXÃO] Cliente desconectado: {addr}")
+                break
+            buffer += dados
+            sessao["ocupado"] = True
+            respostas = []
+            for q in extrair_quadros(buffer):
+                resposta = await loop.run_in_executor(executor, processar_mensagem, sessao, q.decode("utf-8").strip())
+                respostas.append(enquadrar(resposta))
+            registrar_bytes(len(dados), sum(map(len, respostas)))
+            if respostas:
+                writer.write(b"".join(respostas))
+                await writer.drain()
+            sessao["ocupado"] = False
+    except ErroProtocolo as e:
+        log.error(f"[ERRO] Protocolo inválido de {addr}: {e}")
+    except (ConnectionResetError, BrokenPipeError):
+        log.error(f"[ERRO] Conexão perdida com {addr}")
+    except asyncio.CancelledError:
+        log.info(f"[CONEXÃO] Encerrando conexão com {addr}")
+    except Exception as e:
+        log.error(f"[ERRO inesperado]: {e}")
+    finally:
+        cancelar_assinatura(sessao)
+        writer.close()
+
+async def servir_async(porta, backlog, max_conexoes, timeout_ocioso, workers):
+    global vagas_login
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pim-worker")
+    vagas_login = threading.BoundedSemaphore(max(1, min(FILA_LOGIN, workers // 2)))
+    conexoes = {}
+    parar = asyncio.Event()
+
+    async def atender(reader, writer):
+        if len(conexoes) >= max_conexoes:
+            log.info(f"[CONEXÃO] Limite de {max_conexoes} conexões atingido, recusando {writer.get_extra_info('peername')}")
+            writer.write(enquadrar("❌ ERRO: Servidor lotado. Tente novamente mais tarde."))
+            writer.close()
+            return
+        sessao = {"addr": writer.get_extra_info("peername"), "usuario": None, "ocupado": False}
+        tarefa = asyncio.current_task()
+        conexoes[tarefa] = sessao
+        try:
+            await tratar_cliente_async(reader, writer, sessao, executor, timeout_ocioso)
+        finally:
+            conexoes.pop(tarefa, None)
+
+    servidor = await asyncio.start_server(atender, "0.0.0.0", porta, backlog=backlog)
+    for sinal in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sinal, parar.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    log.info(f"Servidor (asyncio) iniciado na porta {porta}. Aguardando conexões...")
+    try:
+        await parar.wait()
+    finally:
+        log.info("Encerrando servidor...")
+        servidor.close()
+        for tarefa, sessao in list(conexoes.items()):
+            if not sessao["ocupado"]:
+                tarefa.cancel()
+        if conexoes:
+            _, pendentes = await asyncio.wait(list(conexoes), timeout=TEMPO_ENCERRAMENTO)
+            for tarefa in pendentes:
+                tarefa.cancel()
+            await asyncio.gather(*pendentes, return_exceptions=True)
+        await loop.run_in_executor(None, executor.shutdown, True)
+        await loop.run_in_executor(None, encerrar_pool_pdf)
+        armazenamento.fechar()
+        log.info("Servidor encerrado.")
+
+def iniciar_servidor_async(porta=PORTA, backlog=BACKLOG, max_conexoes=MAX_CONEXOES,
+                           timeout_ocioso=TIMEOUT_OCIOSO, workers=WORKERS):
+    carregar_tudo()
+    try:
+        asyncio.run(servir_async(porta, backlog, max_conexoes, timeout_ocioso, workers))
+    except KeyboardInterrupt:
+        armazenamento.fechar()
+        log.info("Servidor encerrado.")
+
+def _interromper(sinal, quadro):
+    raise KeyboardInterrupt
+
+def iniciar_servidor(porta=PORTA, backlog=BACKLOG):
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _interromper)
     carregar_tudo()
     servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    servidor.bind(("0.0.0.0", 5050))
-    servidor.listen(5)
-    print("Servidor iniciado na porta 5050. Aguardando conexões...")
+    servidor.bind(("0.0.0.0", porta))
+    servidor.listen(backlog)
+    log.info(f"Servidor iniciado na porta {porta}. Aguardando conexões...")
+    try:
+        while True:
+            conn, addr = servidor.accept()
+            thread_cliente = threading.Thread(target=tratar_cliente, args=(conn, addr))
+            thread_cliente.start()
+    except KeyboardInterrupt:
+        log.info("Encerrando servidor...")
+    finally:
+        servidor.close()
+        armazenamento.fechar()
+
+def ler_quadro(conn):
+    cabecalho = _ler_exato(conn, TAM_CABECALHO)
+    if cabecalho is None:
+        return None
+    return _ler_exato(conn, int(cabecalho.decode("ascii")))
+
+def _ler_exato(conn, tamanho):
+    dados = bytearray(tamanho)
+    visao = memoryview(dados)
+    lidos = 0
+    while lidos < tamanho:
+        n = conn.recv_into(visao[lidos:])
+        if not n:
+            return None
+        lidos += n
+    return bytes(dados)
+
+class Encaminhador:
+    def __init__(self, porta):
+        self.porta = porta
+        self.conn = None
+
+    def enviar(self, mensagem):
+        if self.conn is None:
+            self.conn = socket.create_connection(("127.0.0.1", self.porta))
+            self.conn.sendall(enquadrar(segredo_interno))
+        self.conn.sendall(enquadrar(mensagem))
+        quadro = ler_quadro(self.conn)
+        if quadro is None:
+            self.fechar()
+            raise ConnectionError("o processo de escrita fechou a conexão")
+        seq, _, resposta = quadro.partition(b" ")
+        aguardar_replicacao(int(seq))
+        return resposta.decode("utf-8")
+
+    def fechar(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+def encaminhar(sessao, mensagem, matricula_login):
+    try:
+        resposta = sessao["encaminhador"].enviar(mensagem)
+    except OSError as e:
+        log.error(f"[ERRO] Falha ao encaminhar comando ao processo de escrita: {e}")
+        return "❌ ERRO: Processo de escrita indisponível. Tente novamente."
+    if resposta.startswith(("SUCESSO_LOGIN:", "LOGIN_OK")):
+        with transacao(le=("professores",)):
+            sessao["usuario"] = professores.buscar_por("matricula", matricula_login())
+    elif resposta == SESSAO_ENCERRADA:
+        sair(sessao)
+    return resposta
+
+seq_aplicado = 0
+replicacao = threading.Condition()
+segredo_interno = None
+
+def aguardar_replicacao(seq):
+    with replicacao:
+        if not replicacao.wait_for(lambda: seq_aplicado >= seq, ESPERA_REPLICACAO):
+            log.warning(f"AVISO: Réplica atrasada: esperando a publicação {seq}, aplicada até {seq_aplicado}.")
+
+def acompanhar_escritor(canal):
+    global seq_aplicado
+    while True:
+        try:
+            quadro = ler_quadro(canal)
+        except OSError:
+            quadro = None
+        if quadro is None:
+            log.error("[LEITOR] Conexão com o processo de escrita perdida. Encerrando.")
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
+        seq, mudancas = pickle.loads(quadro)
+        aplicar_mudancas(mudancas)
+        publicar_eventos()
+        with replicacao:
+            seq_aplicado = max(seq_aplicado, seq)
+            replicacao.notify_all()
+
+def tratar_interno(conn, addr):
+    sessao = {"addr": addr, "usuario": None}
+    autenticado = False
+    buffer = bytearray()
+    try:
+        while True:
+            dados = conn.recv(TAM_LEITURA)
+            if not dados:
+                break
+            buffer += dados
+            for q in extrair_quadros(buffer):
+                mensagem = q.decode("utf-8").strip()
+                if not autenticado:
+                    if not hmac.compare_digest(mensagem.encode("utf-8"), segredo_interno.encode("ascii")):
+                        log.warning(f"AVISO: Conexão interna de {addr} recusada: segredo inválido.")
+                        return
+                    autenticado = True
+                    continue
+                if mensagem == "FEED":
+                    alimentar_leitor(conn, addr)
+                    return
+                eventos_locais.seq = 0
+                resposta = processar_mensagem(sessao, mensagem)
+                if isinstance(resposta, str):
+                    resposta = resposta.encode("utf-8")
+                conn.sendall(enquadrar(f"{eventos_locais.seq} ".encode("ascii") + resposta))
+    except (OSError, ErroProtocolo) as e:
+        log.error(f"[ERRO] Conexão interna {addr}: {e}")
+    finally:
+        conn.close()
+
+def servir_interno(servidor):
     while True:
-        conn, addr = servidor.accept()
-        thread_cliente = threading.Thread(target=tratar_cliente, args=(conn, addr))
-        thread_cliente.start()
+        try:
+            conn, addr = servidor.accept()
+        except OSError:
+            break
+        threading.Thread(target=tratar_interno, args=(conn, addr), daemon=True).start()
+
+def servir_leitor(porta, backlog, porta_escritor, segredo, nivel_log):
+    global seq_aplicado, segredo_interno
+    segredo_interno = segredo
+    configurar_log(nivel_log)
+    signal.signal(signal.SIGTERM, _interromper)
+    inicio = time.perf_counter()
+    canal = socket.create_connection(("127.0.0.1", porta_escritor))
+    canal.sendall(enquadrar(segredo_interno) + enquadrar("FEED"))
+    quadro = ler_quadro(canal)
+    if quadro is None:
+        log.error("[LEITOR] O processo de escrita não enviou o estado inicial.")
+        return
+    gc.disable()
+    try:
+        seq_aplicado, estado = pickle.loads(quadro)
+        restaurar_estado(estado)
+    finally:
+        gc.enable()
+    del quadro, estado
+    gc.freeze()
+    threading.Thread(target=acompanhar_escritor, args=(canal,), name="replicacao", daemon=True).start()
+    servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    servidor.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    servidor.bind(("0.0.0.0", porta))
+    servidor.listen(backlog)
+    log.info(f"Leitor {os.getpid()} pronto em {time.perf_counter() - inicio:.2f}s na porta {porta}.")
+    try:
+        while True:
+            conn, addr = servidor.accept()
+            threading.Thread(target=tratar_cliente, args=(conn, addr, porta_escritor), daemon=True).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.close()
+        canal.close()
+        encerrar_pool_pdf()
+
+def iniciar_servidor_multiprocesso(porta=PORTA, backlog=BACKLOG, leitores=LEITORES, nivel_log="info"):
+    global segredo_interno
+    if not hasattr(socket, "SO_REUSEPORT"):
+        log.warning("AVISO: --leitores precisa de SO_REUSEPORT (Linux/BSD). Iniciando em um único processo.")
+        return iniciar_servidor(porta, backlog)
+    signal.signal(signal.SIGTERM, _interromper)
+    carregar_tudo()
+    segredo_interno = os.urandom(32).hex()
+    interno = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    interno.bind(("127.0.0.1", 0))
+    interno.listen(backlog)
+    porta_interna = interno.getsockname()[1]
+    threading.Thread(target=servir_interno, args=(interno,), name="escritor", daemon=True).start()
+    contexto = multiprocessing.get_context("spawn")
+    processos = [contexto.Process(target=servir_leitor, args=(porta, backlog, porta_interna, segredo_interno, nivel_log), name=f"pim-leitor-{i}")
+                 for i in range(1, leitores + 1)]
+    for processo in processos:
+        processo.start()
+    log.info(f"Servidor iniciado na porta {porta} com {leitores} processo(s) leitor(es); escritor em 127.0.0.1:{porta_interna}.")
+    try:
+        vivos = list(processos)
+        while vivos:
+            prontos = multiprocessing.connection.wait([p.sentinel for p in vivos])
+            for processo in [p for p in vivos if p.sentinel in prontos]:
+                log.warning(f"AVISO: {processo.name} terminou (código {processo.exitcode}).")
+                vivos.remove(processo)
+    except KeyboardInterrupt:
+        log.info("Encerrando servidor...")
+    finally:
+        for processo in processos:
+            if processo.is_alive():
+                processo.terminate()
+        for processo in processos:
+            processo.join(TEMPO_ENCERRAMENTO)
+        interno.close()
+        armazenamento.fechar()
+
+def main():
+    global cadastro_aberto
+    parser = argparse.ArgumentParser(description="Servidor do sistema escolar PIM.")
+    parser.add_argument("--modo", choices=("threads", "async"), default="threads",
+                        help="threads: uma thread por conexão; async: laço asyncio com pool de workers")
+    parser.add_argument("--porta", type=int, default=PORTA)
+    parser.add_argument("--backlog", type=int, default=BACKLOG)
+    parser.add_argument("--max-conexoes", type=int, default=MAX_CONEXOES, help="somente no modo async")
+    parser.add_argument("--timeout-ocioso", type=float, default=TIMEOUT_OCIOSO, help="segundos; somente no modo async; não vale para sessões com assinatura")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="threads que executam comandos no modo async")
+    parser.add_argument("--leitores", type=int, default=LEITORES,
+                        help="processos que atendem a porta juntos (SO_REUSEPORT) e encaminham as gravações ao processo principal; "
+                             "cada um usa o modo threads")
+    parser.add_argument("--armazenamento", choices=("json", "sqlite"), default="json",
+                        help="json: arquivos .json com journal; sqlite: banco embutido com gravação por registro "
+                             "(nos dois casos os dados ficam todos em memória)")
+    parser.add_argument("--banco", default=ARQ_BANCO, help="arquivo do banco SQLite")
+    parser.add_argument("--snapshot", action="store_true",
+                        help=f"json: grava {ARQ_SNAPSHOT} ao encerrar e o usa na próxima partida se os .json não mudaram")
+    parser.add_argument("--migrar", action="store_true",
+                        help="copia os arquivos .json (e o journal) para o banco SQLite e sai")
+    parser.add_argument("--cadastro-aberto", action="store_true",
+                        help="permite cadastrar_professor sem login (por exemplo, para criar o primeiro professor)")
+    parser.add_argument("--log", choices=("debug", "info", "warning", "error"), default="info",
+                        help="debug também registra cada mensagem recebida (com senhas mascaradas)")
+    args = parser.parse_args()
+    configurar_log(args.log)
+    cadastro_aberto = args.cadastro_aberto
+    if args.migrar:
+        migrar_para_sqlite(args.banco)
+        return
+    configurar_armazenamento(args.armazenamento, args.banco, args.snapshot)
+    if args.leitores > 0:
+        iniciar_servidor_multiprocesso(args.porta, args.backlog, args.leitores, args.log)
+    elif args.modo == "async":
+        iniciar_servidor_async(args.porta, args.backlog, args.max_conexoes, args.timeout_ocioso, args.workers)
+    else:
+        iniciar_servidor(args.porta, args.backlog)
 
 if __name__ == "__main__":
-    iniciar_servidor()
+    main()